@@ -1,9 +1,15 @@
 import shutil
 import shlex
 import subprocess
+import threading
+import time
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional, Sequence
-from .android import DeviceInfo
+from typing import TYPE_CHECKING, Callable, Dict, Generator, List, Optional, Sequence, Tuple, Union
+from .android import DeviceInfo, parse_getprop_output
+
+if TYPE_CHECKING:
+    from .async_adb import AsyncAdbClient, AsyncCommandRunner
+    from .capabilities import CapabilityCache
 
 @dataclass
 class CommandResult:
@@ -25,6 +31,21 @@ class CommandRunner:
     ) -> CommandResult:
         raise NotImplementedError
 
+    def stream_lines(
+        self,
+        args: Sequence[str],
+        timeout: Optional[float] = None,
+        input_data: Optional[str] = None,
+    ) -> Generator[str, None, CommandResult]:
+        """Yield stdout lines (without line endings), then return the result.
+
+        Runners without a pipe to read from buffer the whole output first.
+        Closing the generator early cancels the command where possible.
+        """
+        result = self.run(args, input_data=input_data, timeout=timeout)
+        yield from result.stdout.splitlines()
+        return result
+
     def which(self, name: str) -> Optional[str]:
         raise NotImplementedError
 
@@ -57,12 +78,91 @@ class SubprocessRunner(CommandRunner):
                 result=result,
             ) from exc
 
+    def stream_lines(
+        self,
+        args: Sequence[str],
+        timeout: Optional[float] = None,
+        input_data: Optional[str] = None,
+    ) -> Generator[str, None, CommandResult]:
+        # The returned result carries no stdout; it was consumed line by line.
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+        assert process.stdout is not None and process.stderr is not None
+        stderr_chunks: List[str] = []
+        stderr_reader = threading.Thread(
+            target=lambda: stderr_chunks.append(process.stderr.read()),  # type: ignore[union-attr]
+            daemon=True,
+        )
+        stderr_reader.start()
+        if input_data is not None:
+            # Written from a thread so a long script cannot block on a full
+            # stdin pipe while its output is unread.
+            threading.Thread(target=self._write_stdin, args=(process, input_data), daemon=True).start()
+        timed_out = threading.Event()
+
+        def expire() -> None:
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            for line in process.stdout:
+                yield line.rstrip("\r\n")
+            returncode = process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            stderr_reader.join()
+            process.stderr.close()
+
+        result = CommandResult(returncode=returncode, stdout="", stderr="".join(stderr_chunks))
+        if timed_out.is_set():
+            result.returncode = -1
+            raise CommandError(
+                f"Command timed out after {timeout}s: {' '.join(args)}",
+                result=result,
+            )
+        return result
+
+    @staticmethod
+    def _write_stdin(process: "subprocess.Popen[str]", input_data: str) -> None:
+        assert process.stdin is not None
+        try:
+            process.stdin.write(input_data)
+            process.stdin.close()
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+
     def which(self, name: str) -> Optional[str]:
         return shutil.which(name)
 
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+BOOT_ID_MARKER = "__ABO_BOOT_ID__"
+DEVICE_PROPERTY_KEYS = (
+    "ro.product.brand",
+    "ro.product.model",
+    "ro.build.version.release",
+    "ro.build.version.sdk",
+    "ro.build.fingerprint",
+)
+
 class AdbClient:
     DEFAULT_TIMEOUT_SECONDS = 30
     LONG_TIMEOUT_SECONDS = 300
+    CALL_SECONDS_WEIGHT = 0.2
 
     def __init__(
         self,
@@ -70,19 +170,97 @@ class AdbClient:
         serial: Optional[str] = None,
         dry_run: bool = False,
         output: Callable[[str], None] = print,
+        async_runner: Optional["AsyncCommandRunner"] = None,
     ) -> None:
         self.runner = runner
         self.serial = serial
         self.dry_run = dry_run
         self.output = output
+        self.async_runner = async_runner
+        # serial -> (boot id, parsed getprop dump); only filled from a complete dump.
+        self._device_properties: Dict[str, Tuple[str, Dict[str, str]]] = {}
+        self.capabilities: Optional["CapabilityCache"] = None
+        # Moving average of `run_adb` wall time; None until the first call.
+        self.call_seconds: Optional[float] = None
+
+    @property
+    def aio(self) -> "AsyncAdbClient":
+        from .async_adb import AsyncAdbClient, AsyncSubprocessRunner, SyncRunnerAdapter
+        runner = self.async_runner
+        if runner is None:
+            # Plain adb subprocesses run on the event loop; other runners
+            # (sessions, sockets, wrappers, fakes) run on worker threads.
+            if type(self.runner) is SubprocessRunner:
+                runner = AsyncSubprocessRunner()
+            else:
+                runner = SyncRunnerAdapter(self.runner)
+        return AsyncAdbClient(self, runner)
+
+    def shell_text_many(
+        self,
+        commands: Sequence[Sequence[object]],
+        *,
+        check: bool = True,
+        timeout: Optional[float] = None,
+    ) -> List[Union[str, BaseException]]:
+        # Independent reads run concurrently; failures are returned in place so
+        # callers can keep their per-command error handling.
+        from .async_adb import run_sync
+        return run_sync(self.aio.shell_text_many(commands, check=check, timeout=timeout))
+
+    def _device_properties_key(self) -> str:
+        return self.serial or ""
+
+    def get_device_properties(self) -> Optional[Dict[str, str]]:
+        """Return the device's `getprop` dump, read once per serial and boot.
+
+        Returns None when the dump is unusable (missing identity keys), so
+        callers fall back to per-key `getprop` reads. Timeouts propagate.
+        """
+        key = self._device_properties_key()
+        cached = self._device_properties.get(key)
+        if cached is not None:
+            return cached[1]
+
+        result = self.shell(
+            ["getprop", ";", "echo", BOOT_ID_MARKER, ";", "cat", BOOT_ID_PATH],
+            check=False,
+        )
+        dump, _, boot_id = result.stdout.partition(BOOT_ID_MARKER)
+        properties = parse_getprop_output(dump)
+        if not all(name in properties for name in DEVICE_PROPERTY_KEYS):
+            return None
+        self._device_properties[key] = (boot_id.strip(), properties)
+        return properties
+
+    def invalidate_device_properties(self) -> None:
+        self._device_properties.pop(self._device_properties_key(), None)
+
+    def revalidate_device_properties(self) -> None:
+        """Drop the cached dump if the device rebooted since it was read."""
+        cached = self._device_properties.get(self._device_properties_key())
+        if cached is None:
+            return
+        try:
+            boot_id = self.shell_text(["cat", BOOT_ID_PATH], check=False)
+        except CommandError:
+            boot_id = ""
+        if not cached[0] or boot_id != cached[0]:
+            self.invalidate_device_properties()
+
+    def _read_device_properties(self, check: bool) -> Dict[str, str]:
+        properties = self.get_device_properties()
+        if properties is not None:
+            return {name: properties[name].strip() for name in DEVICE_PROPERTY_KEYS}
+        return {
+            name: self.shell_text(["getprop", name], check=check)
+            for name in DEVICE_PROPERTY_KEYS
+        }
 
     def get_device_info_struct(self) -> DeviceInfo:
         serial = self.serial or "unknown-device"
-        brand = self.shell_text(["getprop", "ro.product.brand"], check=False)
-        model = self.shell_text(["getprop", "ro.product.model"], check=False)
-        release = self.shell_text(["getprop", "ro.build.version.release"], check=False)
-        sdk_str = self.shell_text(["getprop", "ro.build.version.sdk"], check=False)
-        fingerprint = self.shell_text(["getprop", "ro.build.fingerprint"], check=False)
+        properties = self._read_device_properties(check=False)
+        sdk_str = properties["ro.build.version.sdk"]
 
         try:
             sdk_int = int(sdk_str)
@@ -91,20 +269,17 @@ class AdbClient:
 
         return DeviceInfo(
             serial=serial,
-            brand=brand,
-            model=model,
-            android_release=release,
+            brand=properties["ro.product.brand"],
+            model=properties["ro.product.model"],
+            android_release=properties["ro.build.version.release"],
             sdk_int=sdk_int,
-            fingerprint=fingerprint,
+            fingerprint=properties["ro.build.fingerprint"],
         )
 
     def get_device_metadata(self) -> Dict[str, str]:
         serial = self.serial or "unknown-device"
-        brand = self.shell_text(["getprop", "ro.product.brand"], check=True)
-        model = self.shell_text(["getprop", "ro.product.model"], check=True)
-        release = self.shell_text(["getprop", "ro.build.version.release"], check=True)
-        sdk_str = self.shell_text(["getprop", "ro.build.version.sdk"], check=True)
-        fingerprint = self.shell_text(["getprop", "ro.build.fingerprint"], check=True)
+        properties = self._read_device_properties(check=True)
+        sdk_str = properties["ro.build.version.sdk"]
 
         try:
             int(sdk_str)
@@ -113,11 +288,11 @@ class AdbClient:
 
         return {
             "serial": serial,
-            "brand": brand,
-            "model": model,
-            "android_release": release,
+            "brand": properties["ro.product.brand"],
+            "model": properties["ro.product.model"],
+            "android_release": properties["ro.build.version.release"],
             "sdk": sdk_str,
-            "fingerprint": fingerprint,
+            "fingerprint": properties["ro.build.fingerprint"],
         }
 
     def get_device_metadata_with_fallback(self) -> Dict[str, str]:
@@ -136,14 +311,53 @@ class AdbClient:
             "fingerprint": "",
         }
 
+    def _cached_fingerprint(self) -> str:
+        try:
+            properties = self.get_device_properties()
+        except CommandError:
+            return ""
+        if properties is None:
+            return ""
+        return properties.get("ro.build.fingerprint", "").strip()
+
+    def _capability(self, name: str, probe: Callable[[], bool]) -> bool:
+        cache = self.capabilities
+        if cache is None:
+            return probe()
+        fingerprint = self._cached_fingerprint()
+        if not fingerprint:
+            return probe()
+        cached = cache.get(fingerprint, name)
+        if cached is not None:
+            return cached
+        value = probe()
+        if not self.dry_run:
+            cache.put(fingerprint, name, value)
+        return value
+
     def supports_device_config(self) -> bool:
+        return self._capability("device_config", self._probe_device_config)
+
+    def supports_appops(self) -> bool:
+        return self._capability("appops", self._probe_appops)
+
+    def supports_standby_bucket(self) -> bool:
+        return self._capability("standby_bucket", self._probe_standby_bucket)
+
+    def supports_settings_namespace(self, namespace: str) -> bool:
+        return self._capability(
+            f"settings:{namespace}",
+            lambda: self._probe_settings_namespace(namespace),
+        )
+
+    def _probe_device_config(self) -> bool:
         try:
             result = self.shell(["device_config", "list"], check=False)
             return result.returncode == 0
         except Exception:
             return False
 
-    def supports_appops(self) -> bool:
+    def _probe_appops(self) -> bool:
         try:
             # Some Android/Samsung builds do not support `cmd appops help`,
             # but still support the actual get/set appops commands.
@@ -179,7 +393,7 @@ class AdbClient:
         except Exception:
             return False
 
-    def supports_standby_bucket(self) -> bool:
+    def _probe_standby_bucket(self) -> bool:
         try:
             info = self.get_device_info_struct()
             if info.sdk_int < 28:
@@ -198,7 +412,7 @@ class AdbClient:
         except Exception:
             return False
 
-    def supports_settings_namespace(self, namespace: str) -> bool:
+    def _probe_settings_namespace(self, namespace: str) -> bool:
         try:
             result = self.shell(["settings", "list", namespace], check=False)
             return result.returncode == 0
@@ -224,15 +438,12 @@ class AdbClient:
     def _format(self, args: Sequence[str]) -> str:
         return " ".join(shlex.quote(arg) for arg in args)
 
-    def run_adb(
+    def _prepare_adb_command(
         self,
         args: Sequence[object],
-        *,
-        mutate: bool = False,
-        check: bool = True,
-        input_data: Optional[str] = None,
-        timeout: Optional[float] = None,
-    ) -> CommandResult:
+        mutate: bool,
+        input_data: Optional[str],
+    ) -> Tuple[List[str], Optional[CommandResult]]:
         if mutate and not self.dry_run:
             self.require_bound_device_for_mutation()
 
@@ -241,12 +452,12 @@ class AdbClient:
             self.output(f"[dry-run] {self._format(command)}")
             if input_data:
                 self.output(f"[dry-run-input]\n{input_data}")
-            return CommandResult(returncode=0, stdout="", stderr="")
-
-        if timeout is None:
-            timeout = self.DEFAULT_TIMEOUT_SECONDS
+            return command, CommandResult(returncode=0, stdout="", stderr="")
+        return command, None
 
-        result = self.runner.run(command, input_data=input_data, timeout=timeout)
+    def _check_adb_result(
+        self, command: List[str], result: CommandResult, check: bool
+    ) -> CommandResult:
         if check and result.returncode != 0:
             stderr = result.stderr.strip()
             stdout = result.stdout.strip()
@@ -254,6 +465,43 @@ class AdbClient:
             raise CommandError(f"{self._format(command)} failed: {details}", result=result)
         return result
 
+    def _check_local_result(
+        self, args: List[str], result: CommandResult, check: bool
+    ) -> CommandResult:
+        if check and result.returncode != 0:
+            details = result.stderr.strip() or result.stdout.strip() or "unknown error"
+            raise CommandError(
+                f"{self._format(args)} failed: {details}", result=result
+            )
+        return result
+
+    def run_adb(
+        self,
+        args: Sequence[object],
+        *,
+        mutate: bool = False,
+        check: bool = True,
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        command, dry_run_result = self._prepare_adb_command(args, mutate, input_data)
+        if dry_run_result is not None:
+            return dry_run_result
+
+        if timeout is None:
+            timeout = self.DEFAULT_TIMEOUT_SECONDS
+
+        started = time.perf_counter()
+        result = self.runner.run(command, input_data=input_data, timeout=timeout)
+        self._observe_call(time.perf_counter() - started)
+        return self._check_adb_result(command, result, check)
+
+    def _observe_call(self, seconds: float) -> None:
+        if self.call_seconds is None:
+            self.call_seconds = seconds
+        else:
+            self.call_seconds += self.CALL_SECONDS_WEIGHT * (seconds - self.call_seconds)
+
     def shell(
         self,
         args: Sequence[object],
@@ -284,6 +532,34 @@ class AdbClient:
             args, mutate=mutate, check=check, input_data=input_data, timeout=timeout
         ).stdout.strip()
 
+    def stream_lines(
+        self,
+        args: Sequence[object],
+        *,
+        mutate: bool = False,
+        check: bool = True,
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Generator[str, None, CommandResult]:
+        """Yield the lines of an `adb shell` command as they arrive.
+
+        For multi-megabyte dumps: parsing overlaps the transfer and the output
+        is never held in memory at once. A failed exit raises CommandError
+        after the last line when `check` is set; closing the generator early
+        stops the command. In dry-run mode a mutating command yields nothing.
+        """
+        command, dry_run_result = self._prepare_adb_command(["shell", *args], mutate, input_data)
+        if dry_run_result is not None:
+            return dry_run_result
+        if timeout is None:
+            timeout = self.DEFAULT_TIMEOUT_SECONDS
+        if input_data is None:
+            stream = self.runner.stream_lines(command, timeout=timeout)
+        else:
+            stream = self.runner.stream_lines(command, timeout=timeout, input_data=input_data)
+        result = yield from stream
+        return self._check_adb_result(command, result, check)
+
     def local_text(
         self,
         args: Sequence[object],
@@ -299,9 +575,4 @@ class AdbClient:
         result = self.runner.run(
             str_args, input_data=input_data, timeout=timeout
         )
-        if check and result.returncode != 0:
-            details = result.stderr.strip() or result.stdout.strip() or "unknown error"
-            raise CommandError(
-                f"{self._format(str_args)} failed: {details}", result=result
-            )
-        return result.stdout.strip()
+        return self._check_local_result(str_args, result, check).stdout.strip()
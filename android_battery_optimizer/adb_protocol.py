@@ -0,0 +1,320 @@
+import codecs
+import os
+import socket
+import struct
+import time
+from contextlib import contextmanager
+from typing import Generator, Iterator, List, Optional, Sequence, Tuple, Union
+from .adb import CommandError, CommandResult, CommandRunner, SubprocessRunner
+
+DEFAULT_ADB_SERVER_HOST = "127.0.0.1"
+DEFAULT_ADB_SERVER_PORT = 5037
+
+# adbd shell protocol (v2) packet ids.
+SHELL_ID_STDIN = 0
+SHELL_ID_STDOUT = 1
+SHELL_ID_STDERR = 2
+SHELL_ID_EXIT = 3
+SHELL_ID_CLOSE_STDIN = 4
+
+SHELL_PACKET_HEADER = struct.Struct("<BI")
+STDIN_CHUNK_SIZE = 32 * 1024
+
+class AdbProtocolError(RuntimeError):
+    pass
+
+class AdbServerUnavailable(AdbProtocolError):
+    pass
+
+class AdbServiceRefused(AdbServerUnavailable):
+    """The device refused a service, e.g. `shell,v2:` without the shell_v2 feature."""
+
+def encode_request(payload: str) -> bytes:
+    data = payload.encode("utf-8")
+    return f"{len(data):04x}".encode("ascii") + data
+
+def encode_shell_packet(packet_id: int, data: bytes = b"") -> bytes:
+    return SHELL_PACKET_HEADER.pack(packet_id, len(data)) + data
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket, deadline: Optional[float]) -> None:
+        self.sock = sock
+        self.deadline = deadline
+
+    def _apply_deadline(self) -> None:
+        if self.deadline is None:
+            self.sock.settimeout(None)
+            return
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("deadline exceeded")
+        self.sock.settimeout(remaining)
+
+    def send(self, data: bytes) -> None:
+        self._apply_deadline()
+        self.sock.sendall(data)
+
+    def read_exact(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            self._apply_deadline()
+            chunk = self.sock.recv(size)
+            if not chunk:
+                raise AdbProtocolError("adb server closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def read_status(self) -> None:
+        status = self.read_exact(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise CommandError(self.read_length_prefixed().decode("utf-8", errors="replace"))
+        raise AdbProtocolError(f"unexpected adb server status: {status!r}")
+
+    def read_length_prefixed(self) -> bytes:
+        length = int(self.read_exact(4).decode("ascii"), 16)
+        return self.read_exact(length)
+
+    def request(self, payload: str) -> None:
+        self.send(encode_request(payload))
+        self.read_status()
+
+
+class AdbServerRunner(CommandRunner):
+    """Talks to the local adb server over its smart-socket protocol.
+
+    `adb [-s SERIAL] shell ...` becomes `host:transport:<serial>` followed by a
+    `shell,v2:` service with separate stdout/stderr/exit packets, and `adb devices`
+    becomes `host:devices`. Anything else, an unreachable server or a device that
+    refuses `shell,v2:` falls back to the delegate runner; a connection that drops
+    mid-command raises CommandError.
+    """
+
+    def __init__(
+        self,
+        delegate: Optional[CommandRunner] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+    ) -> None:
+        self.delegate = delegate or SubprocessRunner()
+        self.host = host or DEFAULT_ADB_SERVER_HOST
+        if port is None:
+            port = int(os.environ.get("ANDROID_ADB_SERVER_PORT", DEFAULT_ADB_SERVER_PORT))
+        self.port = port
+
+    def _connect(self, deadline: Optional[float]) -> _Connection:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0.001)
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        except OSError as exc:
+            raise AdbServerUnavailable(f"adb server not reachable: {exc}") from exc
+        return _Connection(sock, deadline)
+
+    @staticmethod
+    def _parse_args(args: Sequence[str]) -> Optional[Tuple[str, Optional[str], List[str]]]:
+        args = list(args)
+        if not args or args[0] != "adb":
+            return None
+        serial: Optional[str] = None
+        rest = args[1:]
+        if len(rest) >= 2 and rest[0] == "-s":
+            serial = rest[1]
+            rest = rest[2:]
+        if rest == ["devices"] and serial is None:
+            return "devices", None, []
+        if rest and rest[0] == "shell":
+            return "shell", serial, rest[1:]
+        return None
+
+    def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        parsed = self._parse_args(args)
+        if parsed is None:
+            return self.delegate.run(args, input_data=input_data, timeout=timeout)
+        kind, serial, shell_args = parsed
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            with self._command_errors(args, timeout):
+                if kind == "devices":
+                    return self._devices(deadline)
+                return self._shell(serial, shell_args, input_data, deadline)
+        except AdbServerUnavailable:
+            return self.delegate.run(args, input_data=input_data, timeout=timeout)
+
+    def stream_lines(
+        self,
+        args: Sequence[str],
+        timeout: Optional[float] = None,
+        input_data: Optional[str] = None,
+    ) -> Generator[str, None, CommandResult]:
+        # Like SubprocessRunner, the returned result carries no stdout.
+        parsed = self._parse_args(args)
+        opened: Union[_Connection, CommandResult, None] = None
+        if parsed is not None and parsed[0] == "shell":
+            _, serial, shell_args = parsed
+            deadline = None if timeout is None else time.monotonic() + timeout
+            try:
+                with self._command_errors(args, timeout):
+                    opened = self._open_shell(serial, shell_args, input_data, deadline)
+            except AdbServerUnavailable:
+                pass
+        if opened is None:
+            if input_data is None:
+                return (yield from self.delegate.stream_lines(args, timeout=timeout))
+            return (yield from self.delegate.stream_lines(args, timeout=timeout, input_data=input_data))
+        if isinstance(opened, CommandResult):
+            return opened
+
+        conn = opened
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        stderr = bytearray()
+        try:
+            with self._command_errors(args, timeout):
+                packets = self._read_shell(conn)
+                while True:
+                    try:
+                        packet_id, payload = next(packets)
+                    except StopIteration as stop:
+                        returncode = stop.value
+                        break
+                    if packet_id == SHELL_ID_STDERR:
+                        stderr.extend(payload)
+                        continue
+                    *lines, pending = (pending + decoder.decode(payload)).split("\n")
+                    for line in lines:
+                        yield line.rstrip("\r")
+        finally:
+            conn.sock.close()
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending.rstrip("\r")
+        return CommandResult(returncode=returncode, stdout="", stderr=stderr.decode("utf-8", errors="replace"))
+
+    @staticmethod
+    @contextmanager
+    def _command_errors(args: Sequence[str], timeout: Optional[float]) -> Iterator[None]:
+        try:
+            yield
+        except AdbServerUnavailable:
+            raise
+        except socket.timeout as exc:
+            raise CommandError(
+                f"Command timed out after {timeout}s: {' '.join(args)}",
+                result=CommandResult(returncode=-1, stdout="", stderr=""),
+            ) from exc
+        except (AdbProtocolError, OSError) as exc:
+            # A dropped or garbled connection mid-command.
+            raise CommandError(
+                f"adb server connection failed: {exc}: {' '.join(args)}",
+                result=CommandResult(returncode=255, stdout="", stderr=f"adb: {exc}\n"),
+            ) from exc
+
+    def _devices(self, deadline: Optional[float]) -> CommandResult:
+        conn = self._connect(deadline)
+        try:
+            conn.request("host:devices")
+            payload = conn.read_length_prefixed().decode("utf-8", errors="replace")
+        finally:
+            conn.sock.close()
+        return CommandResult(
+            returncode=0,
+            stdout=f"List of devices attached\n{payload}\n",
+            stderr="",
+        )
+
+    def _open_shell(
+        self,
+        serial: Optional[str],
+        shell_args: List[str],
+        input_data: Optional[str],
+        deadline: Optional[float],
+    ) -> Union[_Connection, CommandResult]:
+        """Start a shell,v2 command and send its stdin.
+
+        Returns the connection to read its packets from, or the result of a
+        transport the server refused.
+        """
+        conn = self._connect(deadline)
+        try:
+            try:
+                conn.request(f"host:transport:{serial}" if serial else "host:transport-any")
+            except CommandError as exc:
+                conn.sock.close()
+                return CommandResult(returncode=1, stdout="", stderr=f"adb: {exc}\n")
+            # Like the adb binary, join arguments with spaces and let the
+            # device shell parse them. An empty command would default to a
+            # PTY, so ask for a raw shell explicitly in that case.
+            command = " ".join(shell_args)
+            try:
+                conn.request(f"shell,v2:{command}" if command else "shell,v2,raw:")
+            except CommandError as exc:
+                # Devices without shell_v2 refuse the service; the adb binary
+                # falls back to the legacy shell for them.
+                raise AdbServiceRefused(str(exc)) from exc
+
+            if input_data:
+                data = input_data.encode("utf-8")
+                for offset in range(0, len(data), STDIN_CHUNK_SIZE):
+                    conn.send(encode_shell_packet(SHELL_ID_STDIN, data[offset:offset + STDIN_CHUNK_SIZE]))
+            conn.send(encode_shell_packet(SHELL_ID_CLOSE_STDIN))
+        except BaseException:
+            conn.sock.close()
+            raise
+        return conn
+
+    @staticmethod
+    def _read_shell(conn: _Connection) -> Generator[Tuple[int, bytes], None, int]:
+        """Yield (packet id, payload) of stdout and stderr packets; return the exit status."""
+        while True:
+            try:
+                header = conn.read_exact(SHELL_PACKET_HEADER.size)
+            except AdbProtocolError:
+                # The transport dropped before adbd reported an exit status.
+                return 255
+            packet_id, length = SHELL_PACKET_HEADER.unpack(header)
+            payload = conn.read_exact(length) if length else b""
+            if packet_id in (SHELL_ID_STDOUT, SHELL_ID_STDERR):
+                yield packet_id, payload
+            elif packet_id == SHELL_ID_EXIT:
+                return payload[0] if payload else 0
+
+    def _shell(
+        self,
+        serial: Optional[str],
+        shell_args: List[str],
+        input_data: Optional[str],
+        deadline: Optional[float],
+    ) -> CommandResult:
+        opened = self._open_shell(serial, shell_args, input_data, deadline)
+        if isinstance(opened, CommandResult):
+            return opened
+        stdout = bytearray()
+        stderr = bytearray()
+        packets = self._read_shell(opened)
+        try:
+            while True:
+                try:
+                    packet_id, payload = next(packets)
+                except StopIteration as stop:
+                    returncode = stop.value
+                    break
+                (stdout if packet_id == SHELL_ID_STDOUT else stderr).extend(payload)
+        finally:
+            opened.sock.close()
+        return CommandResult(
+            returncode=returncode,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+        )
+
+    def which(self, name: str) -> Optional[str]:
+        return self.delegate.which(name)
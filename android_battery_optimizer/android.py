@@ -2,6 +2,8 @@ import re
 from dataclasses import dataclass
 from typing import Dict, List, Sequence
 
+GETPROP_LINE_RE = re.compile(r"^\[([^\]]+)\]: \[(.*)$")
+
 @dataclass
 class DeviceInfo:
     serial: str
@@ -22,6 +24,35 @@ def parse_adb_devices(output: str) -> List[Dict[str, str]]:
             devices.append({"serial": parts[0], "status": parts[1]})
     return devices
 
+def parse_getprop_output(output: str) -> Dict[str, str]:
+    """Parse `getprop` dump lines of the form `[key]: [value]`.
+
+    Values may span several lines; they end at the first line closing with `]`.
+    """
+    properties: Dict[str, str] = {}
+    pending_key = None
+    pending_lines: List[str] = []
+    for line in output.splitlines():
+        line = line.rstrip("\r")
+        if pending_key is not None:
+            if line.endswith("]"):
+                pending_lines.append(line[:-1])
+                properties[pending_key] = "\n".join(pending_lines)
+                pending_key = None
+            else:
+                pending_lines.append(line)
+            continue
+        match = GETPROP_LINE_RE.match(line)
+        if not match:
+            continue
+        key, rest = match.group(1), match.group(2)
+        if rest.endswith("]"):
+            properties[key] = rest[:-1]
+        else:
+            pending_key = key
+            pending_lines = [rest]
+    return properties
+
 def resolve_package_choice(query: str, packages: Sequence[str]) -> List[str]:
     normalized = query.strip()
     if not normalized:
@@ -1,11 +1,19 @@
 import shutil
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Set
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 from .adb import AdbClient, CommandError
+from .async_adb import call_concurrently
 from .state import StateStore
+from .instrument import instrumented_operation
+from .ledger import APPOP, KIND, entry_target
 from .recorder import PACKAGE_USER_ID, StateRecorder
+from .users import DEFAULT_USER, package_key
 
 WHITELIST_FILE = "whitelist.txt"
+SAMSUNG_DISABLE_PACKAGES = (
+    "com.samsung.android.game.gos",
+    "com.samsung.android.game.gamelab",
+)
 
 class BatteryOptimizerApp:
     def __init__(self, client: AdbClient, state_dir: Path) -> None:
@@ -92,6 +100,23 @@ class BatteryOptimizerApp:
     def get_installed_packages_set(self, user_id: Optional[str] = None) -> Set[str]:
         return set(self.get_packages(third_party=False, user_id=user_id))
 
+    def get_user_packages(self, users: Sequence[int]) -> Dict[int, Tuple[List[str], Set[str]]]:
+        """user -> (third-party packages, installed packages), listed concurrently."""
+        results = call_concurrently([
+            lambda user=user, third_party=third_party: self.get_packages(
+                third_party=third_party, user_id=str(user)
+            )
+            for user in users
+            for third_party in (True, False)
+        ])
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return {
+            user: (results[2 * index], set(results[2 * index + 1]))
+            for index, user in enumerate(users)
+        }
+
     def validate_package(self, package: str) -> None:
         if package not in self.get_installed_packages_set():
             raise ValueError(f"Package `{package}` is not installed on the connected device.")
@@ -122,6 +147,10 @@ class BatteryOptimizerApp:
                 raise ValueError(f"Device does not support `settings` namespace `{namespace}`. Experimental optimization aborted.")
 
         with self.recorder.transaction():
+            self.recorder.prefetch_namespaces(
+                settings=("global", "system"),
+                device_config=("device_idle", "activity_manager"),
+            )
             doze_settings = {
                 "light_after_inactive_to": "0",
                 "light_pre_idle_to": "15000",
@@ -185,8 +214,12 @@ class BatteryOptimizerApp:
             if not self.client.supports_settings_namespace(namespace):
                 raise ValueError(f"Device does not support `settings` namespace `{namespace}`. Samsung optimization aborted.")
 
+        installed = self.get_installed_packages_set(user_id=PACKAGE_USER_ID)
+        packages = [package for package in SAMSUNG_DISABLE_PACKAGES if package in installed]
+
         with self.recorder.transaction():
-            self.recorder.prefetch_package_states()
+            self.recorder.prefetch_packages(packages, kinds=("enabled",))
+            self.recorder.prefetch_namespaces(settings=("system", "global", "secure"))
             samsung_settings = {
                 "system": {
                     "master_motion": "0",
@@ -213,36 +246,42 @@ class BatteryOptimizerApp:
                 for key, value in values.items():
                     self.recorder.put_setting(namespace, key, value)
 
-            installed = self.get_installed_packages_set(user_id=PACKAGE_USER_ID)
-            for package in (
-                "com.samsung.android.game.gos",
-                "com.samsung.android.game.gamelab",
-            ):
-                if package in installed:
-                    self.recorder.set_package_enabled(package, enabled=False)
+            for package in packages:
+                self.recorder.set_package_enabled(package, enabled=False)
 
-    def restrict_background_apps(self, level: str = "ignore") -> List[str]:
+    @instrumented_operation("restrict_background_apps")
+    def restrict_background_apps(
+        self, level: str = "ignore", users: Optional[Sequence[int]] = None
+    ) -> List[str]:
+        """Restrict third-party apps; returns the skipped (whitelisted) package keys.
+
+        `users` restricts each listed Android user's apps in the same
+        transaction; other users' packages are reported as `<user>/<package>`.
+        """
         if not self.client.supports_appops():
             raise ValueError("Device does not support `appops` command via `cmd`. Background restriction aborted.")
         if not self.client.supports_standby_bucket():
             raise ValueError("Device does not support `am set-standby-bucket`. Background restriction aborted.")
 
         whitelist = set(self.load_whitelist())
-        packages = self.get_packages(third_party=True)
-        installed = self.get_installed_packages_set()
+        if users is None:
+            targets = {DEFAULT_USER: (self.get_packages(third_party=True), self.get_installed_packages_set())}
+        else:
+            targets = self.get_user_packages(users)
         skipped = []
 
         with self.recorder.transaction():
-            self.recorder.prefetch_package_states()
-            for package in packages:
-                if package not in installed:
-                    continue
-                if package in whitelist:
-                    skipped.append(package)
-                    continue
-                self.recorder.set_appop(package, "RUN_ANY_IN_BACKGROUND", level)
-                bucket = "rare" if level == "ignore" else "active"
-                self.recorder.set_standby_bucket(package, bucket)
+            self.recorder.prefetch_package_states(appops_ops=["RUN_ANY_IN_BACKGROUND"], users=list(targets))
+            for user, (packages, installed) in targets.items():
+                for package in packages:
+                    if package not in installed:
+                        continue
+                    if package in whitelist:
+                        skipped.append(package_key(package, user))
+                        continue
+                    self.recorder.set_appop(package, "RUN_ANY_IN_BACKGROUND", level, user=user)
+                    bucket = "rare" if level == "ignore" else "active"
+                    self.recorder.set_standby_bucket(package, bucket, user=user)
         return skipped
 
     def run_bg_dexopt(self) -> None:
@@ -252,6 +291,7 @@ class BatteryOptimizerApp:
             timeout=self.client.LONG_TIMEOUT_SECONDS,
         )
 
+    @instrumented_operation("revert_saved_state")
     def revert_saved_state(self) -> List[str]:
         if not self.store.has_entries():
             return []
@@ -279,9 +319,11 @@ class BatteryOptimizerApp:
             "companion": ["cmd", "companiondevice", "list"],
         }
         
-        for name, cmd in commands.items():
+        outputs = self.client.shell_text_many(list(commands.values()), check=False)
+        for name, out in zip(commands, outputs):
+            if isinstance(out, BaseException):
+                continue
             try:
-                out = self.client.shell_text(cmd, check=False)
                 if out and out != "null" and "Error" not in out:
                     if name == "launcher" and "packageName=" in out:
                         for line in out.splitlines():
@@ -304,6 +346,7 @@ class BatteryOptimizerApp:
         
         return critical
 
+    @instrumented_operation("smart_restrict")
     def smart_restrict(self, aggressive: bool = False, min_last_used_days: Optional[int] = None) -> Dict[str, Any]:
         if not self.client.supports_appops():
             raise ValueError("Device does not support `appops` command via `cmd`.")
@@ -335,7 +378,7 @@ class BatteryOptimizerApp:
         
         try:
             with self.recorder.transaction():
-                self.recorder.prefetch_package_states()
+                self.recorder.prefetch_package_states(appops_ops=["RUN_ANY_IN_BACKGROUND"])
                 for pkg_info in report["packages"]:
                     pkg = pkg_info["package"]
                     if pkg in whitelist:
@@ -392,10 +435,17 @@ class BatteryOptimizerApp:
                         skipped.append({"package": pkg, "reason": "unsupported_recommendation"})
         except PartialBatchError as exc:
             failed = exc.failed_packages
+            reasons = {}
+            for entry, _ in exc.failures:
+                if entry[KIND] is APPOP:
+                    reasons.setdefault(entry_target(entry), "appop_not_controllable")
+                else:
+                    reasons[entry_target(entry)] = "standby_bucket_not_controllable"
             new_applied = []
             for item in applied:
                 if item["package"] in failed:
-                    skipped.append({"package": item["package"], "reason": "standby_bucket_not_controllable"})
+                    reason = reasons.get(item["package"], "standby_bucket_not_controllable")
+                    skipped.append({"package": item["package"], "reason": reason})
                 else:
                     new_applied.append(item)
             applied = new_applied
@@ -407,6 +457,7 @@ class BatteryOptimizerApp:
             "warnings": warnings
         }
 
+    @instrumented_operation("revert_saved_state")
     def revert_saved_state(self) -> List[str]:
         if not self.store.has_entries():
             return []
@@ -0,0 +1,125 @@
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+
+# `dumpsys appops` nests by two-space steps:
+#
+#   Uid u0a123:                                  uid block
+#     state=cch
+#     RUN_ANY_IN_BACKGROUND: mode=ignore         uid-level mode
+#     Package com.example:                       package block
+#       WAKE_LOCK (allow / switch X=allow):      package op, Android 10+
+#       WAKE_LOCK: mode=allow; time=+1h ago      package op, older builds
+#         Access: [top-s] 2024-01-01 ...         timestamps, attribution tags
+_UID_PREFIX = "Uid "
+OP_LINE_CACHE_SIZE = 4096
+_PACKAGE_PREFIX = "Package "
+
+def user_of_uid(uid: str) -> int:
+    """Android user id of a uid as printed by dumpsys (`u10a5`, `1010005`, `1000`)."""
+    if uid.startswith("u"):
+        digits = ""
+        for char in uid[1:]:
+            if not char.isdigit():
+                break
+            digits += char
+        return int(digits) if digits else 0
+    try:
+        return int(uid) // 100000
+    except ValueError:
+        return 0
+
+# `OP (mode):`, `OP (mode / switch X=mode):`, `OP: mode=mode; ...` or `OP: mode`.
+OP_LINE_RE = re.compile(
+    r"([A-Za-z0-9_]+)(?: \(([A-Za-z0-9_]+)[ /)]| \(([A-Za-z0-9_]+)$|: *(?:mode=)?([A-Za-z0-9_]+))"
+)
+
+def parse_op_line(text: str) -> Optional[Tuple[str, str]]:
+    """Split an op line (leading indent removed) into (op, mode)."""
+    match = OP_LINE_RE.match(text)
+    if match is None:
+        return None
+    op, mode_paren, mode_open, mode_colon = match.groups()
+    return sys.intern(op), sys.intern(mode_paren or mode_open or mode_colon)
+
+@dataclass
+class AppOpsDump:
+    # (user, package) -> op -> mode, from the `Package` blocks.
+    packages: Dict[Tuple[int, str], Dict[str, str]] = field(default_factory=dict)
+    # (user, package) -> uid whose block listed the package.
+    package_uids: Dict[Tuple[int, str], str] = field(default_factory=dict)
+    # uid -> op -> mode, from the uid-level lines above the `Package` blocks.
+    uid_modes: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+    def for_user(self, user: int = 0) -> Dict[str, Dict[str, str]]:
+        return {name: ops for (owner, name), ops in self.packages.items() if owner == user}
+
+def parse_appops(lines: Iterable[str]) -> AppOpsDump:
+    """Single-pass parser for `dumpsys appops` output.
+
+    Only uid blocks at the indent of the first one are read, so sections such
+    as `Historical ops` that nest their own uid blocks deeper are skipped, as
+    are the timestamp lines beneath each op. Dumps without uid blocks are
+    read as user 0.
+    """
+    dump = AppOpsDump()
+    uid_indent = -1
+    uid: Optional[str] = None
+    user = 0
+    uid_ops: Dict[str, str] = {}
+    package_ops: Optional[Dict[str, str]] = None
+    op_indent = 0
+    # Lines under an op are skipped with one prefix test before any other work.
+    deep_prefix: Optional[str] = None
+    # Op lines repeat across packages on recent builds; parse each text once.
+    op_lines: Dict[str, Optional[Tuple[str, str]]] = {}
+    for line in lines:
+        if deep_prefix is not None and line.startswith(deep_prefix):
+            continue
+        stripped = line.lstrip(" ")
+        if not stripped:
+            continue
+        indent = len(line) - len(stripped)
+
+        if package_ops is not None:
+            if indent == op_indent:
+                if stripped in op_lines:
+                    parsed = op_lines[stripped]
+                else:
+                    parsed = parse_op_line(stripped)
+                    # Older builds put timestamps on the op line; keep memory bounded.
+                    if len(op_lines) < OP_LINE_CACHE_SIZE:
+                        op_lines[stripped] = parsed
+                if parsed is not None:
+                    package_ops[parsed[0]] = parsed[1]
+                continue
+            package_ops = None
+            deep_prefix = None
+
+        if uid is not None and indent <= uid_indent:
+            uid = None
+        if stripped.startswith(_UID_PREFIX):
+            if uid_indent < 0:
+                uid_indent = indent
+            if indent == uid_indent:
+                uid = stripped[len(_UID_PREFIX):].rstrip().rstrip(":")
+                user = user_of_uid(uid)
+                uid_ops = dump.uid_modes.setdefault(uid, {})
+            continue
+        if uid is None and uid_indent >= 0:
+            continue
+
+        if stripped.startswith(_PACKAGE_PREFIX):
+            key = (user if uid is not None else 0, stripped[len(_PACKAGE_PREFIX):].rstrip().rstrip(":"))
+            package_ops = dump.packages.setdefault(key, {})
+            if uid is not None:
+                dump.package_uids[key] = uid
+            op_indent = indent + 2
+            deep_prefix = " " * (op_indent + 1)
+            continue
+        if uid is not None and indent == uid_indent + 2:
+            parsed = parse_op_line(stripped)
+            if parsed is not None:
+                uid_ops[parsed[0]] = parsed[1]
+    return dump
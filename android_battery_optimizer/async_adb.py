@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
+from .adb import CommandError, CommandResult, CommandRunner
+
+if TYPE_CHECKING:
+    from .adb import AdbClient
+
+T = TypeVar("T")
+
+MAX_CONCURRENT_COMMANDS = 8
+
+class AsyncCommandRunner:
+    async def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        raise NotImplementedError
+
+    def which(self, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+def _decode_text(data: bytes) -> str:
+    # Same universal-newline translation as `subprocess.run(text=True)`.
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+class AsyncSubprocessRunner(AsyncCommandRunner):
+    async def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if input_data is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        data = input_data.encode("utf-8") if input_data is not None else None
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(data), timeout)
+        except asyncio.TimeoutError as exc:
+            process.kill()
+            stdout, stderr = await process.communicate()
+            result = CommandResult(
+                returncode=-1,
+                stdout=_decode_text(stdout),
+                stderr=_decode_text(stderr),
+            )
+            raise CommandError(
+                f"Command timed out after {timeout}s: {' '.join(args)}",
+                result=result,
+            ) from exc
+        return CommandResult(
+            returncode=process.returncode if process.returncode is not None else -1,
+            stdout=_decode_text(stdout),
+            stderr=_decode_text(stderr),
+        )
+
+    def which(self, name: str) -> Optional[str]:
+        return shutil.which(name)
+
+class SyncRunnerAdapter(AsyncCommandRunner):
+    # Lets any blocking CommandRunner (session, socket or test fakes) take part in
+    # concurrent reads by running each call on a worker thread.
+    def __init__(self, runner: CommandRunner) -> None:
+        self.runner = runner
+
+    async def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        return await asyncio.to_thread(
+            self.runner.run, args, input_data=input_data, timeout=timeout
+        )
+
+    def which(self, name: str) -> Optional[str]:
+        return self.runner.which(name)
+
+class AsyncAdbClient:
+    """asyncio mirror of AdbClient.
+
+    Serial, dry-run and output settings are read from the wrapped synchronous
+    client so both stay bound to the same device.
+    """
+
+    def __init__(
+        self,
+        client: "AdbClient",
+        runner: AsyncCommandRunner,
+        max_concurrency: int = MAX_CONCURRENT_COMMANDS,
+    ) -> None:
+        self.client = client
+        self.runner = runner
+        self.max_concurrency = max_concurrency
+
+    async def run_adb(
+        self,
+        args: Sequence[object],
+        *,
+        mutate: bool = False,
+        check: bool = True,
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        command, dry_run_result = self.client._prepare_adb_command(args, mutate, input_data)
+        if dry_run_result is not None:
+            return dry_run_result
+        if timeout is None:
+            timeout = self.client.DEFAULT_TIMEOUT_SECONDS
+        result = await self.runner.run(command, input_data=input_data, timeout=timeout)
+        return self.client._check_adb_result(command, result, check)
+
+    async def shell(
+        self,
+        args: Sequence[object],
+        *,
+        mutate: bool = False,
+        check: bool = True,
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        return await self.run_adb(
+            ["shell", *args],
+            mutate=mutate,
+            check=check,
+            input_data=input_data,
+            timeout=timeout,
+        )
+
+    async def shell_text(
+        self,
+        args: Sequence[object],
+        *,
+        mutate: bool = False,
+        check: bool = True,
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        result = await self.shell(
+            args, mutate=mutate, check=check, input_data=input_data, timeout=timeout
+        )
+        return result.stdout.strip()
+
+    async def local_text(
+        self,
+        args: Sequence[object],
+        *,
+        check: bool = True,
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        str_args = self.client._stringify(args)
+        if timeout is None and str_args and str_args[0] == "adb":
+            timeout = self.client.DEFAULT_TIMEOUT_SECONDS
+        result = await self.runner.run(str_args, input_data=input_data, timeout=timeout)
+        return self.client._check_local_result(str_args, result, check).stdout.strip()
+
+    async def shell_text_many(
+        self,
+        commands: Sequence[Sequence[object]],
+        *,
+        check: bool = True,
+        timeout: Optional[float] = None,
+    ) -> List[Union[str, BaseException]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def one(args: Sequence[object]) -> str:
+            async with semaphore:
+                return await self.shell_text(args, check=check, timeout=timeout)
+
+        return list(
+            await asyncio.gather(*(one(args) for args in commands), return_exceptions=True)
+        )
+
+def run_sync(awaitable: Awaitable[T]) -> T:
+    async def wrapper() -> T:
+        return await awaitable
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(wrapper())
+    # Already inside an event loop (for example a caller embedding the client):
+    # run on a private loop so the synchronous API keeps working.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(context.run, asyncio.run, wrapper()).result()
+
+async def gather_threads(
+    funcs: Sequence[Callable[[], Any]],
+    max_concurrency: int = MAX_CONCURRENT_COMMANDS,
+) -> List[Any]:
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def one(func: Callable[[], Any]) -> Any:
+        async with semaphore:
+            return await asyncio.to_thread(func)
+
+    return list(await asyncio.gather(*(one(func) for func in funcs), return_exceptions=True))
+
+def call_concurrently(
+    funcs: Sequence[Callable[[], Any]],
+    max_concurrency: int = MAX_CONCURRENT_COMMANDS,
+) -> List[Any]:
+    """Run blocking callables concurrently; exceptions are returned in place."""
+    if len(funcs) <= 1:
+        results: List[Any] = []
+        for func in funcs:
+            try:
+                results.append(func())
+            except Exception as exc:
+                results.append(exc)
+        return results
+    return run_sync(gather_threads(funcs, max_concurrency))
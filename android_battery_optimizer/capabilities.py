@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+CAPABILITIES_FILE = "capabilities.json"
+CAPABILITIES_VERSION = 1
+
+class CapabilityCache:
+    """On-disk cache of capability probe answers keyed by `ro.build.fingerprint`.
+
+    Only positive answers are kept: a failed probe can be transient (device
+    busy, service restarting) and must not disable a feature until the next
+    firmware update. With `refresh`, answers stored by earlier runs are
+    ignored and re-probed; answers stored during this run are still served.
+    """
+
+    def __init__(self, path: Path, refresh: bool = False) -> None:
+        self.path = path
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._data: Optional[Dict[str, Dict[str, bool]]] = None
+        # Answers put by this process, the only ones served with `refresh`.
+        self._fresh: Dict[str, Dict[str, bool]] = {}
+
+    def _read(self) -> Dict[str, Dict[str, bool]]:
+        try:
+            with self.path.open("r", encoding="utf-8") as handle:
+                raw = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(raw, dict) or raw.get("version") != CAPABILITIES_VERSION:
+            return {}
+        fingerprints = raw.get("fingerprints")
+        if not isinstance(fingerprints, dict):
+            return {}
+        data: Dict[str, Dict[str, bool]] = {}
+        for fingerprint, entries in fingerprints.items():
+            if isinstance(fingerprint, str) and isinstance(entries, dict):
+                data[fingerprint] = {
+                    name: value
+                    for name, value in entries.items()
+                    if isinstance(name, str) and value is True
+                }
+        return data
+
+    def _loaded(self) -> Dict[str, Dict[str, bool]]:
+        if self._data is None:
+            self._data = self._read()
+        return self._data
+
+    def get(self, fingerprint: str, name: str) -> Optional[bool]:
+        if not fingerprint:
+            return None
+        with self._lock:
+            data = self._fresh if self.refresh else self._loaded()
+            return data.get(fingerprint, {}).get(name)
+
+    def put(self, fingerprint: str, name: str, value: bool) -> None:
+        if not fingerprint:
+            return
+        with self._lock:
+            # Merge with the file as it is now so concurrent runs keep each other's answers.
+            data = self._read()
+            entries = data.setdefault(fingerprint, {})
+            fresh = self._fresh.setdefault(fingerprint, {})
+            if value:
+                entries[name] = True
+                fresh[name] = True
+            else:
+                fresh.pop(name, None)
+                entries.pop(name, None)
+                if not entries:
+                    del data[fingerprint]
+            self._data = data
+            self._write(data)
+
+    def _write(self, data: Dict[str, Dict[str, bool]]) -> None:
+        payload = {"version": CAPABILITIES_VERSION, "fingerprints": data}
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w", encoding="utf-8") as handle:
+                json.dump(payload, handle, indent=2, sort_keys=True)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # The cache is an optimisation; a read-only state dir must not fail the command.
+            if tmp_path.exists():
+                tmp_path.unlink()
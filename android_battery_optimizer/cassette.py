@@ -0,0 +1,207 @@
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import IO, Deque, Dict, Generator, List, Optional, Sequence, Tuple
+from .adb import CommandError, CommandResult, CommandRunner
+
+CASSETTE_VERSION = 1
+
+def _open_cassette(path: Path, mode: str) -> IO[str]:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return path.open(mode, encoding="utf-8")
+
+class CassetteError(CommandError):
+    pass
+
+class RecordingRunner(CommandRunner):
+    """Forwards to a real runner and appends every exchange to a JSONL cassette.
+
+    Each line holds the args, stdin, result and wall time of one call; a
+    `.gz` suffix writes a gzip-compressed cassette.
+    """
+
+    def __init__(self, delegate: CommandRunner, path: Path) -> None:
+        self.delegate = delegate
+        self.path = path
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle: Optional[IO[str]] = _open_cassette(self.path, "w")
+        self._write({"cassette": CASSETTE_VERSION})
+
+    def _write(self, record: Dict[str, object]) -> None:
+        with self._lock:
+            if self._handle is None:
+                return
+            self._handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._handle.flush()
+
+    def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        started = time.perf_counter()
+        try:
+            result = self.delegate.run(args, input_data=input_data, timeout=timeout)
+        except CommandError as exc:
+            failed = exc.result or CommandResult(returncode=-1, stdout="", stderr="")
+            self._write({
+                "args": list(args),
+                "input": input_data,
+                "returncode": failed.returncode,
+                "stdout": failed.stdout,
+                "stderr": failed.stderr,
+                "seconds": round(time.perf_counter() - started, 6),
+                "error": str(exc),
+            })
+            raise
+        self._write({
+            "args": list(args),
+            "input": input_data,
+            "returncode": result.returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "seconds": round(time.perf_counter() - started, 6),
+        })
+        return result
+
+    def stream_lines(
+        self,
+        args: Sequence[str],
+        timeout: Optional[float] = None,
+        input_data: Optional[str] = None,
+    ) -> Generator[str, None, CommandResult]:
+        # Recorded like run(), with the lines joined back into stdout, so a
+        # replayed stream yields the same lines.
+        started = time.perf_counter()
+        lines: List[str] = []
+        record: Dict[str, object] = {"args": list(args), "input": input_data}
+        # A stream closed early is recorded with the lines read so far.
+        result = CommandResult(returncode=-1, stdout="", stderr="")
+        try:
+            if input_data is None:
+                stream = self.delegate.stream_lines(args, timeout=timeout)
+            else:
+                stream = self.delegate.stream_lines(args, timeout=timeout, input_data=input_data)
+            while True:
+                try:
+                    line = next(stream)
+                except StopIteration as stop:
+                    result = stop.value
+                    return result
+                lines.append(line)
+                yield line
+        except CommandError as exc:
+            result = exc.result or result
+            record["error"] = str(exc)
+            raise
+        finally:
+            record.update({
+                "returncode": result.returncode,
+                "stdout": "".join(line + "\n" for line in lines),
+                "stderr": result.stderr,
+                "seconds": round(time.perf_counter() - started, 6),
+            })
+            self._write(record)
+
+    def which(self, name: str) -> Optional[str]:
+        path = self.delegate.which(name)
+        self._write({"which": name, "path": path})
+        return path
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+        close = getattr(self.delegate, "close", None)
+        if close is not None:
+            close()
+
+_Exchange = Tuple[CommandResult, float, Optional[str]]
+
+class ReplayRunner(CommandRunner):
+    """Serves results from a cassette written by RecordingRunner.
+
+    Identical calls are answered in recorded order; once a call's recordings
+    are used up the last one is repeated, unless `strict` is set. With
+    `replay_latency` each answer is delayed by its recorded wall time.
+    """
+
+    def __init__(self, path: Path, replay_latency: bool = False, strict: bool = False) -> None:
+        self.path = path
+        self.replay_latency = replay_latency
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._exchanges: Dict[Tuple[Tuple[str, ...], Optional[str]], Deque[_Exchange]] = {}
+        self._last: Dict[Tuple[Tuple[str, ...], Optional[str]], _Exchange] = {}
+        self._which: Dict[str, Optional[str]] = {}
+        self.misses: List[List[str]] = []
+        self._load()
+
+    def _load(self) -> None:
+        with _open_cassette(self.path, "r") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as exc:
+                    raise ValueError(f"Cassette {self.path} line {line_number} is not valid JSON.") from exc
+                if "cassette" in record:
+                    if record["cassette"] != CASSETTE_VERSION:
+                        raise ValueError(f"Unsupported cassette version: {record['cassette']}")
+                    continue
+                if "which" in record:
+                    self._which[record["which"]] = record.get("path")
+                    continue
+                key = (tuple(record["args"]), record.get("input"))
+                result = CommandResult(
+                    returncode=record["returncode"],
+                    stdout=record["stdout"],
+                    stderr=record["stderr"],
+                )
+                exchange = (result, float(record.get("seconds", 0.0)), record.get("error"))
+                self._exchanges.setdefault(key, deque()).append(exchange)
+
+    def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        key = (tuple(args), input_data)
+        with self._lock:
+            queue = self._exchanges.get(key)
+            if queue:
+                exchange = queue.popleft()
+                self._last[key] = exchange
+            elif key in self._last and not self.strict:
+                exchange = self._last[key]
+            else:
+                self.misses.append(list(args))
+                raise CassetteError(
+                    f"No recorded result for `{' '.join(args)}` in cassette {self.path}",
+                    result=CommandResult(returncode=-1, stdout="", stderr=""),
+                )
+        result, seconds, error = exchange
+        if self.replay_latency and seconds > 0:
+            time.sleep(seconds)
+        if error is not None:
+            raise CommandError(error, result=result)
+        return CommandResult(result.returncode, result.stdout, result.stderr)
+
+    def which(self, name: str) -> Optional[str]:
+        if name in self._which:
+            return self._which[name]
+        # Cassettes always come from a host where adb ran.
+        return f"/replay/{name}" if name == "adb" else None
+
+    def remaining(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._exchanges.values())
@@ -1,20 +1,63 @@
 import argparse
 import os
+import shutil
 import sys
+import tempfile
+import time
 from pathlib import Path
 from typing import Callable, Optional, Sequence
-from .adb import AdbClient, SubprocessRunner, CommandError
+from .adb import AdbClient, CommandRunner, SubprocessRunner, CommandError
 from .app import BatteryOptimizerApp
+from .capabilities import CAPABILITIES_FILE, CapabilityCache
 from .android import parse_adb_devices, resolve_package_choice
-from .recorder import SnapshotError, VerificationError
+from .instrument import InstrumentedRunner, RunnerStats
+from .fleet import DEFAULT_FLEET_JOBS, run_fleet
+from .ledger import change_id
+from .plan import PLAN_OPERATIONS, Plan, apply_plan, compile_plan
+from .recorder import BatchProgress, PartialBatchError, SnapshotError, VerificationError
+from .users import resolve_users
 
 APP_NAME = "android-battery-optimizer"
 DEFAULT_STATE_DIR = (
     Path(os.environ.get("XDG_STATE_HOME", Path.home() / ".local" / "state")) / APP_NAME
 )
 
-def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
-    # Parent parser for global options
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+def write_stderr(line: str) -> None:
+    sys.stderr.write(f"{line}\n")
+
+def progress_printer(
+    output: Callable[[str], None], interval: float = PROGRESS_INTERVAL_SECONDS
+) -> Callable[[BatchProgress], None]:
+    """Render batch progress events as at most one line per `interval`, plus the last."""
+    last_printed = [float("-inf")]
+
+    def render(progress: BatchProgress) -> None:
+        now = time.monotonic()
+        if progress.done < progress.total and now - last_printed[0] < interval:
+            return
+        last_printed[0] = now
+        line = f"Applied {progress.done}/{progress.total} commands ({progress.rate:.0f}/s"
+        if progress.done < progress.total and progress.eta is not None:
+            line += f", ~{progress.eta:.0f}s left"
+        line += ")"
+        if progress.failed:
+            line += f", {progress.failed} failed"
+        output(line)
+
+    return render
+
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    return number
+
+def build_global_options(suppress_defaults: bool = False) -> argparse.ArgumentParser:
     parent_parser = argparse.ArgumentParser(add_help=False)
     parent_parser.add_argument("--serial", help="ADB device serial to use")
     parent_parser.add_argument(
@@ -27,9 +70,87 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         default=str(DEFAULT_STATE_DIR),
         help="Directory for whitelist and saved rollback state",
     )
+    parent_parser.add_argument(
+        "--persistent-shell",
+        action="store_true",
+        help="Reuse one long-lived adb shell per device instead of one adb process per command",
+    )
+    parent_parser.add_argument(
+        "--native-adb",
+        action="store_true",
+        help="Talk to the local adb server socket directly instead of running the adb binary",
+    )
+    parent_parser.add_argument(
+        "--refresh-capabilities",
+        action="store_true",
+        help="Re-run device capability probes instead of using the cached answers",
+    )
+    parent_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print per-operation adb latency, byte and round-trip statistics on exit",
+    )
+    parent_parser.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record every adb call and its result to a JSONL cassette (.gz to compress)",
+    )
+    parent_parser.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Serve adb results from a recorded cassette instead of a device",
+    )
+    parent_parser.add_argument(
+        "--replay-latency",
+        action="store_true",
+        help="With --replay, sleep for each call's recorded latency",
+    )
+    parent_parser.add_argument(
+        "--all-devices",
+        action="store_true",
+        help="Run the subcommand on every authorized attached device",
+    )
+    parent_parser.add_argument(
+        "--serials",
+        help="Comma-separated device serials to run the subcommand on",
+    )
+    parent_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_FLEET_JOBS,
+        help="Maximum number of devices handled concurrently with --all-devices/--serials",
+    )
+    parent_parser.add_argument(
+        "--chunk-size",
+        type=positive_int,
+        metavar="N",
+        help="Apply large batches N commands at a time, checkpointing after each chunk",
+    )
+    parent_parser.add_argument(
+        "--continue-on-error",
+        action="store_true",
+        help="Run every batched command even if some fail, and report the failed ones",
+    )
+    parent_parser.add_argument(
+        "--progress",
+        action="store_true",
+        help=(
+            "Report batch progress as commands finish, verifying finished ones meanwhile "
+            "(with --persistent-shell or --replay, only once the batch has finished)"
+        ),
+    )
+    if suppress_defaults:
+        # Subcommand copies must not reset values already given before the subcommand.
+        for action in parent_parser._actions:
+            action.default = argparse.SUPPRESS
+    return parent_parser
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    # Parent parser for global options
+    parent_parser = build_global_options(suppress_defaults=True)
 
     parser = argparse.ArgumentParser(
-        description="Android battery optimizer", parents=[parent_parser]
+        description="Android battery optimizer", parents=[build_global_options()]
     )
     subparsers = parser.add_subparsers(dest="command", help="Subcommands")
 
@@ -48,6 +169,27 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser_restrict = add_subparser("restrict-apps", help="Restrict background apps")
     parser_restrict.add_argument("--level", choices=["ignore", "deny", "allow"], default="ignore")
     parser_restrict.add_argument("--yes", action="store_true", help="Confirm restriction")
+    parser_restrict.add_argument(
+        "--users",
+        metavar="all|IDS",
+        help="Android users to restrict: `all` or comma-separated user ids (default: 0)",
+    )
+
+    parser_plan = add_subparser("plan", help="Save the changes an operation would make as a plan file")
+    parser_plan.add_argument("operation", choices=PLAN_OPERATIONS)
+    parser_plan.add_argument(
+        "--out", required=True, help="Plan file to write; `{serial}` is replaced with the device serial"
+    )
+    parser_plan.add_argument("--level", choices=["ignore", "deny", "allow"], default="ignore", help="For restrict-apps")
+    parser_plan.add_argument("--users", metavar="all|IDS", help="For restrict-apps: Android users to restrict")
+    parser_plan.add_argument("--aggressive", action="store_true", help="For smart-restrict: aggressive mode")
+    parser_plan.add_argument("--min-last-used-days", type=int, help="For smart-restrict: skip recently used apps")
+
+    parser_apply = add_subparser("apply", help="Apply a plan file written by `plan`")
+    parser_apply.add_argument(
+        "--plan", required=True, dest="plan_file", help="Plan file; `{serial}` is replaced with the device serial"
+    )
+    parser_apply.add_argument("--yes", action="store_true", help="Confirm applying the plan")
 
     parser_diagnose = add_subparser("diagnose", help="Run battery diagnostics")
     parser_diagnose.add_argument("--output", help="Save report to specified JSON file")
@@ -156,19 +298,24 @@ class BatteryOptimizerCLI:
         self.output("\n--- Battery Status ---")
         self.output(self.client.shell_text(["dumpsys", "battery"], check=False))
         self.output("\n--- BatteryStats Summary (Since Charged) ---")
-        output = self.client.shell_text(["dumpsys", "batterystats", "--charged"], check=False)
+        # batterystats can be tens of megabytes; stream it and stop reading
+        # once the summary section ends.
+        lines = self.client.stream_lines(["dumpsys", "batterystats", "--charged"], check=False)
         found = False
-        for line in output.splitlines():
-            stripped = line.strip()
-            if any(token in stripped for token in ("Estimated power use", "Capacity:", "Computed drain:")):
-                found = True
-                self.output(stripped)
-                continue
-            if found:
-                if stripped and ("mAh" in stripped or ":" in stripped):
+        try:
+            for line in lines:
+                stripped = line.strip()
+                if any(token in stripped for token in ("Estimated power use", "Capacity:", "Computed drain:")):
+                    found = True
                     self.output(stripped)
-                elif stripped and not line.startswith("  "):
-                    break
+                    continue
+                if found:
+                    if stripped and ("mAh" in stripped or ":" in stripped):
+                        self.output(stripped)
+                    elif stripped and not line.startswith("  "):
+                        break
+        finally:
+            lines.close()
 
     def manage_whitelist(self) -> None:
         whitelist = self.app.load_whitelist()
@@ -237,6 +384,10 @@ class BatteryOptimizerCLI:
     def run_command(self, args: argparse.Namespace) -> int:
         if not self.check_environment():
             return 1
+        self.app.recorder.chunk_size = getattr(args, "chunk_size", None)
+        self.app.recorder.continue_on_error = getattr(args, "continue_on_error", False)
+        if getattr(args, "progress", False):
+            self.app.recorder.on_progress = progress_printer(self.output)
 
         try:
             if args.command == "status":
@@ -275,12 +426,37 @@ class BatteryOptimizerCLI:
                     self.output("Error: --yes is required for restricting apps unless --dry-run is used.")
                     return 1
                 self.output(f"Setting RUN_ANY_IN_BACKGROUND={args.level} for third-party apps...")
-                skipped = self.app.restrict_background_apps(level=args.level)
+                users = resolve_users(self.client, args.users) if args.users else None
+                if users is not None:
+                    self.output(f"Users: {', '.join(map(str, users))}")
+                skipped = self.app.restrict_background_apps(level=args.level, users=users)
                 for pkg in skipped:
                     self.output(f"  Skipping whitelisted app: {pkg}")
                 self.output("Background restrictions updated.")
                 return 0
 
+            elif args.command == "plan":
+                plan = compile_plan(self.app, args.operation, self._plan_operation(args))
+                path = self._serial_path(args.out)
+                plan.save(path)
+                self.output(
+                    f"Plan for {plan.operation}: {len(plan.entries)} changes "
+                    f"({plan.skipped} already applied), about {plan.estimate.round_trips} round trips "
+                    f"and {plan.estimate.bytes} bytes."
+                )
+                self.output(f"Plan saved to {path}")
+                return 0
+
+            elif args.command == "apply":
+                if not args.yes and not args.dry_run:
+                    self.output("Error: --yes is required for applying a plan unless --dry-run is used.")
+                    return 1
+                plan = Plan.load(self._serial_path(args.plan_file))
+                self.output(f"Applying plan for {plan.operation} ({len(plan.entries)} changes)...")
+                apply_plan(self.app, plan)
+                self.output("Plan applied.")
+                return 0
+
             elif args.command == "diagnose":
                 import json
                 self.output("Running diagnostics. This may take a moment...")
@@ -397,11 +573,31 @@ class BatteryOptimizerCLI:
                         self.output(f"{args.package} not found in whitelist.")
                 return 0
 
+        except PartialBatchError as exc:
+            for entry, status in exc.failures:
+                self.output(f"  Failed: {change_id(entry)} (exit code {status})")
+            self.output(f"Error: {len(exc.failures)} changes failed; the rest were applied.")
+            return 1
         except (CommandError, ValueError, SnapshotError, VerificationError) as exc:
             self.output(f"Error: {exc}")
             return 1
         return 0
 
+    def _serial_path(self, path: str) -> Path:
+        return Path(path.replace("{serial}", self.client.serial or "")).expanduser()
+
+    def _plan_operation(self, args: argparse.Namespace) -> Callable[[], object]:
+        if args.operation == "apply-experimental":
+            return self.app.apply_experimental_optimizations
+        if args.operation == "apply-samsung-experimental":
+            return self.app.apply_samsung_experimental_optimizations
+        if args.operation == "restrict-apps":
+            users = resolve_users(self.client, args.users) if args.users else None
+            return lambda: self.app.restrict_background_apps(level=args.level, users=users)
+        return lambda: self.app.smart_restrict(
+            aggressive=args.aggressive, min_last_used_days=args.min_last_used_days
+        )
+
     def run(self) -> int:
         if not self.check_environment():
             return 1
@@ -479,19 +675,65 @@ class BatteryOptimizerCLI:
             except (CommandError, ValueError, SnapshotError, VerificationError) as exc:
                 self.output(f"Error: {exc}")
 
+def replay_state_dir(state_dir: Path, scratch: Path) -> Path:
+    """Copy `state_dir` under `scratch`, so a replayed run reads the real
+    snapshots but its writes are thrown away."""
+    copy = scratch / "state"
+    if state_dir.is_dir():
+        shutil.copytree(state_dir, copy)
+    return copy
+
 def main(argv: Optional[Sequence[str]] = None) -> int:
     args = parse_args(argv)
     state_dir = Path(args.state_dir).expanduser()
-    client = AdbClient(
-        runner=SubprocessRunner(),
-        serial=args.serial,
-        dry_run=args.dry_run,
-    )
-    app = BatteryOptimizerApp(client=client, state_dir=state_dir)
-    cli = BatteryOptimizerCLI(app=app)
-    if args.command:
-        return cli.run_command(args)
-    return cli.run()
+    runner: CommandRunner = SubprocessRunner()
+    scratch: Optional[tempfile.TemporaryDirectory] = None
+    if args.replay:
+        from .cassette import ReplayRunner
+        runner = ReplayRunner(Path(args.replay).expanduser(), replay_latency=args.replay_latency)
+        scratch = tempfile.TemporaryDirectory()
+        state_dir = replay_state_dir(state_dir, Path(scratch.name))
+    elif args.native_adb:
+        from .adb_protocol import AdbServerRunner
+        runner = AdbServerRunner(runner)
+    elif args.persistent_shell:
+        from .session import ShellSessionRunner
+        runner = ShellSessionRunner(runner)
+    if args.record:
+        from .cassette import RecordingRunner
+        runner = RecordingRunner(runner, Path(args.record).expanduser())
+    stats: Optional[RunnerStats] = None
+    if args.stats:
+        instrumented = InstrumentedRunner(runner)
+        stats = instrumented.stats
+        runner = instrumented
+    try:
+        if args.all_devices or args.serials:
+            return run_fleet(args, runner, state_dir)
+        client = AdbClient(
+            runner=runner,
+            serial=args.serial,
+            dry_run=args.dry_run,
+        )
+        client.capabilities = CapabilityCache(
+            state_dir / CAPABILITIES_FILE, refresh=args.refresh_capabilities
+        )
+        app = BatteryOptimizerApp(client=client, state_dir=state_dir)
+        cli = BatteryOptimizerCLI(app=app)
+        if args.command:
+            return cli.run_command(args)
+        return cli.run()
+    finally:
+        close = getattr(runner, "close", None)
+        if close is not None:
+            close()
+        if scratch is not None:
+            scratch.cleanup()
+        if stats is not None:
+            # Kept off stdout so it cannot mix into a command's output.
+            write_stderr("\n--- adb command stats ---")
+            for line in stats.format_table():
+                write_stderr(line)
 
 
 if __name__ == "__main__":
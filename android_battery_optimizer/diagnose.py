@@ -1,33 +1,49 @@
 import json
 import re
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
 from .adb import AdbClient
+from .async_adb import call_concurrently
+from .instrument import instrumented_operation
 from .verification import parse_appop_output, VerificationError
 
+# Package names are maximal runs of these characters, which is the same
+# boundary rule `_has_package_signal` applies.
+PACKAGE_TOKEN_RE = re.compile(r"[a-zA-Z0-9_.]+")
+
+@dataclass
+class DumpsysScan:
+    """What one streamed dumpsys service said about the packages of interest."""
+    has_output: bool = False
+    packages_seen: Set[str] = field(default_factory=set)
+    # package -> raw lastTimeUsed value of its first usagestats line, if any.
+    last_used: Dict[str, Optional[str]] = field(default_factory=dict)
+
 class Diagnoser:
     def __init__(self, client: AdbClient):
         self.client = client
         self.warnings: List[str] = []
 
+    @instrumented_operation("diagnose")
     def run(self, third_party_only: bool = True) -> Dict[str, Any]:
         device = self.client.get_device_metadata_with_fallback()
         
         packages = self._get_packages(third_party=third_party_only)
         
-        dumpsys_outputs = {
-            "batterystats": self._safe_dumpsys(["batterystats", "--charged"]),
-            "deviceidle": self._safe_dumpsys(["deviceidle"]),
-            "usagestats": self._safe_dumpsys(["usagestats"]),
-            "alarm": self._safe_dumpsys(["alarm"]),
-            "jobscheduler": self._safe_dumpsys(["jobscheduler"]),
-        }
+        dumpsys_scans = self._scan_dumpsys_many({
+            "batterystats": ["batterystats", "--charged"],
+            "deviceidle": ["deviceidle"],
+            "usagestats": ["usagestats"],
+            "alarm": ["alarm"],
+            "jobscheduler": ["jobscheduler"],
+        }, set(packages))
         
         results = []
         for pkg in packages:
             bucket = self._get_standby_bucket(pkg)
             appops = self._get_appops(pkg)
             
-            signals = self._parse_signals(pkg, dumpsys_outputs)
+            signals = self._parse_signals(pkg, dumpsys_scans)
             
             rec, reason = self._recommend(bucket, appops, signals)
             
@@ -53,6 +69,37 @@ class Diagnoser:
             self.warnings.append(f"dumpsys {' '.join(args)} failed")
             return ""
 
+    def _scan_dumpsys(self, args: List[str], packages: Set[str]) -> DumpsysScan:
+        # Streamed so that tens of megabytes of batterystats or usagestats are
+        # never held in memory; only matches for `packages` are kept.
+        scan = DumpsysScan()
+        for line in self.client.stream_lines(["dumpsys"] + args, check=True):
+            if not scan.has_output and line.strip():
+                scan.has_output = True
+            matched = packages.intersection(PACKAGE_TOKEN_RE.findall(line))
+            if not matched:
+                continue
+            scan.packages_seen.update(matched)
+            if "lastTimeUsed" in line:
+                for pkg in matched:
+                    if pkg not in scan.last_used:
+                        scan.last_used[pkg] = self._last_time_used(line)
+        return scan
+
+    def _scan_dumpsys_many(
+        self, services: Dict[str, List[str]], packages: Set[str]
+    ) -> Dict[str, Optional[DumpsysScan]]:
+        scans = call_concurrently(
+            [lambda args=args: self._scan_dumpsys(args, packages) for args in services.values()]
+        )
+        results: Dict[str, Optional[DumpsysScan]] = {}
+        for (name, args), scan in zip(services.items(), scans):
+            if isinstance(scan, BaseException):
+                self.warnings.append(f"dumpsys {' '.join(args)} failed")
+                scan = None
+            results[name] = scan if scan is not None and scan.has_output else None
+        return results
+
     def _get_packages(self, third_party: bool) -> List[str]:
         args = ["pm", "list", "packages"]
         if third_party:
@@ -87,38 +134,36 @@ class Diagnoser:
         pattern = re.compile(rf'(?:^|[^a-zA-Z0-9_.])({re.escape(pkg)})(?:[^a-zA-Z0-9_.]|$)')
         return bool(pattern.search(dumpsys_output))
 
-    def _parse_signals(self, pkg: str, dumpsys: Dict[str, str]) -> Dict[str, Any]:
-        alarms_seen = self._has_package_signal(pkg, dumpsys["alarm"]) if dumpsys["alarm"] else None
-        jobs_seen = self._has_package_signal(pkg, dumpsys["jobscheduler"]) if dumpsys["jobscheduler"] else None
-        wakelocks_seen = self._has_package_signal(pkg, dumpsys["batterystats"]) if dumpsys["batterystats"] else None
+    def _last_time_used(self, line: str) -> Optional[str]:
+        m = re.search(r'lastTimeUsed="([^"]+)"', line)
+        if m:
+            return m.group(1)
+        if "=" in line:
+            for p in line.split():
+                if p.startswith("lastTimeUsed="):
+                    return p.split("=")[1].strip('"')
+        return None
+
+    def _parse_signals(self, pkg: str, dumpsys: Dict[str, Optional[DumpsysScan]]) -> Dict[str, Any]:
+        alarm, jobs, batterystats = dumpsys["alarm"], dumpsys["jobscheduler"], dumpsys["batterystats"]
+        alarms_seen = pkg in alarm.packages_seen if alarm else None
+        jobs_seen = pkg in jobs.packages_seen if jobs else None
+        wakelocks_seen = pkg in batterystats.packages_seen if batterystats else None
         
         last_used = {
             "raw": None,
             "epoch_ms": None,
             "parsed": False
         }
-        if dumpsys["usagestats"]:
-            for line in dumpsys["usagestats"].splitlines():
-                if self._has_package_signal(pkg, line) and "lastTimeUsed" in line:
-                    raw_val = None
-                    m = re.search(r'lastTimeUsed="([^"]+)"', line)
-                    if m:
-                        raw_val = m.group(1)
-                    elif "=" in line:
-                        parts = line.split()
-                        for p in parts:
-                            if p.startswith("lastTimeUsed="):
-                                raw_val = p.split("=")[1].strip('"')
-                                break
-                    
-                    if raw_val is not None:
-                        last_used["raw"] = raw_val
-                        try:
-                            last_used["epoch_ms"] = int(raw_val)
-                            last_used["parsed"] = True
-                        except ValueError:
-                            pass
-                    break
+        usagestats = dumpsys["usagestats"]
+        raw_val = usagestats.last_used.get(pkg) if usagestats else None
+        if raw_val is not None:
+            last_used["raw"] = raw_val
+            try:
+                last_used["epoch_ms"] = int(raw_val)
+                last_used["parsed"] = True
+            except ValueError:
+                pass
         
         return {
             "alarms_seen": alarms_seen,
@@ -0,0 +1,197 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+from .adb import AdbClient, CommandRunner
+from .android import parse_adb_devices
+from .capabilities import CAPABILITIES_FILE, CapabilityCache
+
+DEFAULT_FLEET_JOBS = 8
+
+@dataclass
+class DeviceRunResult:
+    serial: str
+    exit_code: int
+    duration: float
+    error: str = ""
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+def parse_serials(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    serials: List[str] = []
+    for item in value.split(","):
+        item = item.strip()
+        if item and item not in serials:
+            serials.append(item)
+    return serials
+
+def discover_ready_serials(
+    runner: CommandRunner, output: Callable[[str], None] = print
+) -> List[str]:
+    client = AdbClient(runner=runner, output=output)
+    if not client.adb_exists():
+        raise ValueError("ADB was not found in PATH. Install Android Platform Tools first.")
+    devices = parse_adb_devices(client.local_text(["adb", "devices"], check=False))
+    ready: List[str] = []
+    for device in devices:
+        if device["status"] == "device":
+            ready.append(device["serial"])
+        else:
+            output(f"Skipping device {device['serial']} because it is {device['status']}.")
+    return ready
+
+def fleet_exit_code(results: Sequence[DeviceRunResult]) -> int:
+    """0 when every device succeeded, 1 when none did, 2 on partial failure."""
+    if not results:
+        return 1
+    failed = sum(1 for result in results if not result.ok)
+    if failed == 0:
+        return 0
+    if failed == len(results):
+        return 1
+    return 2
+
+def format_results_table(results: Sequence[DeviceRunResult]) -> List[str]:
+    width = max([len("SERIAL")] + [len(result.serial) for result in results])
+    lines = [f"{'SERIAL'.ljust(width)}  RESULT  EXIT  TIME    DETAIL"]
+    for result in results:
+        status = "ok" if result.ok else "FAILED"
+        lines.append(
+            f"{result.serial.ljust(width)}  {status.ljust(6)}  {str(result.exit_code).ljust(4)}  "
+            f"{result.duration:6.1f}s  {result.error}".rstrip()
+        )
+    return lines
+
+class FleetRunner:
+    """Runs one CLI subcommand against several devices on a bounded worker pool.
+
+    Every device gets its own AdbClient, BatteryOptimizerApp, StateStore and
+    StateRecorder; only the underlying command runner is shared.
+    """
+
+    def __init__(
+        self,
+        runner: CommandRunner,
+        state_dir: Path,
+        jobs: int = DEFAULT_FLEET_JOBS,
+        dry_run: bool = False,
+        output: Callable[[str], None] = print,
+        capabilities: Optional[CapabilityCache] = None,
+    ) -> None:
+        self.runner = runner
+        self.state_dir = state_dir
+        self.jobs = max(1, jobs)
+        self.dry_run = dry_run
+        self.output = output
+        self.capabilities = capabilities
+        self._output_lock = threading.Lock()
+
+    def _device_output(self, serial: str, lines: List[str]) -> Callable[[str], None]:
+        def emit(message: str) -> None:
+            lines.append(message)
+            with self._output_lock:
+                for line in str(message).splitlines() or [""]:
+                    self.output(f"[{serial}] {line}")
+        return emit
+
+    def _refuse_input(self, prompt: str) -> str:
+        # Workers are non-interactive; an unanswered prompt reads as "no".
+        return ""
+
+    def run_device(self, serial: str, args: argparse.Namespace) -> DeviceRunResult:
+        from .app import BatteryOptimizerApp
+        from .cli import BatteryOptimizerCLI
+
+        lines: List[str] = []
+        emit = self._device_output(serial, lines)
+        started = time.monotonic()
+        try:
+            client = AdbClient(
+                runner=self.runner,
+                serial=serial,
+                dry_run=self.dry_run,
+                output=emit,
+            )
+            client.capabilities = self.capabilities
+            app = BatteryOptimizerApp(client=client, state_dir=self.state_dir)
+            cli = BatteryOptimizerCLI(app=app, output=emit, input_fn=self._refuse_input)
+            exit_code = cli.run_command(args)
+        except Exception as exc:
+            # One broken device must not take down the rest of the rack.
+            emit(f"Error: {exc}")
+            exit_code = 1
+        duration = time.monotonic() - started
+
+        error = ""
+        if exit_code != 0:
+            errors = [line for line in lines if line.startswith("Error:")]
+            error = errors[-1] if errors else (lines[-1] if lines else "")
+        return DeviceRunResult(
+            serial=serial,
+            exit_code=exit_code,
+            duration=duration,
+            error=error,
+            lines=lines,
+        )
+
+    def run(self, serials: Sequence[str], args: argparse.Namespace) -> List[DeviceRunResult]:
+        jobs = min(self.jobs, len(serials)) or 1
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="fleet") as pool:
+            futures = [pool.submit(self.run_device, serial, args) for serial in serials]
+            return [future.result() for future in futures]
+
+def run_fleet(
+    args: argparse.Namespace,
+    runner: CommandRunner,
+    state_dir: Path,
+    output: Callable[[str], None] = print,
+) -> int:
+    if not args.command:
+        output("Error: --all-devices/--serials require a subcommand.")
+        return 1
+    if args.serial:
+        output("Error: --serial cannot be combined with --all-devices/--serials.")
+        return 1
+
+    serials = parse_serials(args.serials)
+    if args.all_devices:
+        try:
+            ready = discover_ready_serials(runner, output)
+        except ValueError as exc:
+            output(f"Error: {exc}")
+            return 1
+        serials = ready if not serials else [serial for serial in ready if serial in serials]
+    if not serials:
+        output("No authorized online device is available.")
+        return 1
+    # Without `{serial}`, every device would write or read the same plan file.
+    plan_path = getattr(args, "out", None) or getattr(args, "plan_file", None)
+    if plan_path and len(serials) > 1 and "{serial}" not in plan_path:
+        output("Error: with several devices the plan file path must contain `{serial}`.")
+        return 1
+
+    fleet = FleetRunner(
+        runner=runner,
+        state_dir=state_dir,
+        jobs=args.jobs,
+        dry_run=args.dry_run,
+        output=output,
+        capabilities=CapabilityCache(
+            state_dir / CAPABILITIES_FILE, refresh=args.refresh_capabilities
+        ),
+    )
+    results = fleet.run(serials, args)
+    output("")
+    for line in format_results_table(results):
+        output(line)
+    succeeded = sum(1 for result in results if result.ok)
+    output(f"{succeeded}/{len(results)} devices succeeded.")
+    return fleet_exit_code(results)
@@ -0,0 +1,314 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Sequence, Tuple, TypeVar
+from .adb import CommandError, CommandResult, CommandRunner
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+NO_OPERATION = "(none)"
+# Upper bounds in milliseconds; the last bucket catches everything slower.
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+# Sub-commands are part of the class for these tools (`settings get`, `cmd appops set`).
+_TWO_WORD_TOOLS = {"settings", "device_config", "dumpsys", "am", "pm", "appops", "content", "wm"}
+
+_current_operation: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar(
+    "abo_operation", default=()
+)
+
+def current_operation() -> str:
+    return "/".join(_current_operation.get()) or NO_OPERATION
+
+@contextmanager
+def operation_scope(name: str) -> Iterator[None]:
+    """Attribute adb calls made inside the block to `name`.
+
+    Scopes nest, so a diagnose run inside smart_restrict is reported as
+    `smart_restrict/diagnose`.
+    """
+    token = _current_operation.set(_current_operation.get() + (name,))
+    try:
+        yield
+    finally:
+        _current_operation.reset(token)
+
+def instrumented_operation(name: str) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with operation_scope(name):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+def _shell_words(args: Sequence[str]) -> Optional[List[str]]:
+    args = list(args)
+    if not args or args[0] != "adb":
+        return None
+    rest = args[1:]
+    if len(rest) >= 2 and rest[0] == "-s":
+        rest = rest[2:]
+    if rest and rest[0] == "shell":
+        words: List[str] = []
+        for arg in rest[1:]:
+            words.extend(arg.split())
+        return words
+    return None
+
+def classify_command(args: Sequence[str], input_data: Optional[str] = None) -> str:
+    """Normalize an invocation to a command class such as `settings get`."""
+    words = _shell_words(args)
+    if words is None:
+        args = list(args)
+        if args and args[0] == "adb":
+            rest = args[1:]
+            if len(rest) >= 2 and rest[0] == "-s":
+                rest = rest[2:]
+            return " ".join(["adb"] + rest[:1])
+        return args[0] if args else ""
+    if not words:
+        return "shell script" if input_data else "shell"
+    if words[0] == "cmd" and len(words) >= 3:
+        return " ".join(words[:3])
+    if words[0] in _TWO_WORD_TOOLS and len(words) >= 2 and not words[1].startswith("-"):
+        return " ".join(words[:2])
+    return words[0]
+
+def _bucket_index(seconds: float) -> int:
+    millis = seconds * 1000
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if millis <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS) - 1
+
+@dataclass
+class CommandRecord:
+    operation: str
+    command_class: str
+    seconds: float
+    stdout_bytes: int
+    stderr_bytes: int
+    returncode: int
+    stdin_bytes: int = 0
+
+@dataclass
+class CommandClassStats:
+    count: int = 0
+    failures: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+    stdin_bytes: int = 0
+    histogram: List[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS_MS))
+
+    def add(self, record: CommandRecord) -> None:
+        self.count += 1
+        if record.returncode != 0:
+            self.failures += 1
+        self.total_seconds += record.seconds
+        self.max_seconds = max(self.max_seconds, record.seconds)
+        self.stdout_bytes += record.stdout_bytes
+        self.stderr_bytes += record.stderr_bytes
+        self.stdin_bytes += record.stdin_bytes
+        self.histogram[_bucket_index(record.seconds)] += 1
+
+    def percentile_ms(self, fraction: float) -> float:
+        """Upper bound of the histogram bucket holding the given percentile."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen >= target:
+                bound = LATENCY_BUCKETS_MS[index]
+                return bound if bound != float("inf") else self.max_seconds * 1000
+        return self.max_seconds * 1000
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "stdout_bytes": self.stdout_bytes,
+            "stderr_bytes": self.stderr_bytes,
+            "stdin_bytes": self.stdin_bytes,
+            "histogram_ms": {
+                ("inf" if bound == float("inf") else str(int(bound))): count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.histogram)
+            },
+        }
+
+@dataclass
+class OperationStats:
+    commands: Dict[str, CommandClassStats] = field(default_factory=dict)
+
+    @property
+    def round_trips(self) -> int:
+        return sum(stats.count for stats in self.commands.values())
+
+class RunnerStats:
+    """Thread-safe aggregate of CommandRecords by operation and command class."""
+
+    def __init__(self, keep_records: bool = False) -> None:
+        self.keep_records = keep_records
+        self.records: List[CommandRecord] = []
+        self.operations: Dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, name: str) -> OperationStats:
+        stats = self.operations.get(name)
+        if stats is None:
+            stats = self.operations[name] = OperationStats()
+        return stats
+
+    def record(self, record: CommandRecord) -> None:
+        with self._lock:
+            if self.keep_records:
+                self.records.append(record)
+            commands = self._operation(record.operation).commands
+            stats = commands.get(record.command_class)
+            if stats is None:
+                stats = commands[record.command_class] = CommandClassStats()
+            stats.add(record)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.records.clear()
+            self.operations.clear()
+
+    def total_round_trips(self) -> int:
+        with self._lock:
+            return sum(stats.round_trips for stats in self.operations.values())
+
+    def total_bytes(self) -> int:
+        """stdin + stdout + stderr bytes moved over adb across all operations."""
+        with self._lock:
+            return sum(
+                item.stdin_bytes + item.stdout_bytes + item.stderr_bytes
+                for stats in self.operations.values()
+                for item in stats.commands.values()
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    "round_trips": stats.round_trips,
+                    "commands": {
+                        command_class: command_stats.as_dict()
+                        for command_class, command_stats in sorted(stats.commands.items())
+                    },
+                }
+                for name, stats in sorted(self.operations.items())
+            }
+
+    def format_table(self) -> List[str]:
+        with self._lock:
+            lines = ["OPERATION / COMMAND                         CALLS   FAIL   TOTAL ms   p50 ms   p95 ms   MAX ms   OUT KiB"]
+            for name, stats in sorted(self.operations.items()):
+                total_ms = sum(item.total_seconds for item in stats.commands.values()) * 1000
+                lines.append(f"{name} ({stats.round_trips} round trips, {total_ms:.0f} ms in adb)")
+                ordered = sorted(
+                    stats.commands.items(), key=lambda item: item[1].total_seconds, reverse=True
+                )
+                for command_class, item in ordered:
+                    lines.append(
+                        f"  {command_class[:40].ljust(40)}  {item.count:5d}  {item.failures:5d}  "
+                        f"{item.total_seconds * 1000:9.1f}  {item.percentile_ms(0.5):7.0f}  "
+                        f"{item.percentile_ms(0.95):7.0f}  {item.max_seconds * 1000:7.1f}  "
+                        f"{item.stdout_bytes / 1024:8.1f}"
+                    )
+            return lines
+
+class InstrumentedRunner(CommandRunner):
+    """Wraps a CommandRunner and records latency, bytes and exit code per call."""
+
+    def __init__(self, delegate: CommandRunner, stats: Optional[RunnerStats] = None) -> None:
+        self.delegate = delegate
+        self.stats = stats or RunnerStats()
+
+    def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        started = time.perf_counter()
+        result: Optional[CommandResult] = None
+        try:
+            result = self.delegate.run(args, input_data=input_data, timeout=timeout)
+            return result
+        except CommandError as exc:
+            result = exc.result
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            if result is None:
+                result = CommandResult(returncode=-1, stdout="", stderr="")
+            self.stats.record(
+                CommandRecord(
+                    operation=current_operation(),
+                    command_class=classify_command(args, input_data),
+                    seconds=seconds,
+                    stdout_bytes=len(result.stdout.encode("utf-8")),
+                    stderr_bytes=len(result.stderr.encode("utf-8")),
+                    returncode=result.returncode,
+                    stdin_bytes=len(input_data.encode("utf-8")) if input_data else 0,
+                )
+            )
+
+    def stream_lines(
+        self,
+        args: Sequence[str],
+        timeout: Optional[float] = None,
+        input_data: Optional[str] = None,
+    ) -> Generator[str, None, CommandResult]:
+        operation = current_operation()
+        started = time.perf_counter()
+        stdout_bytes = 0
+        result: Optional[CommandResult] = None
+        try:
+            if input_data is None:
+                stream = self.delegate.stream_lines(args, timeout=timeout)
+            else:
+                stream = self.delegate.stream_lines(args, timeout=timeout, input_data=input_data)
+            while True:
+                try:
+                    line = next(stream)
+                except StopIteration as stop:
+                    result = stop.value
+                    return result
+                stdout_bytes += len(line.encode("utf-8")) + 1
+                yield line
+        except CommandError as exc:
+            result = exc.result
+            raise
+        finally:
+            if result is None:
+                result = CommandResult(returncode=-1, stdout="", stderr="")
+            self.stats.record(
+                CommandRecord(
+                    operation=operation,
+                    command_class=classify_command(args, input_data),
+                    seconds=time.perf_counter() - started,
+                    stdout_bytes=stdout_bytes,
+                    stderr_bytes=len(result.stderr.encode("utf-8")),
+                    returncode=result.returncode,
+                    stdin_bytes=len(input_data.encode("utf-8")) if input_data else 0,
+                )
+            )
+
+    def which(self, name: str) -> Optional[str]:
+        return self.delegate.which(name)
+
+    def close(self) -> None:
+        close = getattr(self.delegate, "close", None)
+        if close is not None:
+            close()
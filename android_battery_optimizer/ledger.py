@@ -1,42 +1,101 @@
-from typing import Optional, TypedDict, Union
-
-class SettingLedgerEntry(TypedDict):
-    type: str
-    namespace: str
-    key: str
-    prior_value: Optional[str]
-    new_value: Optional[str]
-
-class DeviceConfigLedgerEntry(TypedDict):
-    type: str
-    namespace: str
-    key: str
-    prior_value: Optional[str]
-    new_value: Optional[str]
-
-class AppOpLedgerEntry(TypedDict):
-    type: str
-    package: str
-    op: str
-    prior_value: Optional[str]
-    new_value: Optional[str]
-
-class StandbyBucketLedgerEntry(TypedDict):
-    type: str
-    package: str
-    prior_value: Optional[str]
-    new_value: Optional[str]
-
-class PackageEnabledLedgerEntry(TypedDict):
-    type: str
-    package: str
-    prior_value: Optional[bool]
-    new_value: Optional[bool]
-
-AnyLedgerEntry = Union[
-    SettingLedgerEntry,
-    DeviceConfigLedgerEntry,
-    AppOpLedgerEntry,
-    StandbyBucketLedgerEntry,
-    PackageEnabledLedgerEntry
-]
+import enum
+from typing import Any, Dict, Mapping, Tuple, Union
+
+from .users import DEFAULT_USER, package_key
+
+class EntryKind(str, enum.Enum):
+    SETTING = "setting"
+    DEVICE_CONFIG = "device_config"
+    APPOP = "appop"
+    STANDBY_BUCKET = "standby_bucket"
+    PACKAGE_ENABLED = "package_enabled"
+
+# CPython 3.11 resolves `EntryKind.X` several times slower than a module
+# global, so code that runs once per entry compares kinds against these.
+SETTING = EntryKind.SETTING
+DEVICE_CONFIG = EntryKind.DEVICE_CONFIG
+APPOP = EntryKind.APPOP
+STANDBY_BUCKET = EntryKind.STANDBY_BUCKET
+PACKAGE_ENABLED = EntryKind.PACKAGE_ENABLED
+
+# Kinds stored under `namespace`/`key` rather than a package.
+NAMESPACE_KINDS = (SETTING, DEVICE_CONFIG)
+
+# One mutation recorded in a transaction: its target, prior and new value.
+# A transaction holds one entry per batched command, so entries are plain
+# tuples, read with the field indexes below: they are cheaper to build than
+# dicts or records and the garbage collector stops tracking them.
+# `user` is the Android user of a package entry; 0 for the device owner.
+LedgerEntry = Tuple[EntryKind, str, str, str, str, int, Any, Any]
+KIND, NAMESPACE, KEY, PACKAGE, OP, USER, PRIOR_VALUE, NEW_VALUE = range(8)
+
+def setting_entry(namespace: str, key: str, prior_value: Any = None, new_value: Any = None) -> LedgerEntry:
+    return (SETTING, namespace, key, "", "", DEFAULT_USER, prior_value, new_value)
+
+def device_config_entry(namespace: str, key: str, prior_value: Any = None, new_value: Any = None) -> LedgerEntry:
+    return (DEVICE_CONFIG, namespace, key, "", "", DEFAULT_USER, prior_value, new_value)
+
+def appop_entry(
+    package: str, op: str, user: int = DEFAULT_USER, prior_value: Any = None, new_value: Any = None
+) -> LedgerEntry:
+    return (APPOP, "", "", package, op, user, prior_value, new_value)
+
+def standby_bucket_entry(
+    package: str, user: int = DEFAULT_USER, prior_value: Any = None, new_value: Any = None
+) -> LedgerEntry:
+    return (STANDBY_BUCKET, "", "", package, "", user, prior_value, new_value)
+
+def package_enabled_entry(
+    package: str, user: int = DEFAULT_USER, prior_value: Any = None, new_value: Any = None
+) -> LedgerEntry:
+    return (PACKAGE_ENABLED, "", "", package, "", user, prior_value, new_value)
+
+def entry_from_mapping(fields: Mapping[str, Any]) -> LedgerEntry:
+    """Build an entry from the dict layout (`{"type": "appop", ...}`)."""
+    kind = EntryKind(fields["type"])
+    user = int(fields.get("user", DEFAULT_USER))
+    prior_value = fields.get("prior_value")
+    new_value = fields.get("new_value")
+    if kind in NAMESPACE_KINDS:
+        return (kind, str(fields["namespace"]), str(fields["key"]), "", "", user, prior_value, new_value)
+    op = str(fields["op"]) if kind is APPOP else ""
+    return (kind, "", "", str(fields["package"]), op, user, prior_value, new_value)
+
+def entry_as_dict(entry: LedgerEntry) -> Dict[str, object]:
+    kind = entry[KIND]
+    fields: Dict[str, object] = {"type": kind.value}
+    if kind in NAMESPACE_KINDS:
+        fields["namespace"] = entry[NAMESPACE]
+        fields["key"] = entry[KEY]
+    else:
+        fields["package"] = entry[PACKAGE]
+        if kind is APPOP:
+            fields["op"] = entry[OP]
+        # `user` is only recorded for users other than 0.
+        if entry[USER] != DEFAULT_USER:
+            fields["user"] = entry[USER]
+    fields["prior_value"] = entry[PRIOR_VALUE]
+    fields["new_value"] = entry[NEW_VALUE]
+    return fields
+
+# Entries may still be given in the dict layout, e.g. by older callers.
+AnyLedgerEntry = Union[LedgerEntry, Mapping[str, Any]]
+
+def ledger_entry(entry: AnyLedgerEntry) -> LedgerEntry:
+    if isinstance(entry, tuple):
+        return entry
+    return entry_from_mapping(entry)
+
+def entry_target(entry: LedgerEntry) -> str:
+    """What an entry changes: `namespace/key` for settings, the package key otherwise."""
+    if entry[KIND] in NAMESPACE_KINDS:
+        return f"{entry[NAMESPACE]}/{entry[KEY]}"
+    return package_key(entry[PACKAGE], entry[USER])
+
+_KIND_VALUES = {kind: kind.value for kind in EntryKind}
+
+def change_id(entry: LedgerEntry) -> str:
+    """Identifies the value an entry changes, e.g. `appop:<package>:<op>`."""
+    if entry[KIND] is APPOP:
+        return f"appop:{entry_target(entry)}:{entry[OP]}"
+    return f"{_KIND_VALUES[entry[KIND]]}:{entry_target(entry)}"
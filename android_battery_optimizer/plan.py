@@ -0,0 +1,253 @@
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from .ledger import (
+    KEY,
+    KIND,
+    NAMESPACE,
+    NAMESPACE_KINDS,
+    NEW_VALUE,
+    OP,
+    PACKAGE,
+    USER,
+    EntryKind,
+    LedgerEntry,
+    entry_as_dict,
+    entry_from_mapping,
+)
+from .recorder import StateRecorder
+from .users import package_key
+
+if TYPE_CHECKING:
+    from .app import BatteryOptimizerApp
+
+PLAN_VERSION = 1
+
+# Operations a plan can be compiled for, by CLI subcommand name.
+PLAN_OPERATIONS = (
+    "apply-experimental",
+    "apply-samsung-experimental",
+    "restrict-apps",
+    "smart-restrict",
+)
+
+# Package state kind (see snapshot.PACKAGE_DATA_KINDS) read for each entry kind.
+_PACKAGE_DATA_KIND = {
+    EntryKind.APPOP: "appops",
+    EntryKind.STANDBY_BUCKET: "standby_bucket",
+    EntryKind.PACKAGE_ENABLED: "enabled",
+}
+
+@dataclass
+class PlanEstimate:
+    """Expected cost of applying a plan.
+
+    `round_trips` counts one read per prefetched kind of target, then each
+    batch script and its verification readback. `bytes` is the size of
+    the batch scripts sent to the device.
+    """
+
+    round_trips: int = 0
+    bytes: int = 0
+
+@dataclass
+class Plan:
+    """The changes an operation would make, with the command for each.
+
+    Compiled against one device's current state by `compile_plan`, so it
+    only holds changes the device does not have yet. It can be saved,
+    reviewed, and applied to the same device later with `apply_plan`.
+    """
+
+    operation: str
+    # Serial and build fingerprint of the device the plan was compiled against.
+    device: Dict[str, str]
+    entries: List[LedgerEntry] = field(default_factory=list)
+    commands: List[str] = field(default_factory=list)
+    # Changes the operation makes that the device already had.
+    skipped: int = 0
+    estimate: PlanEstimate = field(default_factory=PlanEstimate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": PLAN_VERSION,
+            "operation": self.operation,
+            "device": self.device,
+            "skipped": self.skipped,
+            "estimate": {"round_trips": self.estimate.round_trips, "bytes": self.estimate.bytes},
+            "steps": [
+                {"change": entry_as_dict(entry), "command": command}
+                for entry, command in zip(self.entries, self.commands)
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Mapping[str, Any]) -> "Plan":
+        if raw.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version: {raw.get('version')!r}")
+        operation = raw.get("operation")
+        device = raw.get("device")
+        steps = raw.get("steps")
+        estimate = raw.get("estimate") or {}
+        if (
+            operation not in PLAN_OPERATIONS
+            or not isinstance(device, dict)
+            or not isinstance(steps, list)
+            or not isinstance(estimate, dict)
+        ):
+            raise ValueError("Invalid plan: expected operation, device, estimate and steps.")
+        try:
+            entries = [entry_from_mapping(step["change"]) for step in steps]
+            commands = [str(step["command"]) for step in steps]
+            return cls(
+                operation=operation,
+                device={str(key): str(value) for key, value in device.items()},
+                entries=entries,
+                commands=commands,
+                skipped=int(raw.get("skipped", 0)),
+                estimate=PlanEstimate(int(estimate.get("round_trips", 0)), int(estimate.get("bytes", 0))),
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid plan step: {exc}") from exc
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2) + "\n", encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "Plan":
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as exc:
+            raise ValueError(f"Could not read plan {path}: {exc}") from exc
+        if not isinstance(raw, dict):
+            raise ValueError(f"Invalid plan {path}: expected a JSON object.")
+        return cls.from_dict(raw)
+
+def estimate_plan(
+    entries: List[LedgerEntry], commands: List[str], chunk_size: Optional[int] = None, verify: bool = True
+) -> PlanEstimate:
+    if not entries:
+        return PlanEstimate()
+    reads = int(any(entry[KIND] in NAMESPACE_KINDS for entry in entries))
+    reads += int(any(entry[KIND] not in NAMESPACE_KINDS for entry in entries))
+    batches = math.ceil(len(commands) / chunk_size) if chunk_size else 1
+    # Each command is sent as one line of the batch script.
+    script_bytes = sum(
+        len(f'{command} && echo "SUCCESS_{index}" || exit $?\n'.encode("utf-8"))
+        for index, command in enumerate(commands)
+    )
+    return PlanEstimate(round_trips=reads + batches * (2 if verify else 1), bytes=script_bytes)
+
+def compile_plan(app: "BatteryOptimizerApp", operation: str, run: Callable[[], object]) -> Plan:
+    """Run `run`, one of the app's operations, and return the changes it makes.
+
+    The operation runs in dry-run mode with the recorder collecting its
+    batch, so the device is read but neither it nor the state file is
+    changed.
+    """
+    client = app.client
+    recorder = app.recorder
+    dry_run = client.dry_run
+    steps: List[Tuple[LedgerEntry, str]] = []
+    client.dry_run = True
+    recorder.plan_steps = steps
+    try:
+        run()
+    finally:
+        recorder.plan_steps = None
+        client.dry_run = dry_run
+    metadata = client.get_device_metadata_with_fallback()
+    entries = [entry for entry, _ in steps]
+    commands = [command for _, command in steps]
+    return Plan(
+        operation=operation,
+        device={"serial": client.serial or "", "fingerprint": metadata.get("fingerprint") or ""},
+        entries=entries,
+        commands=commands,
+        skipped=len(recorder.skipped),
+        estimate=estimate_plan(entries, commands, recorder.chunk_size, recorder.verify),
+    )
+
+def apply_plan(app: "BatteryOptimizerApp", plan: Plan) -> None:
+    """Apply exactly the changes in `plan` in one transaction.
+
+    Prior values are read again before the batch runs, so the rollback
+    snapshot holds what the device had at apply time. The batch is only
+    sent if its commands are the plan's commands.
+    """
+    client = app.client
+    planned_serial = plan.device.get("serial")
+    if planned_serial and client.serial != planned_serial:
+        raise ValueError(f"Plan device mismatch: current={client.serial}, planned={planned_serial}")
+    client.revalidate_device_properties()
+    current_fp = client.get_device_metadata_with_fallback().get("fingerprint") or ""
+    planned_fp = plan.device.get("fingerprint") or ""
+    if planned_fp and current_fp and current_fp != planned_fp:
+        raise ValueError(f"Plan fingerprint mismatch: current={current_fp}, planned={planned_fp}")
+
+    recorder = app.recorder
+    skip_unchanged = recorder.skip_unchanged
+    recorder.skip_unchanged = False
+    try:
+        with recorder.transaction():
+            _prefetch(recorder, plan.entries)
+            for entry in plan.entries:
+                _APPLIERS[entry[KIND]](recorder, entry)
+            _check_commands(plan, recorder.batched_commands())
+    finally:
+        recorder.skip_unchanged = skip_unchanged
+
+def _check_commands(plan: Plan, commands: List[str]) -> None:
+    if len(commands) != len(plan.commands):
+        raise ValueError(f"Plan has {len(plan.commands)} commands but applying it builds {len(commands)}.")
+    for index, (planned, built) in enumerate(zip(plan.commands, commands)):
+        if planned != built:
+            raise ValueError(f"Plan step {index} command does not match its change: planned={planned!r}, built={built!r}")
+
+def _prefetch(recorder: StateRecorder, entries: List[LedgerEntry]) -> None:
+    settings = sorted({entry[NAMESPACE] for entry in entries if entry[KIND] is EntryKind.SETTING})
+    device_config = sorted({entry[NAMESPACE] for entry in entries if entry[KIND] is EntryKind.DEVICE_CONFIG})
+    if settings or device_config:
+        recorder.prefetch_namespaces(settings=settings, device_config=device_config)
+    package_entries = [entry for entry in entries if entry[KIND] not in NAMESPACE_KINDS]
+    if package_entries:
+        kinds = list(dict.fromkeys(_PACKAGE_DATA_KIND[entry[KIND]] for entry in package_entries))
+        ops = sorted({entry[OP] for entry in package_entries if entry[KIND] is EntryKind.APPOP})
+        recorder.prefetch_packages(
+            [package_key(entry[PACKAGE], entry[USER]) for entry in package_entries],
+            kinds=kinds,
+            appops_ops=ops or None,
+        )
+
+def _apply_setting(recorder: StateRecorder, entry: LedgerEntry) -> None:
+    if entry[NEW_VALUE] is None:
+        recorder.delete_setting(entry[NAMESPACE], entry[KEY])
+    else:
+        recorder.put_setting(entry[NAMESPACE], entry[KEY], entry[NEW_VALUE])
+
+def _apply_device_config(recorder: StateRecorder, entry: LedgerEntry) -> None:
+    if entry[NEW_VALUE] is None:
+        recorder.delete_device_config(entry[NAMESPACE], entry[KEY])
+    else:
+        recorder.put_device_config(entry[NAMESPACE], entry[KEY], entry[NEW_VALUE])
+
+def _apply_appop(recorder: StateRecorder, entry: LedgerEntry) -> None:
+    recorder.set_appop(entry[PACKAGE], entry[OP], str(entry[NEW_VALUE]), user=entry[USER])
+
+def _apply_standby_bucket(recorder: StateRecorder, entry: LedgerEntry) -> None:
+    recorder.set_standby_bucket(entry[PACKAGE], str(entry[NEW_VALUE]), user=entry[USER])
+
+def _apply_package_enabled(recorder: StateRecorder, entry: LedgerEntry) -> None:
+    recorder.set_package_enabled(entry[PACKAGE], bool(entry[NEW_VALUE]), user=entry[USER])
+
+_APPLIERS: Dict[EntryKind, Callable[[StateRecorder, LedgerEntry], None]] = {
+    EntryKind.SETTING: _apply_setting,
+    EntryKind.DEVICE_CONFIG: _apply_device_config,
+    EntryKind.APPOP: _apply_appop,
+    EntryKind.STANDBY_BUCKET: _apply_standby_bucket,
+    EntryKind.PACKAGE_ENABLED: _apply_package_enabled,
+}
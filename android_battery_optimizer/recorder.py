@@ -1,17 +1,53 @@
 import re
+import threading
+import time
 from contextlib import contextmanager
-from typing import Callable, Dict, List, Optional, Sequence, cast, Set
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, cast
 
-from .adb import AdbClient, CommandError
+from .adb import AdbClient, CommandError, CommandResult
+from .async_adb import call_concurrently
 from .state import StateStore
 from .operations import STANDBY_BUCKET_MAP, normalize_restorable_bucket
 
-from .ledger import AnyLedgerEntry
+from .ledger import (
+    APPOP,
+    KEY,
+    KIND,
+    NAMESPACE,
+    NAMESPACE_KINDS,
+    NEW_VALUE,
+    OP,
+    PACKAGE,
+    PACKAGE_ENABLED,
+    PRIOR_VALUE,
+    STANDBY_BUCKET,
+    USER,
+    AnyLedgerEntry,
+    EntryKind,
+    LedgerEntry,
+    appop_entry,
+    change_id,
+    device_config_entry,
+    entry_as_dict,
+    entry_target,
+    ledger_entry,
+    package_enabled_entry,
+    setting_entry,
+    standby_bucket_entry,
+)
 from .snapshot import (
     SnapshotError,
     read_settings_namespace,
     read_device_config_namespace,
-    prefetch_package_states
+    PACKAGE_DATA_KINDS,
+    prefetch_package_states,
+    prefetch_packages,
+    read_appops,
+    read_package_states,
+    read_namespaces,
+    read_readback,
+    Readback,
 )
 from .verification import (
     VerificationError,
@@ -22,13 +58,114 @@ from .verification import (
     verify_standby_bucket,
     verify_package_enabled
 )
-from .rollback import perform_rollback, restore_appop_value, restore_state
+from .rollback import (
+    package_enabled_command,
+    perform_rollback,
+    perform_rollback_batch,
+    restore_appop_value,
+    restore_state,
+)
+from .users import DEFAULT_USER, package_key, user_args
+
+PACKAGE_USER_ID = str(DEFAULT_USER)
+
+# Tool of each namespace kind; its snapshots live in the state section of
+# the same name. Package kinds other than appops use one field of a package.
+_NAMESPACE_TOOLS = {EntryKind.SETTING: "settings", EntryKind.DEVICE_CONFIG: "device_config"}
+_PACKAGE_FIELDS = {EntryKind.STANDBY_BUCKET: "standby_bucket", EntryKind.PACKAGE_ENABLED: "enabled"}
+
+# Result line of one command of a batch script: SUCCESS_<i> or FAIL_<i>:<status>.
+BATCH_MARKER_RE = re.compile(r"(?:SUCCESS_(\d+)|FAIL_(\d+):(\d+))")
+
+# Each bulk readback re-reads whole dumps, so while a batch streams at most
+# one runs per interval; a final one covers whatever finished after it.
+PIPELINED_VERIFY_INTERVAL_SECONDS = 0.25
+
+@dataclass
+class BatchProgress:
+    """Commands of a batch script finished so far, as reported to `on_progress`."""
+
+    done: int
+    total: int
+    failed: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        """Commands finished per second."""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds until the script finishes; None before the first command."""
+        if not self.done:
+            return None
+        return (self.total - self.done) / self.rate if self.rate else 0.0
+
+class _PipelinedVerifier:
+    """Verifies ledger entries on a second thread as their commands finish.
+
+    Entries that finish within `interval` of the last verification are
+    verified together by the next one; closing verifies the rest at once.
+    """
+
+    def __init__(
+        self,
+        verify: Callable[[Sequence[LedgerEntry]], None],
+        interval: float = PIPELINED_VERIFY_INTERVAL_SECONDS,
+    ) -> None:
+        self._verify = verify
+        self._interval = interval
+        self._pending: List[LedgerEntry] = []
+        self._closed = False
+        self.error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
 
-PACKAGE_USER_ID = "0"
+    def submit(self, entry: LedgerEntry) -> None:
+        with self._condition:
+            self._pending.append(entry)
+            if len(self._pending) == 1:
+                self._condition.notify()
+
+    def close(self) -> None:
+        """Wait until every submitted entry has been verified."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self) -> None:
+        last = time.monotonic()
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                while not self._closed:
+                    remaining = last + self._interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._pending:
+                    return
+                entries, self._pending = self._pending, []
+            last = time.monotonic()
+            # Entries arrive in ledger order, so the first error is the one
+            # sequential verification would have reported.
+            if self.error is None:
+                try:
+                    self._verify(entries)
+                except BaseException as exc:
+                    self.error = exc
 
 class PartialBatchError(RuntimeError):
-    def __init__(self, failed_packages: Set[str]) -> None:
+    def __init__(
+        self, failed_packages: Set[str], failures: Sequence[Tuple[LedgerEntry, int]] = ()
+    ) -> None:
         self.failed_packages = failed_packages
+        # (ledger entry, exit status) of each command that failed.
+        self.failures = list(failures)
         super().__init__(f"Batch transaction had partial package failures: {failed_packages}")
 
 class StateRecorder:
@@ -36,17 +173,49 @@ class StateRecorder:
         self.client = client
         self.store = store
         self.verify = True
+        # Commands per dispatched script; None sends a transaction's batch
+        # as one script.
+        self.chunk_size: Optional[int] = None
+        # Run every batched command even if some fail; failed ones are
+        # dropped and reported with PartialBatchError.
+        self.continue_on_error = False
+        # Called with a BatchProgress as each batched command finishes. When
+        # set, the batch script's output is streamed and finished commands are
+        # verified while later ones still run.
+        self.on_progress: Optional[Callable[[BatchProgress], None]] = None
+        # Minimum seconds between bulk readbacks while a batch streams.
+        self.verify_interval = PIPELINED_VERIFY_INTERVAL_SECONDS
+        # Inside a transaction, changes the device already holds are left
+        # out of the batch; they are listed in `skipped` afterwards.
+        self.skip_unchanged = True
+        self.skipped: List[LedgerEntry] = []
+        # Set while a plan is compiled: each transaction's (entry, command)
+        # pairs are appended here instead of being dispatched.
+        self.plan_steps: Optional[List[Tuple[LedgerEntry, str]]] = None
+        # change_id -> new value of the changes queued in this transaction.
+        self._planned_values: Dict[str, object] = {}
+        self._batch_failures: List[Tuple[LedgerEntry, int]] = []
+        # change_ids of the snapshots this transaction wrote; the others
+        # belong to earlier runs.
+        self._created_snapshots: Set[str] = set()
         self._in_transaction = False
+        self._batch_dispatched = False
+        self._batch_applied = False
         self._batched_commands: List[str] = []
         self._settings_cache: Dict[str, Dict[str, str]] = {}
         self._device_config_cache: Dict[str, Dict[str, str]] = {}
         self._appops_cache: Dict[str, Dict[str, str]] = {}
         self._standby_bucket_cache: Dict[str, str] = {}
         self._package_enabled_cache: Dict[str, bool] = {}
-        self._ledger: List[AnyLedgerEntry] = []
+        self._ledger: List[LedgerEntry] = []
         self._prefetch_package_enabled_success = False
         self._prefetch_appops_success = False
         self._prefetch_standby_bucket_success = False
+        # Ops the appops prefetch was limited to; None means every op was read.
+        self._prefetched_appops: Optional[Set[str]] = None
+        # kind -> packages read with per-package queries; other packages of
+        # that kind are read on first use.
+        self._targeted_packages: Dict[str, Set[str]] = {}
 
     @staticmethod
     def _normalize_value(value: Optional[str]) -> Optional[str]:
@@ -63,47 +232,250 @@ class StateRecorder:
         self._settings_cache.clear()
         self._device_config_cache.clear()
         self._appops_cache.clear()
+        self._prefetched_appops = None
+        self._targeted_packages.clear()
         self._standby_bucket_cache.clear()
         self._package_enabled_cache.clear()
         self._ledger = []
-        batch_dispatched = False
-        batch_applied = False
+        self._batch_dispatched = False
+        self._batch_applied = False
+        self._batch_failures = []
+        self._created_snapshots = set()
+        self.skipped = []
+        self._planned_values = {}
 
         try:
             with self.store.transaction():
                 yield
-                if self._batched_commands:
-                    script_lines = []
-                    for i, cmd in enumerate(self._batched_commands):
-                        script_lines.append(f"{cmd} && echo \"SUCCESS_{i}\" || exit $?")
-                    script = "\n".join(script_lines)
-                    batch_dispatched = True
-                    self.client.shell([], mutate=True, input_data=script)
-                    batch_applied = True
-                    # If we reach here, batch shell succeeded.
-                    if self.verify:
-                        for entry in self._ledger:
-                            self._verify_entry(entry)
+                if self.plan_steps is not None:
+                    self.plan_steps.extend(zip(self._ledger, self._batched_commands))
+                    self.store.rollback()
+                # A checkpoint is settled even when every change was skipped.
+                elif self.chunk_size and (
+                    len(self._batched_commands) > self.chunk_size or self.store.data.get("checkpoint")
+                ):
+                    self._apply_in_chunks(self.chunk_size)
+                elif self._batched_commands:
+                    self._apply_batch()
         except Exception as exc:
-            if batch_applied:
+            if self._batch_applied:
                 successful_indices = list(range(len(self._ledger)))
                 self._revert_ledger(successful_indices)
-            elif batch_dispatched:
+            elif self._batch_dispatched:
                 stdout = getattr(getattr(exc, "result", None), "stdout", "")
                 successful_indices = [
                     int(m.group(1)) for m in re.finditer(r"SUCCESS_(\d+)", stdout)
                 ]
                 self._revert_ledger(successful_indices)
             raise
+        else:
+            if self.skipped:
+                self.client.output(f"Skipped {len(self.skipped)} changes the device already had.")
+            if self._batch_failures:
+                failures = self._batch_failures
+                raise PartialBatchError({entry_target(entry) for entry, _ in failures}, failures)
         finally:
             self._in_transaction = False
             self._batched_commands = []
             self._settings_cache.clear()
             self._device_config_cache.clear()
             self._appops_cache.clear()
+            self._prefetched_appops = None
+            self._targeted_packages.clear()
             self._standby_bucket_cache.clear()
             self._package_enabled_cache.clear()
             self._ledger = []
+            self._planned_values = {}
+
+    def _apply_batch(self) -> None:
+        self._batch_dispatched = False
+        self._batch_applied = False
+        script_lines = []
+        for i, cmd in enumerate(self._batched_commands):
+            if self.continue_on_error:
+                script_lines.append(f"{cmd} && echo \"SUCCESS_{i}\" || echo \"FAIL_{i}:$?\"")
+            else:
+                script_lines.append(f"{cmd} && echo \"SUCCESS_{i}\" || exit $?")
+        script = "\n".join(script_lines)
+        self._batch_dispatched = True
+        if self.on_progress is not None and not self.client.dry_run:
+            self._stream_batch(script, self.on_progress)
+            return
+        result = self.client.shell([], mutate=True, input_data=script)
+        if self.continue_on_error and not self.client.dry_run:
+            self._drop_failed_commands(result)
+        self._batch_applied = True
+        # If we reach here, batch shell succeeded.
+        if self.verify:
+            self._verify_entries(self._ledger)
+
+    def _stream_batch(self, script: str, on_progress: Callable[[BatchProgress], None]) -> None:
+        # Wall time approaches max(apply, verify) rather than their sum.
+        total = len(self._batched_commands)
+        verifier = (
+            _PipelinedVerifier(self._verify_entries, self.verify_interval) if self.verify else None
+        )
+        lines: List[str] = []
+        done = failed = 0
+        started = time.perf_counter()
+        stream = self.client.stream_lines([], mutate=True, input_data=script)
+        try:
+            while True:
+                try:
+                    line = next(stream)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                lines.append(line)
+                match = BATCH_MARKER_RE.fullmatch(line.strip())
+                if match is None:
+                    continue
+                done += 1
+                if match.group(1) is not None:
+                    if verifier is not None:
+                        verifier.submit(self._ledger[int(match.group(1))])
+                else:
+                    failed += 1
+                on_progress(BatchProgress(done, total, failed, time.perf_counter() - started))
+        except CommandError as exc:
+            # The markers tell the caller which commands to roll back.
+            if exc.result is not None:
+                exc.result.stdout = "\n".join(lines)
+            raise
+        finally:
+            if verifier is not None:
+                verifier.close()
+        result.stdout = "\n".join(lines)
+        if self.continue_on_error:
+            self._drop_failed_commands(result)
+        self._batch_applied = True
+        if verifier is not None and verifier.error is not None:
+            raise verifier.error
+
+    def _drop_failed_commands(self, result: CommandResult) -> None:
+        # Failed commands changed nothing, so their ledger entries and
+        # snapshots go; the rest of the batch stays applied.
+        succeeded = {int(m.group(1)) for m in re.finditer(r"SUCCESS_(\d+)", result.stdout)}
+        failed = {int(m.group(1)): int(m.group(2)) for m in re.finditer(r"FAIL_(\d+):(\d+)", result.stdout)}
+        missing = set(range(len(self._batched_commands))) - succeeded - set(failed)
+        if missing:
+            raise CommandError(
+                f"Batch script reported no result for {len(missing)} commands", result=result
+            )
+        for i in sorted(failed):
+            entry = self._ledger[i]
+            self._batch_failures.append((entry, failed[i]))
+            # A snapshot from an earlier run still holds the original value.
+            if change_id(entry) in self._created_snapshots:
+                self._remove_snapshot_for_entry(entry)
+        self._batched_commands = [cmd for i, cmd in enumerate(self._batched_commands) if i not in failed]
+        self._ledger = [entry for i, entry in enumerate(self._ledger) if i not in failed]
+
+    def _apply_in_chunks(self, chunk_size: int) -> None:
+        """Apply the batch `chunk_size` commands at a time.
+
+        Each chunk's snapshots are written before it is dispatched, and its
+        changes are recorded in the state checkpoint once it has been
+        verified. A failed chunk is rolled back on its own; earlier chunks
+        stay applied, and running the same work again skips them.
+        """
+        checkpoint = cast(Dict[str, object], self.store.data.get("checkpoint") or {})
+        pending = [
+            (cmd, entry)
+            for cmd, entry in zip(self._batched_commands, self._ledger)
+            if not self._is_committed(checkpoint, entry)
+        ]
+        # Changes the planner skipped because the interrupted run made them
+        # count as resumed too.
+        resumed = len(self._ledger) - len(pending) + sum(
+            1 for entry in self.skipped if checkpoint.get(change_id(entry), object()) == entry[NEW_VALUE]
+        )
+        if resumed:
+            self.client.output(f"Resuming: {resumed} changes were applied by an earlier interrupted run.")
+        # The in-memory snapshots are rebuilt chunk by chunk from the ledger,
+        # so the state file never lists changes that were not dispatched.
+        self.store.rollback()
+        self.store.data["checkpoint"] = checkpoint
+
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            self._batched_commands = [cmd for cmd, _ in chunk]
+            self._ledger = [entry for _, entry in chunk]
+            for entry in self._ledger:
+                self._persist_entry_snapshot(entry)
+            self.store.commit()
+            try:
+                self._apply_batch()
+            except Exception:
+                if start:
+                    self.client.output(
+                        f"{start} changes from earlier chunks remain applied; run the command again "
+                        "to resume, or `revert` to undo them."
+                    )
+                raise
+            for entry in self._ledger:
+                checkpoint[change_id(entry)] = entry[NEW_VALUE]
+            self.store.commit()
+
+        self.store.data.pop("checkpoint", None)
+        self.store.save()
+
+    def _is_committed(self, checkpoint: Dict[str, object], entry: LedgerEntry) -> bool:
+        # The device must still show the change; anything reset since the
+        # interrupted run is applied again.
+        change = change_id(entry)
+        return (
+            change in checkpoint
+            and checkpoint[change] == entry[NEW_VALUE]
+            and self._value_matches(entry, entry[PRIOR_VALUE])
+        )
+
+    def _skip_unchanged(self, entry: LedgerEntry) -> bool:
+        """Whether `entry` can be left out of the batch: the device, or a change
+        already queued in this transaction, holds its new value.
+
+        Skipped entries get no snapshot, so an earlier snapshot of the same
+        value stays the one restored.
+        """
+        if not (self._in_transaction and self.skip_unchanged):
+            return False
+        change = change_id(entry)
+        if change in self._planned_values:
+            unchanged = self._planned_values[change] == entry[NEW_VALUE]
+        else:
+            unchanged = self._value_matches(entry, self._CURRENT_VALUE_READERS[entry[KIND]](self, entry))
+        if unchanged:
+            self.skipped.append(entry)
+        else:
+            self._planned_values[change] = entry[NEW_VALUE]
+        return unchanged
+
+    def _current_setting(self, entry: LedgerEntry) -> object:
+        return self._get_setting(entry[NAMESPACE], entry[KEY])
+
+    def _current_device_config(self, entry: LedgerEntry) -> object:
+        return self._get_device_config(entry[NAMESPACE], entry[KEY])
+
+    def _current_appop(self, entry: LedgerEntry) -> object:
+        return self._get_appop(entry[PACKAGE], entry[OP], entry[USER])
+
+    def _current_standby_bucket(self, entry: LedgerEntry) -> object:
+        return self._get_standby_bucket(entry[PACKAGE], entry[USER])
+
+    def _current_package_enabled(self, entry: LedgerEntry) -> object:
+        return self._get_package_enabled(entry[PACKAGE], entry[USER])
+
+    _CURRENT_VALUE_READERS: Dict[EntryKind, Callable[["StateRecorder", LedgerEntry], object]] = {
+        EntryKind.SETTING: _current_setting,
+        EntryKind.DEVICE_CONFIG: _current_device_config,
+        EntryKind.APPOP: _current_appop,
+        EntryKind.STANDBY_BUCKET: _current_standby_bucket,
+        EntryKind.PACKAGE_ENABLED: _current_package_enabled,
+    }
+
+    def batched_commands(self) -> List[str]:
+        """Commands queued so far in the current transaction."""
+        return list(self._batched_commands)
 
     def _queue_or_run(self, args: Sequence[object]) -> None:
         if self._in_transaction:
@@ -116,23 +488,33 @@ class StateRecorder:
         restore_appop_value(self.client, package, op, prior_value)
 
     def _revert_ledger(self, successful_indices: Optional[List[int]] = None) -> None:
-        entries_to_revert = []
+        entries_to_revert: List[LedgerEntry] = []
         if successful_indices is not None:
             # Revert in reverse order of indices to be safe
             for idx in sorted(successful_indices, reverse=True):
                 if idx < len(self._ledger):
-                    entries_to_revert.append(self._ledger[idx])
+                    entries_to_revert.append(ledger_entry(self._ledger[idx]))
         else:
-            entries_to_revert = list(reversed(self._ledger))
+            entries_to_revert = [ledger_entry(entry) for entry in reversed(self._ledger)]
+
+        # One script restores every entry; steps it did not report on are
+        # retried on their own.
+        statuses: Dict[int, int] = {}
+        if len(entries_to_revert) > 1 and not self.client.dry_run:
+            statuses = perform_rollback_batch(self.client, entries_to_revert)
 
         had_failures = False
-        for entry in entries_to_revert:
+        for i, entry in enumerate(entries_to_revert):
+            status = statuses.get(i)
             try:
-                self._perform_rollback(entry)
+                if status is None:
+                    self._perform_rollback(entry)
+                elif status != 0:
+                    raise CommandError(f"rollback command exited with status {status}")
                 self._remove_snapshot_for_entry(entry)
             except CommandError as exc:
                 had_failures = True
-                msg = f"Rollback failed for {entry}: {exc}"
+                msg = f"Rollback failed for {entry_as_dict(entry)}: {exc}"
                 self.client.output(msg)
                 self._persist_failed_rollback(entry)
 
@@ -142,80 +524,88 @@ class StateRecorder:
         self.store.save_or_clear()
 
     def _perform_rollback(self, entry: AnyLedgerEntry) -> None:
-        perform_rollback(self.client, entry)
-
-    def _remove_snapshot_for_entry(self, entry: AnyLedgerEntry) -> None:
-        type_ = entry["type"]
-        if type_ == "setting":
-            snapshot_key = f"{entry['namespace']}/{entry['key']}"
-            self.store.data["settings"].pop(snapshot_key, None)
-        elif type_ == "device_config":
-            snapshot_key = f"{entry['namespace']}/{entry['key']}"
-            self.store.data["device_config"].pop(snapshot_key, None)
-        elif type_ == "appop":
-            package = str(entry["package"])
-            op = str(entry["op"])
-            if package in self.store.data["packages"]:
-                self.store.data["packages"][package]["appops"].pop(op, None)
-                self._cleanup_package_entry(package)
-        elif type_ == "standby_bucket":
-            package = str(entry["package"])
-            if package in self.store.data["packages"]:
-                self.store.data["packages"][package]["standby_bucket"] = None
-                self._cleanup_package_entry(package)
-        elif type_ == "package_enabled":
-            package = str(entry["package"])
-            if package in self.store.data["packages"]:
-                self.store.data["packages"][package]["enabled"] = None
-                self._cleanup_package_entry(package)
-
-    def _remove_snapshots_for_entries(self, entries: List[AnyLedgerEntry]) -> None:
+        perform_rollback(self.client, ledger_entry(entry))
+
+    def _remove_snapshot_for_entry(self, entry: LedgerEntry) -> None:
+        self._SNAPSHOT_REMOVERS[entry[KIND]](self, entry)
+
+    def _remove_namespace_snapshot(self, entry: LedgerEntry) -> None:
+        self.store.data[_NAMESPACE_TOOLS[entry[KIND]]].pop(f"{entry[NAMESPACE]}/{entry[KEY]}", None)
+
+    def _remove_appop_snapshot(self, entry: LedgerEntry) -> None:
+        key = package_key(entry[PACKAGE], entry[USER])
+        if key in self.store.data["packages"]:
+            self.store.data["packages"][key]["appops"].pop(entry[OP], None)
+            self._cleanup_package_entry(key)
+
+    def _remove_package_field_snapshot(self, entry: LedgerEntry) -> None:
+        key = package_key(entry[PACKAGE], entry[USER])
+        if key in self.store.data["packages"]:
+            self.store.data["packages"][key][_PACKAGE_FIELDS[entry[KIND]]] = None
+            self._cleanup_package_entry(key)
+
+    _SNAPSHOT_REMOVERS: Dict[EntryKind, Callable[["StateRecorder", LedgerEntry], None]] = {
+        EntryKind.SETTING: _remove_namespace_snapshot,
+        EntryKind.DEVICE_CONFIG: _remove_namespace_snapshot,
+        EntryKind.APPOP: _remove_appop_snapshot,
+        EntryKind.STANDBY_BUCKET: _remove_package_field_snapshot,
+        EntryKind.PACKAGE_ENABLED: _remove_package_field_snapshot,
+    }
+
+    def _remove_snapshots_for_entries(self, entries: List[LedgerEntry]) -> None:
         for entry in entries:
             self._remove_snapshot_for_entry(entry)
 
-    def _cleanup_package_entry(self, package: str) -> None:
-        pkg = self.store.data["packages"].get(package)
+    def _cleanup_package_entry(self, key: str) -> None:
+        pkg = self.store.data["packages"].get(key)
         if pkg and not pkg["appops"] and pkg["standby_bucket"] is None and pkg["enabled"] is None:
-            self.store.data["packages"].pop(package)
-
-    def _persist_failed_rollback(self, entry: AnyLedgerEntry) -> None:
-        type_ = entry["type"]
-        if type_ == "setting":
-            store = self.store.data["settings"]
-            snapshot_key = f"{entry['namespace']}/{entry['key']}"
-            if snapshot_key not in store:
-                store[snapshot_key] = {
-                    "namespace": entry["namespace"],
-                    "key": entry["key"],
-                    "value": entry.get("prior_value"),
-                }
-        elif type_ == "device_config":
-            store = self.store.data["device_config"]
-            snapshot_key = f"{entry['namespace']}/{entry['key']}"
-            if snapshot_key not in store:
-                store[snapshot_key] = {
-                    "namespace": entry["namespace"],
-                    "key": entry["key"],
-                    "value": entry.get("prior_value"),
-                }
-        elif type_ == "appop":
-            package = str(entry["package"])
-            op = str(entry["op"])
-            pkg_entry = self._package_entry(package)
-            if op not in pkg_entry["appops"]:
-                pkg_entry["appops"][op] = entry.get("prior_value")
-        elif type_ == "standby_bucket":
-            package = str(entry["package"])
-            pkg_entry = self._package_entry(package)
-            if pkg_entry["standby_bucket"] is None:
-                pkg_entry["standby_bucket"] = entry.get("prior_value")
-        elif type_ == "package_enabled":
-            package = str(entry["package"])
-            pkg_entry = self._package_entry(package)
-            if pkg_entry["enabled"] is None:
-                pkg_entry["enabled"] = entry.get("prior_value")
-
-    def prefetch_package_states(self) -> None:
+            self.store.data["packages"].pop(key)
+
+    def _persist_failed_rollback(self, entry: LedgerEntry) -> None:
+        self._persist_entry_snapshot(entry)
+
+    def _persist_entry_snapshot(self, entry: LedgerEntry) -> None:
+        # Record the entry's prior value unless an older snapshot exists.
+        self._SNAPSHOT_WRITERS[entry[KIND]](self, entry)
+
+    def _persist_namespace_snapshot(self, entry: LedgerEntry) -> None:
+        store = self.store.data[_NAMESPACE_TOOLS[entry[KIND]]]
+        snapshot_key = f"{entry[NAMESPACE]}/{entry[KEY]}"
+        if snapshot_key not in store:
+            store[snapshot_key] = {
+                "namespace": entry[NAMESPACE],
+                "key": entry[KEY],
+                "value": entry[PRIOR_VALUE],
+            }
+
+    def _persist_appop_snapshot(self, entry: LedgerEntry) -> None:
+        pkg_entry = self._package_entry(entry[PACKAGE], entry[USER])
+        if entry[OP] not in pkg_entry["appops"]:
+            pkg_entry["appops"][entry[OP]] = entry[PRIOR_VALUE]
+
+    def _persist_package_field_snapshot(self, entry: LedgerEntry) -> None:
+        pkg_entry = self._package_entry(entry[PACKAGE], entry[USER])
+        field = _PACKAGE_FIELDS[entry[KIND]]
+        if pkg_entry[field] is None:
+            pkg_entry[field] = entry[PRIOR_VALUE]
+
+    _SNAPSHOT_WRITERS: Dict[EntryKind, Callable[["StateRecorder", LedgerEntry], None]] = {
+        EntryKind.SETTING: _persist_namespace_snapshot,
+        EntryKind.DEVICE_CONFIG: _persist_namespace_snapshot,
+        EntryKind.APPOP: _persist_appop_snapshot,
+        EntryKind.STANDBY_BUCKET: _persist_package_field_snapshot,
+        EntryKind.PACKAGE_ENABLED: _persist_package_field_snapshot,
+    }
+
+    def prefetch_package_states(
+        self, appops_ops: Optional[Sequence[str]] = None, users: Sequence[int] = (DEFAULT_USER,)
+    ) -> None:
+        """Snapshot package state before the transaction mutates it.
+
+        `appops_ops` names the ops the pending work will set, so only those
+        are read; an op outside the list is fetched when first needed.
+        Every user in `users` is read in the same pass.
+        """
         (
             self._prefetch_package_enabled_success,
             self._package_enabled_cache,
@@ -223,7 +613,77 @@ class StateRecorder:
             self._appops_cache,
             self._prefetch_standby_bucket_success,
             self._standby_bucket_cache
-        ) = prefetch_package_states(self.client)
+        ) = prefetch_package_states(self.client, appops_ops, users)
+        self._prefetched_appops = None if appops_ops is None else set(appops_ops)
+
+    def prefetch_packages(
+        self,
+        packages: Sequence[str],
+        kinds: Sequence[str] = PACKAGE_DATA_KINDS,
+        appops_ops: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Snapshot only `kinds` of state, sized to the packages the work touches.
+
+        Small targets are read with per-package queries instead of the
+        device-wide dumps; see `snapshot.prefetch_packages`.
+        """
+        prefetch = prefetch_packages(self.client, packages, kinds, appops_ops)
+        for kind in kinds:
+            self._store_package_states(kind, prefetch.states.get(kind))
+        self._targeted_packages = {kind: set(packages) for kind in prefetch.targeted}
+        if "appops" in kinds:
+            targeted = "appops" in prefetch.targeted
+            self._prefetched_appops = None if targeted or appops_ops is None else set(appops_ops)
+
+    def _store_package_states(self, kind: str, states: Optional[Dict[str, object]]) -> None:
+        success = states is not None
+        if kind == "enabled":
+            self._prefetch_package_enabled_success = success
+            self._package_enabled_cache.update(cast(Dict[str, bool], states or {}))
+        elif kind == "appops":
+            self._prefetch_appops_success = success
+            self._appops_cache.update(cast(Dict[str, Dict[str, str]], states or {}))
+        else:
+            self._prefetch_standby_bucket_success = success
+            self._standby_bucket_cache.update(cast(Dict[str, str], states or {}))
+
+    def _read_untargeted_package(self, kind: str, package: str) -> None:
+        packages = self._targeted_packages.get(kind)
+        if packages is None or package in packages:
+            return
+        packages.add(package)
+        values = read_package_states(self.client, [package], [kind])[kind]
+        if values is not None:
+            self._store_package_states(kind, values)
+
+    def _prefetch_appop(self, op: str) -> None:
+        assert self._prefetched_appops is not None
+        modes = read_appops(self.client, [op])
+        if modes is None:
+            raise SnapshotError(f"AppOps data was not collected or command failed for op: {op}")
+        for package, package_modes in modes.items():
+            self._appops_cache.setdefault(package, {}).update(package_modes)
+        self._prefetched_appops.add(op)
+
+    def prefetch_namespaces(
+        self, settings: Sequence[str] = (), device_config: Sequence[str] = ()
+    ) -> None:
+        """List every namespace the transaction will touch in one shell call.
+
+        Namespaces that fail to list are left to the per-namespace read on
+        first use, which reports the error.
+        """
+        pending = [("settings", namespace) for namespace in settings if namespace not in self._settings_cache]
+        pending += [
+            ("device_config", namespace)
+            for namespace in device_config
+            if namespace not in self._device_config_cache
+        ]
+        for (tool, namespace), listing in read_namespaces(self.client, pending).items():
+            if isinstance(listing, SnapshotError):
+                continue
+            cache = self._settings_cache if tool == "settings" else self._device_config_cache
+            cache[namespace] = listing
 
     def _read_settings_namespace(self, namespace: str) -> Dict[str, str]:
         return read_settings_namespace(self.client, namespace)
@@ -241,22 +701,20 @@ class StateRecorder:
         snapshot_key = f"{namespace}/{key}"
         value = self._get_setting(namespace, key)
         value = self._normalize_value(value)
+        entry = setting_entry(namespace, key, value, self._normalize_value(new_value))
         if snapshot_key not in store:
             store[snapshot_key] = {
                 "namespace": namespace,
                 "key": key,
                 "value": value,
             }
-            self.store.save()
-        self._ledger.append(cast(AnyLedgerEntry, {
-            "type": "setting",
-            "namespace": namespace,
-            "key": key,
-            "prior_value": value,
-            "new_value": self._normalize_value(new_value),
-        }))
+            self._created_snapshots.add(change_id(entry))
+            self.store.save_change("settings", snapshot_key)
+        self._ledger.append(entry)
 
     def put_setting(self, namespace: str, key: str, value: object, verify: bool = True) -> None:
+        if self._skip_unchanged(setting_entry(namespace, key, new_value=str(value))):
+            return
         self.snapshot_setting(namespace, key, new_value=str(value))
         self._queue_or_run(["settings", "put", namespace, key, value])
         if not self._in_transaction and self.verify and verify:
@@ -267,6 +725,8 @@ class StateRecorder:
                 raise
 
     def delete_setting(self, namespace: str, key: str, verify: bool = True) -> None:
+        if self._skip_unchanged(setting_entry(namespace, key)):
+            return
         self.snapshot_setting(namespace, key, new_value=None)
         self._queue_or_run(["settings", "delete", namespace, key])
         if not self._in_transaction and self.verify and verify:
@@ -292,22 +752,22 @@ class StateRecorder:
         snapshot_key = f"{namespace}/{key}"
         value = self._get_device_config(namespace, key)
         value = self._normalize_value(value)
+        entry = device_config_entry(namespace, key, value, self._normalize_value(new_value))
         if snapshot_key not in store:
             store[snapshot_key] = {
                 "namespace": namespace,
                 "key": key,
                 "value": value,
             }
-            self.store.save()
-        self._ledger.append(cast(AnyLedgerEntry, {
-            "type": "device_config",
-            "namespace": namespace,
-            "key": key,
-            "prior_value": value,
-            "new_value": self._normalize_value(new_value),
-        }))
+            self._created_snapshots.add(change_id(entry))
+            self.store.save_change("device_config", snapshot_key)
+        self._ledger.append(entry)
 
     def put_device_config(self, namespace: str, key: str, value: object, verify: bool = True) -> None:
+        if self._skip_unchanged(
+            device_config_entry(namespace, key, new_value=str(value))
+        ):
+            return
         self.snapshot_device_config(namespace, key, new_value=str(value))
         self._queue_or_run(["device_config", "put", namespace, key, value])
         if not self._in_transaction and self.verify and verify:
@@ -318,6 +778,8 @@ class StateRecorder:
                 raise
 
     def delete_device_config(self, namespace: str, key: str, verify: bool = True) -> None:
+        if self._skip_unchanged(device_config_entry(namespace, key)):
+            return
         self.snapshot_device_config(namespace, key, new_value=None)
         self._queue_or_run(["device_config", "delete", namespace, key])
         if not self._in_transaction and self.verify and verify:
@@ -327,10 +789,10 @@ class StateRecorder:
                 self._revert_ledger()
                 raise
 
-    def _package_entry(self, package: str) -> Dict[str, object]:
+    def _package_entry(self, package: str, user: int = DEFAULT_USER) -> Dict[str, object]:
         packages = self.store.data["packages"]
         return packages.setdefault(
-            package,
+            package_key(package, user),
             {
                 "enabled": None,
                 "appops": {},
@@ -338,98 +800,118 @@ class StateRecorder:
             },
         )
 
-    def _get_package_enabled(self, package: str) -> bool:
-        if not self._prefetch_package_enabled_success or package not in self._package_enabled_cache:
-            raise SnapshotError(f"Could not determine enabled state for package: {package}")
-        return self._package_enabled_cache[package]
-
-    def snapshot_package_enabled(self, package: str, new_value: Optional[bool] = None) -> None:
-        entry = self._package_entry(package)
-        value = self._get_package_enabled(package)
-        if entry["enabled"] is None:
-            entry["enabled"] = value
-            self.store.save()
-        self._ledger.append(cast(AnyLedgerEntry, {
-            "type": "package_enabled",
-            "package": package,
-            "prior_value": value,
-            "new_value": new_value,
-        }))
-
-    def _get_appop(self, package: str, op: str) -> str:
+    def _get_package_enabled(self, package: str, user: int = DEFAULT_USER) -> bool:
+        key = package_key(package, user)
+        self._read_untargeted_package("enabled", key)
+        if not self._prefetch_package_enabled_success or key not in self._package_enabled_cache:
+            raise SnapshotError(f"Could not determine enabled state for package: {key}")
+        return self._package_enabled_cache[key]
+
+    def snapshot_package_enabled(
+        self, package: str, new_value: Optional[bool] = None, user: int = DEFAULT_USER
+    ) -> None:
+        pkg_entry = self._package_entry(package, user)
+        value = self._get_package_enabled(package, user)
+        entry = package_enabled_entry(package, user, value, new_value)
+        if pkg_entry["enabled"] is None:
+            pkg_entry["enabled"] = value
+            self._created_snapshots.add(change_id(entry))
+            self.store.save_change("packages", package_key(package, user))
+        self._ledger.append(entry)
+
+    def _get_appop(self, package: str, op: str, user: int = DEFAULT_USER) -> str:
+        key = package_key(package, user)
+        self._read_untargeted_package("appops", key)
         if not self._prefetch_appops_success:
-            raise SnapshotError(f"AppOps data was not collected or command failed for package: {package}")
-        if package not in self._appops_cache:
-             raise SnapshotError(f"Could not determine appops for package: {package}")
-        return self._appops_cache[package].get(op, "default")
-
-    def snapshot_appop(self, package: str, op: str, new_value: Optional[str] = None) -> None:
-        entry = self._package_entry(package)
-        value = self._get_appop(package, op)
-        if op not in entry["appops"]:
-            entry["appops"][op] = value
-            self.store.save()
-        self._ledger.append(cast(AnyLedgerEntry, {
-            "type": "appop",
-            "package": package,
-            "op": op,
-            "prior_value": value,
-            "new_value": new_value,
-        }))
-
-    def _get_standby_bucket(self, package: str) -> str:
-        if not self._prefetch_standby_bucket_success or package not in self._standby_bucket_cache:
-            raise SnapshotError(f"Could not determine standby bucket for package: {package}")
-        return self._standby_bucket_cache[package]
-
-    def snapshot_standby_bucket(self, package: str, new_value: Optional[str] = None) -> None:
-        entry = self._package_entry(package)
-        value = self._get_standby_bucket(package)
-        if entry["standby_bucket"] is None:
-            entry["standby_bucket"] = value
-            self.store.save()
-        self._ledger.append(cast(AnyLedgerEntry, {
-            "type": "standby_bucket",
-            "package": package,
-            "prior_value": value,
-            "new_value": new_value,
-        }))
-
-    def set_package_enabled(self, package: str, enabled: bool, verify: bool = True) -> None:
-        self.snapshot_package_enabled(package, new_value=enabled)
-        command = ["pm", "enable", "--user", PACKAGE_USER_ID, package]
-        if not enabled:
-            command = ["pm", "disable-user", "--user", PACKAGE_USER_ID, package]
-        self._queue_or_run(command)
+            raise SnapshotError(f"AppOps data was not collected or command failed for package: {key}")
+        if self._prefetched_appops is not None:
+            if op not in self._prefetched_appops:
+                self._prefetch_appop(op)
+            # A targeted read only lists packages with a recorded mode, so an
+            # installed package missing from it is at the default mode.
+            if key not in self._appops_cache and key in self._package_enabled_cache:
+                return "default"
+        if key not in self._appops_cache:
+             raise SnapshotError(f"Could not determine appops for package: {key}")
+        return self._appops_cache[key].get(op, "default")
+
+    def snapshot_appop(
+        self, package: str, op: str, new_value: Optional[str] = None, user: int = DEFAULT_USER
+    ) -> None:
+        pkg_entry = self._package_entry(package, user)
+        value = self._get_appop(package, op, user)
+        entry = appop_entry(package, op, user, value, new_value)
+        if op not in pkg_entry["appops"]:
+            pkg_entry["appops"][op] = value
+            self._created_snapshots.add(change_id(entry))
+            self.store.save_change("packages", package_key(package, user))
+        self._ledger.append(entry)
+
+    def _get_standby_bucket(self, package: str, user: int = DEFAULT_USER) -> str:
+        key = package_key(package, user)
+        self._read_untargeted_package("standby_bucket", key)
+        if not self._prefetch_standby_bucket_success or key not in self._standby_bucket_cache:
+            raise SnapshotError(f"Could not determine standby bucket for package: {key}")
+        return self._standby_bucket_cache[key]
+
+    def snapshot_standby_bucket(
+        self, package: str, new_value: Optional[str] = None, user: int = DEFAULT_USER
+    ) -> None:
+        pkg_entry = self._package_entry(package, user)
+        value = self._get_standby_bucket(package, user)
+        entry = standby_bucket_entry(package, user, value, new_value)
+        if pkg_entry["standby_bucket"] is None:
+            pkg_entry["standby_bucket"] = value
+            self._created_snapshots.add(change_id(entry))
+            self.store.save_change("packages", package_key(package, user))
+        self._ledger.append(entry)
+
+    def set_package_enabled(
+        self, package: str, enabled: bool, verify: bool = True, user: int = DEFAULT_USER
+    ) -> None:
+        if self._skip_unchanged(
+            package_enabled_entry(package, user, new_value=enabled)
+        ):
+            return
+        self.snapshot_package_enabled(package, new_value=enabled, user=user)
+        self._queue_or_run(package_enabled_command(package, enabled, user))
         if not self._in_transaction and self.verify and verify:
             try:
-                self.verify_package_enabled(package, enabled)
+                self.verify_package_enabled(package, enabled, user)
             except VerificationError:
                 self._revert_ledger()
                 raise
 
-    def set_appop(self, package: str, op: str, value: str, verify: bool = True) -> None:
-        self.snapshot_appop(package, op, new_value=value)
-        self._queue_or_run(["cmd", "appops", "set", package, op, value])
+    def set_appop(
+        self, package: str, op: str, value: str, verify: bool = True, user: int = DEFAULT_USER
+    ) -> None:
+        if self._skip_unchanged(appop_entry(package, op, user, new_value=value)):
+            return
+        self.snapshot_appop(package, op, new_value=value, user=user)
+        self._queue_or_run(["cmd", "appops", "set", *user_args(user), package, op, value])
         if not self._in_transaction and self.verify and verify:
             try:
-                self.verify_appop(package, op, value)
+                self.verify_appop(package, op, value, user)
             except VerificationError:
                 self._revert_ledger()
                 raise
 
-    def set_standby_bucket(self, package: str, bucket: str, verify: bool = True) -> None:
-        prior_bucket = self._get_standby_bucket(package)
+    def set_standby_bucket(
+        self, package: str, bucket: str, verify: bool = True, user: int = DEFAULT_USER
+    ) -> None:
+        if self._skip_unchanged(standby_bucket_entry(package, user, new_value=bucket)):
+            return
+        prior_bucket = self._get_standby_bucket(package, user)
         try:
             normalize_restorable_bucket(prior_bucket)
         except ValueError as exc:
             raise SnapshotError(f"Prior standby bucket {prior_bucket} is not restorable: {exc}") from exc
 
-        self.snapshot_standby_bucket(package, new_value=bucket)
-        self._queue_or_run(["am", "set-standby-bucket", package, bucket])
+        self.snapshot_standby_bucket(package, new_value=bucket, user=user)
+        self._queue_or_run(["am", "set-standby-bucket", *user_args(user), package, bucket])
         if not self._in_transaction and self.verify and verify:
             try:
-                self.verify_standby_bucket(package, bucket)
+                self.verify_standby_bucket(package, bucket, user)
             except VerificationError:
                 self._revert_ledger()
                 raise
@@ -440,36 +922,126 @@ class StateRecorder:
     def verify_device_config(self, namespace: str, key: str, expected_value: Optional[str]) -> None:
         verify_device_config(self.client, namespace, key, expected_value)
 
-    def verify_appop(self, package: str, op: str, expected_value: str) -> None:
-        verify_appop(self.client, package, op, expected_value)
+    def verify_appop(self, package: str, op: str, expected_value: str, user: int = DEFAULT_USER) -> None:
+        verify_appop(self.client, package, op, expected_value, user)
 
-    def verify_standby_bucket(self, package: str, expected_bucket: str) -> None:
-        verify_standby_bucket(self.client, package, expected_bucket)
+    def verify_standby_bucket(self, package: str, expected_bucket: str, user: int = DEFAULT_USER) -> None:
+        verify_standby_bucket(self.client, package, expected_bucket, user)
 
-    def verify_package_enabled(self, package: str, expected_enabled: bool) -> None:
-        verify_package_enabled(self.client, package, expected_enabled)
+    def verify_package_enabled(self, package: str, expected_enabled: bool, user: int = DEFAULT_USER) -> None:
+        verify_package_enabled(self.client, package, expected_enabled, user)
 
-    def _verify_entry(self, entry: AnyLedgerEntry) -> None:
-        type_ = entry["type"]
-        new_value = entry.get("new_value")
-        if type_ == "setting":
-            self.verify_setting(
-                str(entry["namespace"]),
-                str(entry["key"]),
-                str(new_value) if new_value is not None else None,
-            )
-        elif type_ == "device_config":
-            self.verify_device_config(
-                str(entry["namespace"]),
-                str(entry["key"]),
-                str(new_value) if new_value is not None else None,
-            )
-        elif type_ == "appop":
-            self.verify_appop(str(entry["package"]), str(entry["op"]), str(new_value))
-        elif type_ == "standby_bucket":
-            self.verify_standby_bucket(str(entry["package"]), str(new_value))
-        elif type_ == "package_enabled":
-            self.verify_package_enabled(str(entry["package"]), bool(new_value))
+    def _verify_entries(self, entries: Sequence[LedgerEntry]) -> None:
+        # One bulk readback settles every entry it shows at its new value. The
+        # rest are read back one by one, so a mismatch is confirmed and
+        # reported with the same message as sequential verification.
+        if not self.client.dry_run:
+            readback = self._read_back(entries)
+            entries = [entry for entry in entries if not self._readback_matches(readback, entry)]
+        # Readbacks are independent; run them concurrently and report the first
+        # failure in ledger order so the error matches sequential verification.
+        results = call_concurrently(
+            [lambda entry=entry: self._verify_entry(entry) for entry in entries]
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _read_back(self, entries: Sequence[LedgerEntry]) -> Readback:
+        namespaces = []
+        appops_ops = []
+        bucket_users = []
+        enabled_users = []
+        for entry in entries:
+            kind = entry[KIND]
+            if kind in NAMESPACE_KINDS:
+                namespaces.append((_NAMESPACE_TOOLS[kind], entry[NAMESPACE]))
+            elif kind is APPOP:
+                appops_ops.append(entry[OP])
+                # A filtered dump leaves out packages at the default mode; the
+                # package lists tell those apart from uninstalled ones.
+                if (normalize_value(str(entry[NEW_VALUE])) or "").lower() == "default":
+                    enabled_users.append(entry[USER])
+            elif kind is STANDBY_BUCKET:
+                bucket_users.append(entry[USER])
+            elif kind is PACKAGE_ENABLED:
+                enabled_users.append(entry[USER])
+        return read_readback(self.client, namespaces, appops_ops, bucket_users, enabled_users)
+
+    @classmethod
+    def _readback_matches(cls, readback: Readback, entry: LedgerEntry) -> bool:
+        kind = entry[KIND]
+        actual: object
+        if kind in NAMESPACE_KINDS:
+            listing = readback.namespaces.get((_NAMESPACE_TOOLS[kind], entry[NAMESPACE]))
+            if listing is None:
+                return False
+            actual = listing.get(entry[KEY])
+        else:
+            key = package_key(entry[PACKAGE], entry[USER])
+            if kind is APPOP:
+                if readback.appops is None:
+                    return False
+                modes = readback.appops.get(key)
+                if modes is None:
+                    if not (readback.appops_filtered and key in readback.package_enabled):
+                        return False
+                    modes = {}
+                actual = modes.get(entry[OP], "default")
+            elif kind is STANDBY_BUCKET:
+                actual = readback.standby_buckets.get(key)
+            else:
+                if key not in readback.package_enabled:
+                    return False
+                actual = readback.package_enabled[key]
+        return cls._value_matches(entry, actual)
+
+    @staticmethod
+    def _value_matches(entry: LedgerEntry, actual: object) -> bool:
+        """Whether `actual`, as read from the device, is the entry's new value."""
+        kind = entry[KIND]
+        new_value = entry[NEW_VALUE]
+        if kind in NAMESPACE_KINDS:
+            expected = None if new_value is None else str(new_value)
+            actual_value = None if actual is None else str(actual)
+            return normalize_value(actual_value) == normalize_value(expected)
+        if actual is None:
+            return False
+        if kind is APPOP:
+            expected = (normalize_value(str(new_value)) or "").lower()
+            return str(actual).lower() == expected
+        if kind is STANDBY_BUCKET:
+            bucket = str(new_value)
+            return str(actual) == STANDBY_BUCKET_MAP.get(bucket.lower(), bucket)
+        return actual == bool(new_value)
+
+    def _verify_entry(self, entry: LedgerEntry) -> None:
+        self._VERIFIERS[entry[KIND]](self, entry)
+
+    def _verify_setting_entry(self, entry: LedgerEntry) -> None:
+        new_value = entry[NEW_VALUE]
+        self.verify_setting(entry[NAMESPACE], entry[KEY], str(new_value) if new_value is not None else None)
+
+    def _verify_device_config_entry(self, entry: LedgerEntry) -> None:
+        new_value = entry[NEW_VALUE]
+        self.verify_device_config(entry[NAMESPACE], entry[KEY], str(new_value) if new_value is not None else None)
+
+    def _verify_appop_entry(self, entry: LedgerEntry) -> None:
+        self.verify_appop(entry[PACKAGE], entry[OP], str(entry[NEW_VALUE]), entry[USER])
+
+    def _verify_standby_bucket_entry(self, entry: LedgerEntry) -> None:
+        self.verify_standby_bucket(entry[PACKAGE], str(entry[NEW_VALUE]), entry[USER])
+
+    def _verify_package_enabled_entry(self, entry: LedgerEntry) -> None:
+        self.verify_package_enabled(entry[PACKAGE], bool(entry[NEW_VALUE]), entry[USER])
+
+    _VERIFIERS: Dict[EntryKind, Callable[["StateRecorder", LedgerEntry], None]] = {
+        EntryKind.SETTING: _verify_setting_entry,
+        EntryKind.DEVICE_CONFIG: _verify_device_config_entry,
+        EntryKind.APPOP: _verify_appop_entry,
+        EntryKind.STANDBY_BUCKET: _verify_standby_bucket_entry,
+        EntryKind.PACKAGE_ENABLED: _verify_package_enabled_entry,
+    }
 
     def restore(self) -> List[str]:
         return restore_state(self.client, self.store, self._remove_snapshot_for_entry)
@@ -1,51 +1,109 @@
-from typing import Dict, List, Optional, Callable, cast
+import re
+from typing import Dict, List, Optional, Callable, Sequence, cast
 from .adb import AdbClient, CommandError
 from .state import StateStore
 from .verification import VerificationError, verify_setting, verify_device_config, verify_appop, verify_standby_bucket, verify_package_enabled
-from .ledger import AnyLedgerEntry
+from .ledger import (
+    KEY,
+    KIND,
+    NAMESPACE,
+    OP,
+    PACKAGE,
+    PRIOR_VALUE,
+    USER,
+    EntryKind,
+    LedgerEntry,
+    appop_entry,
+    device_config_entry,
+    package_enabled_entry,
+    setting_entry,
+    standby_bucket_entry,
+)
+from .users import DEFAULT_USER, package_key, split_package_key, user_args
 
-PACKAGE_USER_ID = "0"
-
-def restore_appop_value(client: AdbClient, package: str, op: str, prior_value: Optional[str]) -> None:
+def restore_appop_value(
+    client: AdbClient, package: str, op: str, prior_value: Optional[str], user: int = DEFAULT_USER
+) -> None:
     value = "default" if prior_value is None else str(prior_value)
-    client.shell(["cmd", "appops", "set", package, op, value], mutate=True)
-
-def perform_rollback(client: AdbClient, entry: AnyLedgerEntry) -> None:
-    type_ = entry["type"]
-    if type_ == "setting":
-        namespace = str(entry["namespace"])
-        key = str(entry["key"])
-        prior_value = entry.get("prior_value")
-        if prior_value is None:
-            client.shell(["settings", "delete", namespace, key], mutate=True)
-        else:
-            client.shell(["settings", "put", namespace, key, prior_value], mutate=True)
-    elif type_ == "device_config":
-        namespace = str(entry["namespace"])
-        key = str(entry["key"])
-        prior_value = entry.get("prior_value")
-        if prior_value is None:
-            client.shell(["device_config", "delete", namespace, key], mutate=True)
-        else:
-            client.shell(["device_config", "put", namespace, key, prior_value], mutate=True)
-    elif type_ == "appop":
-        package = str(entry["package"])
-        op = str(entry["op"])
-        prior_value = entry.get("prior_value")
-        restore_appop_value(client, package, op, cast(Optional[str], prior_value))
-    elif type_ == "standby_bucket":
-        package = str(entry["package"])
-        prior_value = entry.get("prior_value")
-        if prior_value:
-            client.shell(["am", "set-standby-bucket", package, str(prior_value)], mutate=True)
-    elif type_ == "package_enabled":
-        package = str(entry["package"])
-        prior_value = bool(entry.get("prior_value"))
-        command = ["pm", "enable", "--user", PACKAGE_USER_ID, package]
-        if not prior_value:
-            command = ["pm", "disable-user", "--user", PACKAGE_USER_ID, package]
+    client.shell(["cmd", "appops", "set", *user_args(user), package, op, value], mutate=True)
+
+def package_enabled_command(package: str, enabled: bool, user: int = DEFAULT_USER) -> List[str]:
+    if enabled:
+        return ["pm", "enable", "--user", str(user), package]
+    return ["pm", "disable-user", "--user", str(user), package]
+
+def _namespace_rollback(tool: str) -> Callable[[LedgerEntry], List[object]]:
+    def command(entry: LedgerEntry) -> List[object]:
+        if entry[PRIOR_VALUE] is None:
+            return [tool, "delete", entry[NAMESPACE], entry[KEY]]
+        return [tool, "put", entry[NAMESPACE], entry[KEY], entry[PRIOR_VALUE]]
+
+    return command
+
+def _appop_rollback(entry: LedgerEntry) -> List[object]:
+    value = "default" if entry[PRIOR_VALUE] is None else str(entry[PRIOR_VALUE])
+    if entry[USER] == DEFAULT_USER:
+        return ["cmd", "appops", "set", entry[PACKAGE], entry[OP], value]
+    return ["cmd", "appops", "set", *user_args(entry[USER]), entry[PACKAGE], entry[OP], value]
+
+def _standby_bucket_rollback(entry: LedgerEntry) -> Optional[List[object]]:
+    if not entry[PRIOR_VALUE]:
+        return None
+    if entry[USER] == DEFAULT_USER:
+        return ["am", "set-standby-bucket", entry[PACKAGE], str(entry[PRIOR_VALUE])]
+    return ["am", "set-standby-bucket", *user_args(entry[USER]), entry[PACKAGE], str(entry[PRIOR_VALUE])]
+
+def _package_enabled_rollback(entry: LedgerEntry) -> List[object]:
+    return package_enabled_command(entry[PACKAGE], bool(entry[PRIOR_VALUE]), entry[USER])
+
+ROLLBACK_COMMANDS: Dict[EntryKind, Callable[[LedgerEntry], Optional[List[object]]]] = {
+    EntryKind.SETTING: _namespace_rollback("settings"),
+    EntryKind.DEVICE_CONFIG: _namespace_rollback("device_config"),
+    EntryKind.APPOP: _appop_rollback,
+    EntryKind.STANDBY_BUCKET: _standby_bucket_rollback,
+    EntryKind.PACKAGE_ENABLED: _package_enabled_rollback,
+}
+
+def rollback_command(entry: LedgerEntry) -> Optional[List[object]]:
+    """Shell command that restores a ledger entry's prior value, if any."""
+    return ROLLBACK_COMMANDS[entry[KIND]](entry)
+
+def perform_rollback(client: AdbClient, entry: LedgerEntry) -> None:
+    command = ROLLBACK_COMMANDS[entry[KIND]](entry)
+    if command is not None:
         client.shell(command, mutate=True)
 
+ROLLBACK_STEP_RE = re.compile(r"ROLLBACK_(?:OK_(\d+)|FAIL_(\d+):(\d+))")
+
+def perform_rollback_batch(client: AdbClient, entries: Sequence[LedgerEntry]) -> Dict[int, int]:
+    """Run the rollbacks of `entries` as one shell script.
+
+    Unlike the forward batch, a failed step does not stop the script. Returns
+    index -> exit status for every step that reported back; steps missing
+    from the result have an unknown outcome.
+    """
+    statuses: Dict[int, int] = {}
+    lines = []
+    for i, entry in enumerate(entries):
+        command = rollback_command(entry)
+        if command is None:
+            statuses[i] = 0
+            continue
+        cmd = client._format(client._stringify(command))
+        lines.append(f"{cmd} && echo ROLLBACK_OK_{i} || echo ROLLBACK_FAIL_{i}:$?")
+    if not lines:
+        return statuses
+    try:
+        result = client.shell([], mutate=True, check=False, input_data="\n".join(lines))
+    except CommandError:
+        return statuses
+    for match in ROLLBACK_STEP_RE.finditer(result.stdout or ""):
+        if match.group(1) is not None:
+            statuses[int(match.group(1))] = 0
+        else:
+            statuses[int(match.group(2))] = int(match.group(3))
+    return statuses
+
 def restore_and_verify(
     restore_action: Callable[[], object],
     verify_action: Callable[[], None],
@@ -56,11 +114,13 @@ def restore_and_verify(
 def restore_state(
     client: AdbClient,
     store: StateStore,
-    remove_snapshot_for_entry: Callable[[AnyLedgerEntry], None]
+    remove_snapshot_for_entry: Callable[[LedgerEntry], None]
 ) -> List[str]:
     if client.serial is None and not client.dry_run:
         raise CommandError("Refusing to restore device state without a selected ADB serial.")
 
+    # The fingerprint check must not trust properties read before a reboot.
+    client.revalidate_device_properties()
     current_metadata = client.get_device_metadata_with_fallback()
     saved_device = cast(Dict[str, object], store.data.get("device") or {})
 
@@ -113,11 +173,7 @@ def restore_state(
                 )
             messages.append(f"Restored setting {namespace}/{key}")
             if not client.dry_run:
-                remove_snapshot_for_entry(cast(AnyLedgerEntry, {
-                    "type": "setting",
-                    "namespace": namespace,
-                    "key": key,
-                }))
+                remove_snapshot_for_entry(setting_entry(namespace, key))
         except (CommandError, VerificationError) as exc:
             had_failures = True
             msg = f"Failed to restore setting {namespace}/{key}: {exc}"
@@ -147,35 +203,30 @@ def restore_state(
                 )
             messages.append(f"Restored device_config {namespace}/{key}")
             if not client.dry_run:
-                remove_snapshot_for_entry(cast(AnyLedgerEntry, {
-                    "type": "device_config",
-                    "namespace": namespace,
-                    "key": key,
-                }))
+                remove_snapshot_for_entry(device_config_entry(namespace, key))
         except (CommandError, VerificationError) as exc:
             had_failures = True
             msg = f"Failed to restore device_config {namespace}/{key}: {exc}"
             messages.append(msg)
             client.output(msg)
 
-    for package, item in list(packages.items()):
+    for key, item in list(packages.items()):
+        # Other users' packages are stored as `<user>/<package>`.
+        user, package = split_package_key(key)
+        label = package_key(package, user)
         appops = cast(Dict[str, Optional[str]], item.get("appops", {}))
         for op, value in list(appops.items()):
             try:
                 restore_and_verify(
-                    lambda: restore_appop_value(client, package, op, value),
-                    lambda: verify_appop(client, package, op, str(value)),
+                    lambda: restore_appop_value(client, package, op, value, user),
+                    lambda: verify_appop(client, package, op, str(value), user),
                 )
-                messages.append(f"Restored {package} appop {op}")
+                messages.append(f"Restored {label} appop {op}")
                 if not client.dry_run:
-                    remove_snapshot_for_entry(cast(AnyLedgerEntry, {
-                        "type": "appop",
-                        "package": package,
-                        "op": op,
-                    }))
+                    remove_snapshot_for_entry(appop_entry(package, op, user))
             except (CommandError, VerificationError) as exc:
                 had_failures = True
-                msg = f"Failed to restore {package} appop {op}: {exc}"
+                msg = f"Failed to restore {label} appop {op}: {exc}"
                 messages.append(msg)
                 client.output(msg)
 
@@ -184,7 +235,8 @@ def restore_state(
             try:
                 from .operations import is_restorable_bucket
                 if not is_restorable_bucket(bucket):
-                    msg = f"Saved standby bucket {bucket} is not writable on this device; cannot restore automatically.\nManual fallback: adb shell am set-standby-bucket {package} active"
+                    manual = " ".join(["am", "set-standby-bucket", *user_args(user), package, "active"])
+                    msg = f"Saved standby bucket {bucket} is not writable on this device; cannot restore automatically.\nManual fallback: adb shell {manual}"
                     client.output(msg)
                     messages.append(msg)
                     had_failures = True
@@ -192,48 +244,42 @@ def restore_state(
 
                 restore_and_verify(
                     lambda: client.shell(
-                        ["am", "set-standby-bucket", package, bucket],
+                        ["am", "set-standby-bucket", *user_args(user), package, bucket],
                         mutate=True,
                     ),
-                    lambda: verify_standby_bucket(client, package, str(bucket)),
+                    lambda: verify_standby_bucket(client, package, str(bucket), user),
                 )
-                messages.append(f"Restored {package} standby bucket")
+                messages.append(f"Restored {label} standby bucket")
                 if not client.dry_run:
-                    remove_snapshot_for_entry(cast(AnyLedgerEntry, {
-                        "type": "standby_bucket",
-                        "package": package,
-                    }))
+                    remove_snapshot_for_entry(standby_bucket_entry(package, user))
             except (CommandError, VerificationError) as exc:
                 had_failures = True
-                msg = f"Failed to restore {package} standby bucket: {exc}"
+                msg = f"Failed to restore {label} standby bucket: {exc}"
                 messages.append(msg)
                 client.output(msg)
 
         enabled = cast(Optional[bool], item.get("enabled"))
         if enabled is not None:
             try:
-                command = ["pm", "enable", "--user", PACKAGE_USER_ID, package]
-                if not enabled:
-                    command = ["pm", "disable-user", "--user", PACKAGE_USER_ID, package]
+                command = package_enabled_command(package, enabled, user)
                 restore_and_verify(
                     lambda: client.shell(command, mutate=True),
-                    lambda: verify_package_enabled(client, package, enabled),
+                    lambda: verify_package_enabled(client, package, enabled, user),
                 )
-                messages.append(f"Restored {package} enabled state")
+                messages.append(f"Restored {label} enabled state")
                 if not client.dry_run:
-                    remove_snapshot_for_entry(cast(AnyLedgerEntry, {
-                        "type": "package_enabled",
-                        "package": package,
-                    }))
+                    remove_snapshot_for_entry(package_enabled_entry(package, user))
             except (CommandError, VerificationError) as exc:
                 had_failures = True
-                msg = f"Failed to restore {package} enabled state: {exc}"
+                msg = f"Failed to restore {label} enabled state: {exc}"
                 messages.append(msg)
                 client.output(msg)
 
     if client.dry_run:
         return messages
 
+    # Restored changes must not be skipped as already applied by a later run.
+    store.data.pop("checkpoint", None)
     if had_failures:
         store.save_or_clear()
         client.output("Warning: Partial state corruption due to restore failures.")
@@ -0,0 +1,265 @@
+import os
+import secrets
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from .adb import CommandError, CommandResult, CommandRunner, SubprocessRunner
+
+READ_CHUNK_SIZE = 65536
+
+class _PipeReader:
+    def __init__(self, stream) -> None:
+        self._fd = stream.fileno()
+        self._buffer = bytearray()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def _pump(self) -> None:
+        while True:
+            try:
+                chunk = os.read(self._fd, READ_CHUNK_SIZE)
+            except OSError:
+                chunk = b""
+            with self._cond:
+                if not chunk:
+                    self._closed = True
+                    self._cond.notify_all()
+                    return
+                self._buffer.extend(chunk)
+                self._cond.notify_all()
+
+    def read_frame(
+        self, begin: bytes, end: bytes, deadline: Optional[float]
+    ) -> Tuple[bytes, Optional[bytes], bool]:
+        """Wait for `begin\\n ... \\nend<tail>\\n` and consume it.
+
+        Returns the framed payload, the tail after the end sentinel and
+        whether the frame was found before the deadline or EOF.
+        """
+        start_marker = begin + b"\n"
+        end_marker = b"\n" + end
+        start = -1
+        body_start = 0
+        # Where the next search resumes: bytes before it were already
+        # searched, so each wakeup only scans the newly read chunk.
+        scan = 0
+        with self._cond:
+            while True:
+                if start == -1:
+                    start = self._buffer.find(start_marker, scan)
+                    if start == -1:
+                        scan = max(len(self._buffer) - len(start_marker) + 1, 0)
+                    else:
+                        body_start = scan = start + len(start_marker)
+                if start != -1:
+                    stop = self._buffer.find(end_marker, scan)
+                    if stop == -1:
+                        scan = max(len(self._buffer) - len(end_marker) + 1, body_start)
+                    else:
+                        scan = stop
+                        line_end = self._buffer.find(b"\n", stop + len(end_marker))
+                        if line_end != -1:
+                            payload = bytes(self._buffer[body_start:stop])
+                            tail = bytes(self._buffer[stop + len(end_marker):line_end])
+                            del self._buffer[:line_end + 1]
+                            return payload, tail, True
+                if self._closed:
+                    return self._drain(start_marker), None, False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return self._drain(start_marker), None, False
+                self._cond.wait(remaining)
+
+    def _drain(self, start_marker: bytes) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        start = data.find(start_marker)
+        if start != -1:
+            data = data[start + len(start_marker):]
+        return data
+
+
+class _ShellSession:
+    def __init__(self, args: List[str]) -> None:
+        self.args = args
+        self.lock = threading.Lock()
+        self.process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        assert self.process.stdin is not None
+        assert self.process.stdout is not None
+        assert self.process.stderr is not None
+        self._stdin = self.process.stdin
+        self._stdout = _PipeReader(self.process.stdout)
+        self._stderr = _PipeReader(self.process.stderr)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            try:
+                self._stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def kill(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def execute(
+        self,
+        command: str,
+        input_data: Optional[str],
+        timeout: Optional[float],
+        display: str,
+    ) -> Optional[CommandResult]:
+        token = f"__ABO_{secrets.token_hex(8)}"
+        begin = f"{token}_B"
+        end = f"{token}_E"
+        # Run in a subshell so `exit`, `cd` or variable changes in the command
+        # cannot leak into (or terminate) the long-lived session.
+        if input_data is None:
+            body = f"( {command}\n) </dev/null\n"
+        else:
+            data = input_data if input_data.endswith("\n") else input_data + "\n"
+            body = f"( {command}\n) <<'{token}_I'\n{data}{token}_I\n"
+        script = (
+            f"printf '%s\\n' '{begin}'; printf '%s\\n' '{begin}' >&2\n"
+            f"{body}"
+            f"printf '\\n%s:%d\\n' '{end}' $?; printf '\\n%s\\n' '{end}' >&2\n"
+        )
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._stdin.write(script.encode("utf-8"))
+            self._stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+
+        out, tail, out_ok = self._stdout.read_frame(begin.encode(), end.encode(), deadline)
+        err, _, err_ok = self._stderr.read_frame(begin.encode(), end.encode(), deadline)
+        stdout = out.decode("utf-8", errors="replace")
+        stderr = err.decode("utf-8", errors="replace")
+
+        if not (out_ok and err_ok):
+            self.kill()
+            returncode = self.process.returncode
+            if deadline is not None and time.monotonic() >= deadline:
+                raise CommandError(
+                    f"Command timed out after {timeout}s: {display}",
+                    result=CommandResult(returncode=-1, stdout=stdout, stderr=stderr),
+                )
+            return CommandResult(
+                returncode=returncode if returncode is not None else -1,
+                stdout=stdout,
+                stderr=stderr,
+            )
+
+        try:
+            returncode = int((tail or b"").lstrip(b":") or b"-1")
+        except ValueError:
+            returncode = -1
+        return CommandResult(returncode=returncode, stdout=stdout, stderr=stderr)
+
+
+class ShellSessionRunner(CommandRunner):
+    """Keeps one long-lived `adb shell` per serial and multiplexes commands over it.
+
+    Only `adb [-s SERIAL] shell ...` invocations use the session; everything else
+    (for example `adb devices`) goes to the delegate runner.
+    """
+
+    def __init__(self, delegate: Optional[CommandRunner] = None) -> None:
+        self.delegate = delegate or SubprocessRunner()
+        self._sessions: Dict[Tuple[str, ...], _ShellSession] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def split_shell_args(args: Sequence[str]) -> Optional[Tuple[List[str], List[str]]]:
+        args = list(args)
+        if not args or args[0] != "adb":
+            return None
+        if len(args) >= 2 and args[1] == "shell":
+            return args[:2], args[2:]
+        if len(args) >= 4 and args[1] == "-s" and args[3] == "shell":
+            return args[:4], args[4:]
+        return None
+
+    def _spawn_args(self, prefix: List[str]) -> List[str]:
+        return prefix
+
+    def _session(self, prefix: List[str]) -> _ShellSession:
+        key = tuple(prefix)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None or not session.alive():
+                session = _ShellSession(self._spawn_args(prefix))
+                self._sessions[key] = session
+            return session
+
+    def _discard(self, prefix: List[str], session: _ShellSession) -> None:
+        with self._lock:
+            if self._sessions.get(tuple(prefix)) is session:
+                del self._sessions[tuple(prefix)]
+        session.kill()
+
+    def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        split = self.split_shell_args(args)
+        if split is None:
+            return self.delegate.run(args, input_data=input_data, timeout=timeout)
+        prefix, shell_args = split
+        # adb joins shell arguments with spaces and lets the device shell parse
+        # them, so the session does the same to keep quoting behaviour identical.
+        command = " ".join(shell_args) if shell_args else "sh"
+
+        try:
+            session = self._session(prefix)
+        except OSError:
+            return self.delegate.run(args, input_data=input_data, timeout=timeout)
+
+        with session.lock:
+            try:
+                result = session.execute(command, input_data, timeout, " ".join(args))
+            except CommandError:
+                self._discard(prefix, session)
+                raise
+            if result is None or not session.alive():
+                self._discard(prefix, session)
+            if result is None:
+                # The session died before accepting the command; fall back to a one-shot adb.
+                return self.delegate.run(args, input_data=input_data, timeout=timeout)
+            return result
+
+    def which(self, name: str) -> Optional[str]:
+        return self.delegate.which(name)
+
+    def close(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __enter__(self) -> "ShellSessionRunner":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
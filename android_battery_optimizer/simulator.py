@@ -0,0 +1,622 @@
+import copy
+import random
+import shlex
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .adb import CommandResult, CommandRunner
+from .operations import STANDBY_BUCKET_MAP
+
+SIMULATED_SERIAL = "sim-0001"
+APPOP_MODES = {"allow", "ignore", "deny", "default", "foreground", "errored"}
+DEFAULT_PACKAGE_OPS = ("WAKE_LOCK", "RUN_IN_BACKGROUND", "RUN_ANY_IN_BACKGROUND")
+SYSTEM_PACKAGE_NAMES = (
+    "android",
+    "com.android.systemui",
+    "com.android.phone",
+    "com.android.settings",
+    "com.android.launcher3",
+    "com.android.dialer",
+    "com.android.messaging",
+    "com.google.android.gms",
+    "com.google.android.inputmethod.latin",
+    "com.samsung.android.game.gos",
+)
+
+class _ScriptExit(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(status)
+        self.status = status
+
+@dataclass
+class SimulatedPackage:
+    name: str
+    uid: int
+    third_party: bool = True
+    enabled: bool = True
+    bucket: int = 10
+    appops: Dict[str, str] = field(default_factory=dict)
+    last_used_ms: int = 0
+    alarms: bool = False
+    jobs: bool = False
+    wakelocks: bool = False
+
+@dataclass
+class SimulatedDevice:
+    """In-memory Android device state behind SimulatedDeviceRunner.
+
+    Covers the shell surface the optimizer uses: settings, device_config,
+    cmd appops, dumpsys, am standby buckets, pm and getprop.
+    """
+
+    serial: str = SIMULATED_SERIAL
+    properties: Dict[str, str] = field(default_factory=dict)
+    boot_id: str = "00000000-0000-4000-8000-000000000001"
+    settings: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    device_config: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    packages: Dict[str, SimulatedPackage] = field(default_factory=dict)
+    # Extra filler lines per dumpsys service to emulate large real-world dumps.
+    dumpsys_padding_lines: int = 0
+    # Secondary users (work profiles): user id -> that user's packages.
+    profiles: Dict[int, Dict[str, SimulatedPackage]] = field(default_factory=dict)
+
+    @classmethod
+    def generate(
+        cls,
+        package_count: int = 200,
+        seed: int = 0,
+        serial: str = SIMULATED_SERIAL,
+        brand: str = "google",
+        sdk: int = 34,
+        dumpsys_padding_lines: int = 0,
+    ) -> "SimulatedDevice":
+        rng = random.Random(seed)
+        now_ms = 1_700_000_000_000
+        device = cls(serial=serial, dumpsys_padding_lines=dumpsys_padding_lines)
+        device.properties = {
+            "ro.product.brand": brand,
+            "ro.product.model": "Simulated Phone",
+            "ro.build.version.release": str(max(sdk - 20, 8)),
+            "ro.build.version.sdk": str(sdk),
+            "ro.build.fingerprint": f"{brand}/sim/sim:{sdk}/SIM.{seed}/1:user/release-keys",
+            "ro.serialno": serial,
+        }
+        device.settings = {
+            "global": {
+                "window_animation_scale": "1.0",
+                "transition_animation_scale": "1.0",
+                "animator_duration_scale": "1.0",
+                "ble_scan_always_enabled": "1",
+                "wifi_scan_throttle_enabled": "0",
+                "mobile_data_always_on": "1",
+                "adaptive_battery_management_enabled": "1",
+                "low_power": "0",
+            },
+            "system": {"screen_brightness": "128", "nearby_scanning_enabled": "1"},
+            "secure": {
+                "default_input_method": "com.google.android.inputmethod.latin/.LatinIME",
+                "sms_default_application": "com.android.messaging",
+                "enabled_accessibility_services": "",
+            },
+        }
+        device.device_config = {
+            "activity_manager": {"max_cached_processes": "32"},
+            "device_idle": {"light_idle_to": "300000", "inactive_to": "1800000"},
+        }
+
+        names: List[Tuple[str, bool]] = [(name, False) for name in SYSTEM_PACKAGE_NAMES]
+        index = 0
+        while len(names) < package_count:
+            names.append((f"com.example.app{index:04d}", True))
+            index += 1
+        for offset, (name, third_party) in enumerate(names[:max(package_count, 1)]):
+            appops = {op: "allow" for op in DEFAULT_PACKAGE_OPS[: 1 + offset % len(DEFAULT_PACKAGE_OPS)]}
+            device.packages[name] = SimulatedPackage(
+                name=name,
+                uid=10000 + offset,
+                third_party=third_party,
+                bucket=rng.choice((10, 10, 20, 30, 40)),
+                appops=appops,
+                last_used_ms=now_ms - rng.randint(0, 30) * 86_400_000,
+                alarms=rng.random() < 0.4,
+                jobs=rng.random() < 0.4,
+                wakelocks=rng.random() < 0.3,
+            )
+        return device
+
+    def add_profile(self, user: int) -> Dict[str, SimulatedPackage]:
+        """Install a copy of the owner's packages for `user`, as a work profile does."""
+        packages = copy.deepcopy(self.packages)
+        for pkg in packages.values():
+            pkg.uid += user * 100000
+        self.profiles[user] = packages
+        return packages
+
+    def packages_of(self, user: int) -> Optional[Dict[str, SimulatedPackage]]:
+        return self.packages if user == 0 else self.profiles.get(user)
+
+    def package_state(self) -> Dict[str, Tuple[bool, int, Tuple[Tuple[str, str], ...]]]:
+        """Comparable summary of per-package state for before/after checks."""
+        return {
+            name: (pkg.enabled, pkg.bucket, tuple(sorted(pkg.appops.items())))
+            for name, pkg in self.packages.items()
+        }
+
+
+class SimulatedDeviceRunner(CommandRunner):
+    """CommandRunner that answers `adb` invocations from SimulatedDevice state.
+
+    `latency` seconds are slept per invocation to model the adb round trip.
+    Scripts sent on stdin are run by a small interpreter that understands
+    `;`, `&&`, `||`, `exit`, `echo`, `printf`, `true`/`false` and `$?`.
+    """
+
+    def __init__(self, devices: Sequence[SimulatedDevice], latency: float = 0.0) -> None:
+        self.devices = {device.serial: device for device in devices}
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def which(self, name: str) -> Optional[str]:
+        return "/sim/adb" if name == "adb" else None
+
+    def run(
+        self,
+        args: Sequence[str],
+        input_data: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> CommandResult:
+        if self.latency:
+            time.sleep(self.latency)
+        args = list(args)
+        with self._lock:
+            self.calls += 1
+            if args == ["adb", "devices"]:
+                lines = [f"{serial}\tdevice" for serial in self.devices]
+                return CommandResult(0, "List of devices attached\n" + "\n".join(lines) + "\n\n", "")
+            if not args or args[0] != "adb":
+                return CommandResult(127, "", f"{args[0] if args else ''}: not simulated\n")
+            rest = args[1:]
+            serial: Optional[str] = None
+            if len(rest) >= 2 and rest[0] == "-s":
+                serial = rest[1]
+                rest = rest[2:]
+            device = self._device(serial)
+            if device is None:
+                message = f"device '{serial}' not found" if serial else "more than one device/emulator"
+                return CommandResult(1, "", f"adb: {message}\n")
+            if not rest or rest[0] != "shell":
+                return CommandResult(1, "", f"adb: unsupported command {' '.join(rest)}\n")
+            shell = _Shell(device)
+            if len(rest) > 1:
+                return shell.run_script(" ".join(rest[1:]))
+            return shell.run_script(input_data or "")
+
+    def _device(self, serial: Optional[str]) -> Optional[SimulatedDevice]:
+        if serial is not None:
+            return self.devices.get(serial)
+        if len(self.devices) == 1:
+            return next(iter(self.devices.values()))
+        return None
+
+
+class _Shell:
+    def __init__(self, device: SimulatedDevice) -> None:
+        self.device = device
+        self.stdout: List[str] = []
+        self.stderr: List[str] = []
+        self.status = 0
+        self.commands: Dict[str, Callable[[List[str]], int]] = {
+            "echo": self._echo,
+            "printf": self._printf,
+            "true": lambda argv: 0,
+            "false": lambda argv: 1,
+            "exit": self._exit,
+            "cat": self._cat,
+            "getprop": self._getprop,
+            "settings": self._settings,
+            "device_config": self._device_config,
+            "cmd": self._cmd,
+            "dumpsys": self._dumpsys,
+            "am": self._am,
+            "pm": self._pm,
+            "telecom": self._telecom,
+        }
+
+    # -- interpreter -------------------------------------------------------
+
+    def run_script(self, script: str) -> CommandResult:
+        try:
+            for tokens in self._statements(script):
+                self._run_list(tokens)
+        except _ScriptExit as exc:
+            self.status = exc.status
+        return CommandResult(self.status, "".join(self.stdout), "".join(self.stderr))
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        lexer = shlex.shlex(text, posix=True, punctuation_chars=";&|<>")
+        lexer.whitespace_split = True
+        lexer.commenters = ""
+        return list(lexer)
+
+    def _statements(self, script: str):
+        pending = ""
+        for line in script.split("\n"):
+            pending = f"{pending}\n{line}" if pending else line
+            try:
+                tokens = self._tokenize(pending)
+            except ValueError:
+                # Quoted value spanning several lines; keep reading.
+                continue
+            pending = ""
+            if tokens:
+                yield tokens
+        if pending:
+            yield self._tokenize(pending + "'")
+
+    def _run_list(self, tokens: List[str]) -> None:
+        command: List[str] = []
+        operator: Optional[str] = None
+        for token in tokens + [";"]:
+            if token in {"&&", "||", ";"}:
+                if command:
+                    if operator is None or operator == ";":
+                        self._run_simple(command)
+                    elif operator == "&&" and self.status == 0:
+                        self._run_simple(command)
+                    elif operator == "||" and self.status != 0:
+                        self._run_simple(command)
+                command = []
+                operator = token
+                continue
+            command.append(token)
+
+    def _run_simple(self, argv: List[str]) -> None:
+        words: List[str] = []
+        skip_next = False
+        for token in argv:
+            if skip_next:
+                skip_next = False
+                continue
+            if token in {">", ">>", "<", ">&", "<&"}:
+                if words and words[-1] in {"1", "2"}:
+                    words.pop()
+                skip_next = True
+                continue
+            words.append(token.replace("$?", str(self.status)))
+        if not words:
+            return
+        handler = self.commands.get(words[0])
+        if handler is None:
+            self.stderr.append(f"/system/bin/sh: {words[0]}: inaccessible or not found\n")
+            self.status = 127
+            return
+        self.status = handler(words)
+
+    def _out(self, text: str) -> None:
+        self.stdout.append(text)
+
+    def _err(self, text: str, status: int = 255) -> int:
+        self.stderr.append(text)
+        return status
+
+    def _user_packages(self, args: List[str]) -> Optional[Dict[str, SimulatedPackage]]:
+        # Removes `--user N` from args; None when the user does not exist.
+        user = 0
+        if "--user" in args[:-1]:
+            index = args.index("--user")
+            user = int(args[index + 1]) if args[index + 1].isdigit() else -1
+            del args[index:index + 2]
+        return self.device.packages_of(user)
+
+    # -- builtins ----------------------------------------------------------
+
+    def _echo(self, argv: List[str]) -> int:
+        self._out(" ".join(argv[1:]) + "\n")
+        return 0
+
+    def _printf(self, argv: List[str]) -> int:
+        if len(argv) < 2:
+            return 1
+        fmt = argv[1].replace("\\n", "\n").replace("\\t", "\t")
+        specs = fmt.count("%s") + fmt.count("%d")
+        if not specs:
+            self._out(fmt)
+            return 0
+        template = fmt.replace("%d", "%s")
+        values = argv[2:] or [""]
+        # Like printf(1), the format is reused until every argument is consumed.
+        for start in range(0, len(values), specs):
+            chunk = values[start:start + specs]
+            chunk += [""] * (specs - len(chunk))
+            self._out(template % tuple(chunk))
+        return 0
+
+    def _exit(self, argv: List[str]) -> int:
+        status = self.status
+        if len(argv) > 1:
+            try:
+                status = int(argv[1])
+            except ValueError:
+                status = 2
+        raise _ScriptExit(status)
+
+    def _cat(self, argv: List[str]) -> int:
+        if argv[1:] == ["/proc/sys/kernel/random/boot_id"]:
+            self._out(self.device.boot_id + "\n")
+            return 0
+        return self._err(f"cat: {' '.join(argv[1:])}: No such file or directory\n", 1)
+
+    def _getprop(self, argv: List[str]) -> int:
+        if len(argv) == 1:
+            for key in sorted(self.device.properties):
+                self._out(f"[{key}]: [{self.device.properties[key]}]\n")
+            return 0
+        self._out(self.device.properties.get(argv[1], "") + "\n")
+        return 0
+
+    # -- settings / device_config -------------------------------------------
+
+    def _settings(self, argv: List[str]) -> int:
+        if len(argv) < 3:
+            return self._err("usage: settings [--user N] get|put|delete|list NAMESPACE [KEY [VALUE]]\n")
+        verb, namespace = argv[1], argv[2]
+        if namespace not in ("global", "system", "secure"):
+            return self._err(f"Invalid namespace '{namespace}'\n")
+        table = self.device.settings.setdefault(namespace, {})
+        if verb == "list":
+            for key in sorted(table):
+                self._out(f"{key}={table[key]}\n")
+            return 0
+        if verb == "get" and len(argv) >= 4:
+            self._out(table.get(argv[3], "null") + "\n")
+            return 0
+        if verb == "put" and len(argv) >= 5:
+            table[argv[3]] = argv[4]
+            return 0
+        if verb == "delete" and len(argv) >= 4:
+            deleted = 1 if table.pop(argv[3], None) is not None else 0
+            self._out(f"Deleted {deleted} rows\n")
+            return 0
+        return self._err(f"Invalid settings command: {' '.join(argv[1:])}\n")
+
+    def _device_config(self, argv: List[str]) -> int:
+        if len(argv) < 2:
+            return self._err("usage: device_config get|put|delete|list\n")
+        verb = argv[1]
+        config = self.device.device_config
+        if verb == "list":
+            if len(argv) >= 3:
+                table = config.get(argv[2], {})
+                for key in sorted(table):
+                    self._out(f"{key}={table[key]}\n")
+            else:
+                for namespace in sorted(config):
+                    for key in sorted(config[namespace]):
+                        self._out(f"{namespace}/{key}={config[namespace][key]}\n")
+            return 0
+        if verb == "get" and len(argv) >= 4:
+            self._out(config.get(argv[2], {}).get(argv[3], "null") + "\n")
+            return 0
+        if verb == "put" and len(argv) >= 5:
+            config.setdefault(argv[2], {})[argv[3]] = argv[4]
+            return 0
+        if verb == "delete" and len(argv) >= 4:
+            existed = config.get(argv[2], {}).pop(argv[3], None) is not None
+            self._out("Successfully deleted\n" if existed else "Failed to delete\n")
+            return 0
+        return self._err(f"Invalid device_config command: {' '.join(argv[1:])}\n")
+
+    # -- cmd ---------------------------------------------------------------
+
+    def _cmd(self, argv: List[str]) -> int:
+        if len(argv) < 2:
+            return self._err("cmd: no service specified\n")
+        service = argv[1]
+        if service == "appops":
+            return self._appops(argv[2:])
+        if service == "package":
+            sub = argv[2] if len(argv) > 2 else ""
+            if sub == "resolve-activity":
+                self._out(
+                    "priority=0 preferredOrder=0 match=0x108000 specificIndex=-1 isDefault=true\n"
+                    "ActivityInfo:\n  name=com.android.launcher3.Launcher\n"
+                    "  packageName=com.android.launcher3\n"
+                )
+                return 0
+            if sub == "bg-dexopt-job":
+                self._out("Success\n")
+                return 0
+            return self._err(f"Unknown command: {sub}\n")
+        if service == "companiondevice":
+            return 0
+        return self._err(f"cmd: Can't find service: {service}\n", 20)
+
+    def _appops(self, argv: List[str]) -> int:
+        if not argv:
+            return self._err("usage: appops get|set\n")
+        argv = list(argv)
+        packages = self._user_packages(argv)
+        if packages is None:
+            return self._err("Error: Unknown user\n", 255)
+        verb = argv[0]
+        if verb == "get" and len(argv) >= 2:
+            pkg = packages.get(argv[1])
+            if pkg is None:
+                if argv[1] == "android":
+                    self._out("No operations.\n")
+                    return 0
+                return self._err(f"Error: Unknown package: {argv[1]}\n", 255)
+            ops = pkg.appops
+            if len(argv) >= 3:
+                ops = {argv[2]: ops[argv[2]]} if argv[2] in ops else {}
+            if not ops:
+                self._out("No operations.\n")
+                return 0
+            for op, mode in ops.items():
+                self._out(f"{op}: {mode}; time=+1h2m ago\n")
+            return 0
+        if verb == "set" and len(argv) >= 4:
+            pkg = packages.get(argv[1])
+            if pkg is None:
+                return self._err(f"Error: Unknown package: {argv[1]}\n", 255)
+            mode = argv[3].lower()
+            if mode not in APPOP_MODES:
+                return self._err(f"Error: Mode {argv[3]} is not valid\n", 255)
+            if mode == "default":
+                pkg.appops.pop(argv[2], None)
+            else:
+                pkg.appops[argv[2]] = mode
+            return 0
+        return self._err(f"Error: unknown appops command {verb}\n", 255)
+
+    # -- dumpsys -----------------------------------------------------------
+
+    def _padding(self, label: str) -> None:
+        for index in range(self.device.dumpsys_padding_lines):
+            self._out(f"  {label} history #{index}: stats=+{index}ms unrelated.service.entry\n")
+
+    def _all_user_packages(self) -> List[SimulatedPackage]:
+        packages = list(self.device.packages.values())
+        for profile in self.device.profiles.values():
+            packages.extend(profile.values())
+        return packages
+
+    def _dumpsys(self, argv: List[str]) -> int:
+        service = argv[1] if len(argv) > 1 else ""
+        packages = list(self.device.packages.values())
+        if service == "appops":
+            only_op = argv[argv.index("--op") + 1] if "--op" in argv[:-1] else None
+            self._out("Current AppOps Service state:\n  Settings:\n    top_state_settle_time=+5s0ms\n")
+            for pkg in self._all_user_packages():
+                ops = {op: mode for op, mode in pkg.appops.items() if only_op in (None, op)}
+                if not ops:
+                    continue
+                self._out(f"  Uid u{pkg.uid // 100000}a{pkg.uid % 100000 - 10000}:\n    state=cch\n")
+                self._out(f"    Package {pkg.name}:\n")
+                for op, mode in ops.items():
+                    self._out(f"      {op}: {mode}; time=+1h2m3s ago\n")
+            return 0
+        if service == "usagestats":
+            self._out("user=0\n  In-memory daily stats\n    packages\n")
+            for pkg in packages:
+                self._out(
+                    f"      package={pkg.name} totalTimeUsed=\"00:12\" "
+                    f"lastTimeUsed=\"{pkg.last_used_ms}\" launchCount=3\n"
+                )
+            self._padding("usagestats")
+            self._out("\n  App Standby States:\n")
+            for pkg in self._all_user_packages():
+                self._out(
+                    f"    package={pkg.name} u={pkg.uid // 100000} bucket={pkg.bucket} reason=d-u used=+1h "
+                    f"idle=n totalElapsed=+12d\n"
+                )
+            return 0
+        if service == "alarm":
+            self._out("Current Alarm Manager state:\n  Pending alarm batches:\n")
+            for pkg in packages:
+                if pkg.alarms:
+                    self._out(f"    RTC_WAKEUP #0: Alarm{{1a2b type 0 origWhen 1 {pkg.name}}}\n")
+            self._padding("alarm")
+            return 0
+        if service == "jobscheduler":
+            self._out("Registered jobs:\n")
+            for pkg in packages:
+                if pkg.jobs:
+                    self._out(f"  JOB #u0a{pkg.uid - 10000}/1: 5e6f {pkg.name}/.SyncJob\n")
+            self._padding("jobscheduler")
+            return 0
+        if service == "batterystats":
+            self._out("Battery History:\n")
+            for pkg in packages:
+                if pkg.wakelocks:
+                    self._out(f"  Wake lock u0a{pkg.uid - 10000} {pkg.name}: 4m 2s (12 times) realtime\n")
+            self._padding("batterystats")
+            self._out("Estimated power use (mAh):\n  Capacity: 4000, Computed drain: 812\n")
+            return 0
+        if service == "deviceidle":
+            self._out("  mState=ACTIVE mLightState=ACTIVE\n")
+            return 0
+        if service == "battery":
+            self._out("Current Battery Service state:\n  level: 80\n  status: 3\n")
+            return 0
+        return self._err(f"Can't find service: {service}\n", 0)
+
+    # -- am / pm / telecom -------------------------------------------------
+
+    def _am(self, argv: List[str]) -> int:
+        argv = list(argv)
+        packages = self._user_packages(argv)
+        if packages is None:
+            return self._err("Error: Unknown user\n", 255)
+        verb = argv[1] if len(argv) > 1 else ""
+        if verb == "get-standby-bucket":
+            if len(argv) == 2:
+                for pkg in packages.values():
+                    self._out(f"{pkg.name}: {pkg.bucket}\n")
+                return 0
+            if argv[2] == "android":
+                self._out("5\n")
+                return 0
+            pkg = packages.get(argv[2])
+            if pkg is None:
+                return self._err(f"Unknown package: {argv[2]}\n", 255)
+            self._out(f"{pkg.bucket}\n")
+            return 0
+        if verb == "set-standby-bucket" and len(argv) >= 4:
+            pkg = packages.get(argv[2])
+            if pkg is None:
+                return self._err(f"Unknown package: {argv[2]}\n", 255)
+            value = STANDBY_BUCKET_MAP.get(argv[3].lower(), argv[3])
+            if not value.isdigit():
+                return self._err(f"Error: unknown bucket: {argv[3]}\n", 255)
+            pkg.bucket = int(value)
+            return 0
+        if verb == "help":
+            self._out("Activity manager (activity) commands:\n  set-standby-bucket\n  get-standby-bucket\n")
+            return 0
+        return self._err(f"Unknown command: {verb}\n", 255)
+
+    def _pm(self, argv: List[str]) -> int:
+        args = argv[1:]
+        packages = self._user_packages(args)
+        if packages is None:
+            return self._err("Error: Unknown user\n", 255)
+        if args[:2] == ["list", "users"]:
+            self._out("Users:\n\tUserInfo{0:Owner:c13} running\n")
+            for user in sorted(self.device.profiles):
+                self._out(f"\tUserInfo{{{user}:Work profile:1030}} running\n")
+            return 0
+        if args[:2] == ["list", "packages"]:
+            flags = {arg for arg in args[2:] if arg.startswith("-")}
+            filters = [arg for arg in args[2:] if not arg.startswith("-")]
+            for pkg in packages.values():
+                if "-3" in flags and not pkg.third_party:
+                    continue
+                if "-s" in flags and pkg.third_party:
+                    continue
+                if "-e" in flags and not pkg.enabled:
+                    continue
+                if "-d" in flags and pkg.enabled:
+                    continue
+                if filters and not any(text in pkg.name for text in filters):
+                    continue
+                self._out(f"package:{pkg.name}\n")
+            return 0
+        if args and args[0] in ("enable", "disable-user") and len(args) >= 2:
+            pkg = packages.get(args[1])
+            if pkg is None:
+                return self._err(f"Error: Unknown package: {args[1]}\n", 255)
+            pkg.enabled = args[0] == "enable"
+            state = "enabled" if pkg.enabled else "disabled-user"
+            self._out(f"Package {pkg.name} new state: {state}\n")
+            return 0
+        return self._err(f"Unknown command: {' '.join(args)}\n", 255)
+
+    def _telecom(self, argv: List[str]) -> int:
+        if argv[1:] == ["get-default-dialer"]:
+            self._out("com.android.dialer\n")
+            return 0
+        return self._err("Unknown command\n", 255)
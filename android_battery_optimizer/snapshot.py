@@ -1,94 +1,591 @@
+import math
 import re
-from typing import Dict, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 from .adb import AdbClient, CommandError
+from .appops import parse_appops, parse_op_line
+from .async_adb import MAX_CONCURRENT_COMMANDS, call_concurrently
+from .users import DEFAULT_USER, package_key, split_package_key, user_args
 
 PACKAGE_USER_ID = "0"
 
 class SnapshotError(RuntimeError):
     pass
 
-def read_settings_namespace(client: AdbClient, namespace: str) -> Dict[str, str]:
-    result = client.shell(["settings", "list", namespace], check=False)
+# `settings list` / `device_config list` entry: the key runs to the first `=`.
+NAMESPACE_ENTRY_RE = re.compile(r"([^\s=]+)=(.*)$")
+NAMESPACE_MARKER = "__ABO_NAMESPACE__"
+
+def parse_namespace_listing(lines: Iterable[str]) -> Dict[str, str]:
+    """Parse `settings list` or `device_config list` output.
+
+    A value runs until the next `key=` line, so it may contain `=` and span
+    several lines.
+    """
+    values: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    for line in lines:
+        match = NAMESPACE_ENTRY_RE.match(line)
+        if match:
+            current = values[match.group(1)] = [match.group(2)]
+        elif current is not None:
+            current.append(line)
+    return {key: "\n".join(parts).strip() for key, parts in values.items()}
+
+def _read_namespace(client: AdbClient, tool: str, namespace: str) -> Dict[str, str]:
+    result = client.shell([tool, "list", namespace], check=False)
     if result.returncode != 0:
         err = result.stderr.strip() or result.stdout.strip()
-        raise SnapshotError(f"Failed to list settings in {namespace}: {err}")
+        raise SnapshotError(f"Failed to list {tool} in {namespace}: {err}")
+    return parse_namespace_listing(result.stdout.splitlines())
 
-    cache = {}
-    for line in result.stdout.splitlines():
-        if "=" in line:
-            k, v = line.split("=", 1)
-            cache[k.strip()] = v.strip()
-    return cache
+def read_settings_namespace(client: AdbClient, namespace: str) -> Dict[str, str]:
+    return _read_namespace(client, "settings", namespace)
 
 def read_device_config_namespace(client: AdbClient, namespace: str) -> Dict[str, str]:
-    result = client.shell(["device_config", "list", namespace], check=False)
-    if result.returncode != 0:
-        err = result.stderr.strip() or result.stdout.strip()
-        raise SnapshotError(f"Failed to list device_config in {namespace}: {err}")
+    return _read_namespace(client, "device_config", namespace)
 
-    cache = {}
-    for line in result.stdout.splitlines():
-        if "=" in line:
-            k, v = line.split("=", 1)
-            cache[k.strip()] = v.strip()
-    return cache
-
-def prefetch_package_states(client: AdbClient) -> Tuple[bool, Dict[str, bool], bool, Dict[str, Dict[str, str]], bool, Dict[str, str]]:
-    package_enabled_cache: Dict[str, bool] = {}
-    appops_cache: Dict[str, Dict[str, str]] = {}
+NamespaceListing = Union[Dict[str, str], SnapshotError]
+
+def read_namespaces(
+    client: AdbClient, namespaces: Sequence[Tuple[str, str]]
+) -> Dict[Tuple[str, str], NamespaceListing]:
+    """List several (tool, namespace) pairs, e.g. ("settings", "global").
+
+    All listings share one shell invocation; a failed namespace gets its
+    SnapshotError in place of the values. Shells that do not echo the
+    section markers get one read per namespace.
+    """
+    namespaces = list(dict.fromkeys(namespaces))
+    if not namespaces:
+        return {}
+    names = [f"{tool}:{namespace}" for tool, namespace in namespaces]
+    args: List[str] = []
+    for name, (tool, namespace) in zip(names, namespaces):
+        if args:
+            args.append(";")
+        args.extend([tool, "list", namespace, ";", "echo", NAMESPACE_MARKER, name, "$?"])
+
+    stream = client.stream_lines(args, check=False)
+    sections = _MarkedSections(stream, NAMESPACE_MARKER)
+    listings: Dict[Tuple[str, str], NamespaceListing] = {}
+    try:
+        for name, (tool, namespace) in zip(names, namespaces):
+            values = parse_namespace_listing(sections.section(name))
+            status = sections.statuses[name]
+            listings[(tool, namespace)] = values if status == 0 else SnapshotError(
+                f"Failed to list {tool} in {namespace}: exit status {status}"
+            )
+    except _MalformedSections:
+        listings = {}
+    finally:
+        stream.close()
+    if listings:
+        return listings
+
+    def read(tool: str, namespace: str) -> Dict[str, str]:
+        return _read_namespace(client, tool, namespace)
+
+    results = call_concurrently([
+        lambda tool=tool, namespace=namespace: read(tool, namespace)
+        for tool, namespace in namespaces
+    ])
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, SnapshotError):
+            raise result
+    return dict(zip(namespaces, results))
+
+USAGESTATS_PACKAGE_RE = re.compile(r"package=([a-zA-Z0-9_\.]+)")
+USAGESTATS_BUCKET_RE = re.compile(r"bucket=(\d+|[a-zA-Z_]+)")
+USAGESTATS_USER_RE = re.compile(r"\bu=(\d+)")
+
+APPOPS_HEADER = "Current AppOps Service state"
+# `dumpsys appops --op <OP>` first appeared in Android 9.
+APPOPS_OP_FILTER_MIN_SDK = 28
+
+def parse_appops_dump(lines: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    # Keyed by `users.package_key`, so other users' packages get a `<user>/` prefix.
+    return {
+        package_key(package, user): ops
+        for (user, package), ops in parse_appops(lines).packages.items()
+    }
+
+def parse_filtered_appops_dump(lines: Iterable[str]) -> Optional[Dict[str, Dict[str, str]]]:
+    # None when the header is missing: the build ignored or rejected `--op`.
+    seen_header = False
+
+    def watch(lines: Iterable[str]) -> Iterator[str]:
+        nonlocal seen_header
+        for line in lines:
+            if not seen_header and APPOPS_HEADER in line:
+                seen_header = True
+            yield line
+
+    modes = parse_appops_dump(watch(lines))
+    return modes if seen_header else None
+
+def parse_usagestats_buckets(lines: Iterable[str]) -> Dict[str, str]:
     standby_bucket_cache: Dict[str, str] = {}
+    for line in lines:
+        if "package=" in line and "bucket=" in line:
+            pkg_match = USAGESTATS_PACKAGE_RE.search(line)
+            bucket_match = USAGESTATS_BUCKET_RE.search(line)
+            if pkg_match and bucket_match:
+                user_match = USAGESTATS_USER_RE.search(line)
+                user = int(user_match.group(1)) if user_match else DEFAULT_USER
+                standby_bucket_cache[package_key(pkg_match.group(1), user)] = bucket_match.group(1)
+    return standby_bucket_cache
+
+def parse_package_list(lines: Iterable[str]) -> List[str]:
+    return [line.split(":", 1)[1].strip() for line in lines if ":" in line]
+
+PrefetchSection = Tuple[str, List[str], Callable[[Iterable[str]], Any]]
+
+# Section name, command and parser of each prefetch read, in script order.
+PREFETCH_SECTIONS: Tuple[PrefetchSection, ...] = (
+    ("disabled", ["pm", "list", "packages", "--user", PACKAGE_USER_ID, "-d"], parse_package_list),
+    ("enabled", ["pm", "list", "packages", "--user", PACKAGE_USER_ID, "-e"], parse_package_list),
+    ("appops", ["dumpsys", "appops"], parse_appops_dump),
+    ("usagestats", ["dumpsys", "usagestats"], parse_usagestats_buckets),
+)
+
+def _package_list_sections(user: int) -> List[PrefetchSection]:
+    suffix = "" if user == DEFAULT_USER else f"-{user}"
+
+    def parse(lines: Iterable[str]) -> List[str]:
+        return [package_key(package, user) for package in parse_package_list(lines)]
+
+    return [
+        (f"{state}{suffix}", ["pm", "list", "packages", "--user", str(user), flag], parse)
+        for state, flag in (("disabled", "-d"), ("enabled", "-e"))
+    ]
+
+def _appops_op_section(op: str) -> PrefetchSection:
+    return (f"appops-{op}", ["dumpsys", "appops", "--op", op], parse_filtered_appops_dump)
+
+def prefetch_sections(
+    appops_ops: Optional[Sequence[str]] = None, users: Sequence[int] = (DEFAULT_USER,)
+) -> Tuple[PrefetchSection, ...]:
+    """The prefetch reads; with `appops_ops`, one filtered appops read per op.
 
-    prefetch_package_enabled_success = False
+    Package lists are read per user; the dumps already cover every user.
+    """
+    sections = list(PREFETCH_SECTIONS)
+    if appops_ops is not None:
+        sections[2:3] = [_appops_op_section(op) for op in appops_ops]
+    for user in users:
+        if user != DEFAULT_USER:
+            sections[-1:-1] = _package_list_sections(user)
+    return tuple(sections)
+
+PACKAGE_DATA_KINDS = ("enabled", "appops", "standby_bucket")
+
+def _section_kind(name: str) -> str:
+    if name.partition("-")[0] in ("disabled", "enabled"):
+        return "enabled"
+    if name == "usagestats":
+        return "standby_bucket"
+    return "appops"
+
+PREFETCH_MARKER = "__ABO_PREFETCH__"
+
+class _MalformedSections(Exception):
+    pass
+
+class _MarkedSections:
+    """Splits the output of a compound shell command into sections in one pass.
+
+    Every section ends with `<marker> <name> <exit code>`; the marker may
+    share a line with output that lacked a trailing newline.
+    """
+
+    def __init__(self, lines: Iterable[str], marker: str) -> None:
+        self.lines = iter(lines)
+        self.marker = marker
+        self.statuses: Dict[str, int] = {}
+
+    def section(self, name: str) -> Iterator[str]:
+        for line in self.lines:
+            head, marker, tail = line.partition(self.marker)
+            if not marker:
+                yield line
+                continue
+            if head:
+                yield head
+            parts = tail.split()
+            if len(parts) != 2 or parts[0] != name or not parts[1].lstrip("-").isdigit():
+                raise _MalformedSections(line)
+            self.statuses[name] = int(parts[1])
+            return
+        raise _MalformedSections(f"missing {name} section")
+
+def prefetch_script(sections: Sequence[PrefetchSection] = PREFETCH_SECTIONS) -> List[str]:
+    args: List[str] = []
+    for name, command, _ in sections:
+        if args:
+            args.append(";")
+        args.extend(command + [";", "echo", PREFETCH_MARKER, name, "$?"])
+    return args
+
+def _prefetch_in_one_round_trip(
+    client: AdbClient, spec: Sequence[PrefetchSection], stream_output: bool = True
+) -> Optional[Dict[str, Any]]:
+    # Returns None when the device shell did not produce the delimited output,
+    # so the caller can fall back to separate reads.
+    if stream_output:
+        stream = client.stream_lines(
+            prefetch_script(spec), check=False, timeout=client.LONG_TIMEOUT_SECONDS
+        )
+    else:
+        try:
+            result = client.shell(prefetch_script(spec), check=False, timeout=client.LONG_TIMEOUT_SECONDS)
+        except CommandError:
+            return None
+        stream = (line for line in result.stdout.splitlines())
+    sections = _MarkedSections(stream, PREFETCH_MARKER)
+    parsed: Dict[str, Any] = {}
     try:
-        disabled = client.shell_text([
-            "pm", "list", "packages", "--user", PACKAGE_USER_ID, "-d"
-        ])
-        enabled = client.shell_text([
-            "pm", "list", "packages", "--user", PACKAGE_USER_ID, "-e"
-        ])
-        for line in disabled.splitlines():
-            if ":" in line:
-                package_enabled_cache[line.split(":", 1)[1].strip()] = False
-        for line in enabled.splitlines():
-            if ":" in line:
-                package_enabled_cache[line.split(":", 1)[1].strip()] = True
-        prefetch_package_enabled_success = True
+        for name, _, parse in spec:
+            parsed[name] = parse(sections.section(name))
+    except _MalformedSections:
+        return None
     except CommandError:
-        pass
+        # Timed out part-way: keep the sections that completed.
+        if not sections.statuses:
+            return None
+    finally:
+        stream.close()
+    return {
+        name: parsed[name] if sections.statuses.get(name) == 0 else None
+        for name, _, _ in spec
+    }
+
+def _prefetch_concurrently(
+    client: AdbClient, spec: Sequence[PrefetchSection], stream_output: bool = True
+) -> Dict[str, Any]:
+    def read(command: List[str], parse: Callable[[Iterable[str]], Any]) -> Any:
+        if command[0] == "pm" or not stream_output:
+            # Package lists are small; only the dumps are worth streaming.
+            return parse(client.shell_text(command).splitlines())
+        return parse(client.stream_lines(command))
+
+    outputs = call_concurrently([
+        lambda command=command, parse=parse: read(command, parse)
+        for _, command, parse in spec
+    ])
+    for output in outputs:
+        if isinstance(output, BaseException) and not isinstance(output, CommandError):
+            raise output
+    return {
+        name: None if isinstance(output, BaseException) else output
+        for (name, _, _), output in zip(spec, outputs)
+    }
+
+def read_sections(
+    client: AdbClient, spec: Sequence[PrefetchSection], stream_output: bool = True
+) -> Dict[str, Any]:
+    """name -> parsed output of each read in `spec`, None where the read failed.
 
-    prefetch_appops_success = False
+    All reads go out as one compound shell command; a shell that does not
+    echo the section markers gets the reads issued separately. Without
+    `stream_output` the output is read in one piece.
+    """
+    sections = _prefetch_in_one_round_trip(client, spec, stream_output)
+    if sections is None:
+        sections = _prefetch_concurrently(client, spec, stream_output)
+    return sections
+
+def supports_appops_op_filter(client: AdbClient) -> bool:
     try:
-        appops = client.shell_text(["dumpsys", "appops"])
-        current_pkg = None
-        for line in appops.splitlines():
-            pkg_match = re.search(r"Package\s+([a-zA-Z0-9_\.]+):", line)
-            if pkg_match:
-                current_pkg = pkg_match.group(1)
-                appops_cache.setdefault(current_pkg, {})
-                continue
-            if current_pkg:
-                op_match = re.search(r"\s+([A-Z_a-z0-9]+):\s*([a-zA-Z0-9_]+)", line)
-                if op_match:
-                    appops_cache.setdefault(current_pkg, {})[op_match.group(1)] = op_match.group(2)
-        prefetch_appops_success = True
+        return client.get_device_info_struct().sdk_int >= APPOPS_OP_FILTER_MIN_SDK
     except CommandError:
-        pass
+        return False
+
+def _merge_appops(parts: Sequence[Optional[Dict[str, Dict[str, str]]]]) -> Optional[Dict[str, Dict[str, str]]]:
+    merged: Dict[str, Dict[str, str]] = {}
+    for part in parts:
+        if part is None:
+            return None
+        for package, modes in part.items():
+            merged.setdefault(package, {}).update(modes)
+    return merged
 
-    prefetch_standby_bucket_success = False
+def read_appops(
+    client: AdbClient, ops: Sequence[str], use_filter: bool = True
+) -> Optional[Dict[str, Dict[str, str]]]:
+    """package -> op -> mode for `ops`, or None if the dump could not be read.
+
+    Filtered dumps only list packages with a recorded mode for the op.
+    """
     try:
-        usagestats = client.shell_text(["dumpsys", "usagestats"])
-        for line in usagestats.splitlines():
-            if "package=" in line and "bucket=" in line:
-                pkg_match = re.search(r"package=([a-zA-Z0-9_\.]+)", line)
-                bucket_match = re.search(r"bucket=(\d+|[a-zA-Z_]+)", line)
-                if pkg_match and bucket_match:
-                    standby_bucket_cache[pkg_match.group(1)] = bucket_match.group(1)
-        prefetch_standby_bucket_success = True
+        if use_filter and supports_appops_op_filter(client):
+            merged = _merge_appops([
+                parse_filtered_appops_dump(client.stream_lines(["dumpsys", "appops", "--op", op]))
+                for op in ops
+            ])
+            if merged is not None:
+                return merged
+        return parse_appops_dump(client.stream_lines(["dumpsys", "appops"]))
     except CommandError:
-        pass
+        return None
+
+def _bulk_package_states(
+    client: AdbClient,
+    appops_ops: Optional[Sequence[str]],
+    kinds: Sequence[str],
+    users: Sequence[int] = (DEFAULT_USER,),
+) -> Dict[str, Optional[Any]]:
+    # kind -> data read from the device-wide lists and dumps, None on failure.
+    ops: Optional[List[str]] = None
+    if appops_ops is not None and (not appops_ops or supports_appops_op_filter(client)):
+        ops = list(dict.fromkeys(appops_ops))
+    spec = [
+        section for section in prefetch_sections(ops, users)
+        if _section_kind(section[0]) in kinds
+    ]
 
+    sections = read_sections(client, spec)
+
+    states: Dict[str, Optional[Any]] = {}
+    if "enabled" in kinds:
+        package_enabled: Optional[Dict[str, bool]] = {}
+        for name, _, _ in spec:
+            if _section_kind(name) != "enabled":
+                continue
+            packages = sections[name]
+            if packages is None or package_enabled is None:
+                package_enabled = None
+                continue
+            package_enabled.update(dict.fromkeys(packages, name.startswith("enabled")))
+        states["enabled"] = package_enabled
+    if "appops" in kinds:
+        if ops is None:
+            appops = sections["appops"]
+        else:
+            appops = _merge_appops([sections[f"appops-{op}"] for op in ops])
+            if appops is None:
+                appops = read_appops(client, ops, use_filter=False)
+        states["appops"] = appops
+    if "standby_bucket" in kinds:
+        states["standby_bucket"] = sections["usagestats"]
+    return states
+
+def prefetch_package_states(
+    client: AdbClient,
+    appops_ops: Optional[Sequence[str]] = None,
+    users: Sequence[int] = (DEFAULT_USER,),
+) -> Tuple[bool, Dict[str, bool], bool, Dict[str, Dict[str, str]], bool, Dict[str, str]]:
+    """Read enabled state, appops and standby buckets for every package.
+
+    With `appops_ops`, only those ops are read, via `dumpsys appops --op`
+    where the build supports it; an empty sequence skips appops entirely.
+    Results are keyed by `users.package_key`, for every user in `users`.
+    """
+    states = _bulk_package_states(client, appops_ops, PACKAGE_DATA_KINDS, users)
+    enabled, appops, buckets = states["enabled"], states["appops"], states["standby_bucket"]
     return (
-        prefetch_package_enabled_success, package_enabled_cache,
-        prefetch_appops_success, appops_cache,
-        prefetch_standby_bucket_success, standby_bucket_cache
+        enabled is not None, enabled or {},
+        appops is not None, appops or {},
+        buckets is not None, buckets or {}
     )
+
+STANDBY_BUCKET_VALUE_RE = re.compile(r"\d+|[a-zA-Z_]+")
+
+def _read_package_enabled(client: AdbClient, key: str) -> Optional[bool]:
+    user, package = split_package_key(key)
+    # `pm list packages` filters by substring, so the match must be exact.
+    for flag, enabled in (("-d", False), ("-e", True)):
+        output = client.shell_text(["pm", "list", "packages", "--user", str(user), flag, package])
+        if package in parse_package_list(output.splitlines()):
+            return enabled
+    return None
+
+def _read_package_appops(client: AdbClient, key: str) -> Optional[Dict[str, str]]:
+    user, package = split_package_key(key)
+    result = client.shell(["cmd", "appops", "get", *user_args(user), package], check=False)
+    if result.returncode != 0:
+        return None
+    modes: Dict[str, str] = {}
+    for line in result.stdout.splitlines():
+        parsed = parse_op_line(line.strip())
+        if parsed is not None:
+            modes[parsed[0]] = parsed[1]
+    return modes
+
+def _read_package_standby_bucket(client: AdbClient, key: str) -> Optional[str]:
+    user, package = split_package_key(key)
+    result = client.shell(["am", "get-standby-bucket", *user_args(user), package], check=False)
+    bucket = result.stdout.strip()
+    if result.returncode != 0 or not STANDBY_BUCKET_VALUE_RE.fullmatch(bucket):
+        return None
+    return bucket
+
+_PACKAGE_READERS: Dict[str, Callable[[AdbClient, str], Any]] = {
+    "enabled": _read_package_enabled,
+    "appops": _read_package_appops,
+    "standby_bucket": _read_package_standby_bucket,
+}
+
+def read_package_states(
+    client: AdbClient, packages: Sequence[str], kinds: Sequence[str] = PACKAGE_DATA_KINDS
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """kind -> package -> value from per-package queries, None if a query failed.
+
+    `packages` are `users.package_key`s. Packages the device does not know
+    are left out. The appops read covers every op of the package.
+    """
+    jobs = [(kind, package) for kind in kinds for package in packages]
+    results = call_concurrently([
+        lambda kind=kind, package=package: _PACKAGE_READERS[kind](client, package)
+        for kind, package in jobs
+    ])
+    states: Dict[str, Optional[Dict[str, Any]]] = {kind: {} for kind in kinds}
+    for (kind, package), result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, CommandError):
+                raise result
+            states[kind] = None
+            continue
+        values = states[kind]
+        if values is not None and result is not None:
+            values[package] = result
+    return states
+
+# Per-package queries each kind costs, and the typical device-side time of
+# its bulk read on a phone with a few hundred packages.
+TARGETED_QUERIES = {"enabled": 2, "appops": 1, "standby_bucket": 1}
+BULK_READ_SECONDS = {"enabled": 0.4, "appops": 1.5, "standby_bucket": 0.8}
+DEFAULT_CALL_SECONDS = 0.05
+
+@dataclass
+class PrefetchCostModel:
+    call_seconds: float = DEFAULT_CALL_SECONDS
+    concurrency: int = MAX_CONCURRENT_COMMANDS
+
+    @classmethod
+    def for_client(cls, client: AdbClient) -> "PrefetchCostModel":
+        measured = client.call_seconds
+        return cls(DEFAULT_CALL_SECONDS if measured is None else measured)
+
+    def targeted_seconds(self, kind: str, package_count: int) -> float:
+        calls = package_count * TARGETED_QUERIES[kind]
+        return math.ceil(calls / self.concurrency) * self.call_seconds
+
+    def bulk_seconds(self, kind: str) -> float:
+        return self.call_seconds + BULK_READ_SECONDS[kind]
+
+    def prefers_targeted(self, kind: str, package_count: int) -> bool:
+        return self.targeted_seconds(kind, package_count) < self.bulk_seconds(kind)
+
+@dataclass
+class PackagePrefetch:
+    # kind -> package -> value, None where the read failed.
+    states: Dict[str, Optional[Dict[str, Any]]]
+    # Kinds read per package; those only cover the requested packages.
+    targeted: Set[str] = field(default_factory=set)
+
+def prefetch_packages(
+    client: AdbClient,
+    packages: Sequence[str],
+    kinds: Sequence[str] = PACKAGE_DATA_KINDS,
+    appops_ops: Optional[Sequence[str]] = None,
+    cost_model: Optional[PrefetchCostModel] = None,
+) -> PackagePrefetch:
+    """Read `kinds` of package state for `packages` (`users.package_key`s).
+
+    Each kind is read with per-package queries or with the device-wide
+    dump, whichever `cost_model` expects to finish first for this many
+    packages. `appops_ops` limits a bulk appops read as in
+    `prefetch_package_states`.
+    """
+    packages = list(dict.fromkeys(packages))
+    model = cost_model or PrefetchCostModel.for_client(client)
+    targeted = [kind for kind in kinds if model.prefers_targeted(kind, len(packages))]
+    bulk = [kind for kind in kinds if kind not in targeted]
+    states: Dict[str, Optional[Dict[str, Any]]] = {}
+    if bulk:
+        users = sorted({split_package_key(key)[0] for key in packages} | {DEFAULT_USER})
+        states.update(_bulk_package_states(client, appops_ops, bulk, users))
+    if targeted:
+        states.update(read_package_states(client, packages, targeted))
+    return PackagePrefetch(states, set(targeted))
+
+def parse_standby_bucket_listing(lines: Iterable[str], user: int = DEFAULT_USER) -> Dict[str, str]:
+    # `am get-standby-bucket` without a package: `com.example: 10` per line.
+    buckets: Dict[str, str] = {}
+    for line in lines:
+        package, sep, bucket = line.strip().partition(": ")
+        if sep and STANDBY_BUCKET_VALUE_RE.fullmatch(bucket.strip()):
+            buckets[package_key(package, user)] = bucket.strip()
+    return buckets
+
+@dataclass
+class Readback:
+    """Device state re-read in bulk after a batch, for verification.
+
+    Reads that failed leave their part empty; callers treat anything not
+    found here as undecided.
+    """
+
+    namespaces: Dict[Tuple[str, str], Dict[str, str]] = field(default_factory=dict)
+    # package key -> op -> mode; None when appops was not read.
+    appops: Optional[Dict[str, Dict[str, str]]] = None
+    # A filtered dump omits packages at the default mode.
+    appops_filtered: bool = False
+    standby_buckets: Dict[str, str] = field(default_factory=dict)
+    package_enabled: Dict[str, bool] = field(default_factory=dict)
+
+def read_readback(
+    client: AdbClient,
+    namespaces: Sequence[Tuple[str, str]] = (),
+    appops_ops: Sequence[str] = (),
+    bucket_users: Sequence[int] = (),
+    enabled_users: Sequence[int] = (),
+) -> Readback:
+    """Re-read settings/device_config namespaces, appops, standby buckets
+    and package lists in one shell call."""
+    spec: List[PrefetchSection] = [
+        (f"{tool}:{namespace}", [tool, "list", namespace], parse_namespace_listing)
+        for tool, namespace in dict.fromkeys(namespaces)
+    ]
+    ops = list(dict.fromkeys(appops_ops))
+    filtered = bool(ops) and supports_appops_op_filter(client)
+    if filtered:
+        spec.extend(_appops_op_section(op) for op in ops)
+    elif ops:
+        spec.append(("appops", ["dumpsys", "appops"], parse_appops_dump))
+    for user in dict.fromkeys(bucket_users):
+        spec.append((
+            f"buckets-{user}",
+            ["am", "get-standby-bucket", *user_args(user)],
+            lambda lines, user=user: parse_standby_bucket_listing(lines, user),
+        ))
+    for user in dict.fromkeys(enabled_users):
+        spec.extend(_package_list_sections(user))
+    readback = Readback(appops_filtered=filtered)
+    if not spec:
+        return readback
+
+    # Only the touched ops and packages come back, so the output is small.
+    sections = read_sections(client, spec, stream_output=False)
+    for name, _, _ in spec:
+        value = sections[name]
+        if value is None:
+            continue
+        tool, sep, namespace = name.partition(":")
+        if sep:
+            readback.namespaces[(tool, namespace)] = value
+        elif name.startswith("buckets-"):
+            readback.standby_buckets.update(value)
+    if filtered:
+        readback.appops = _merge_appops([sections[f"appops-{op}"] for op in ops])
+        readback.appops_filtered = readback.appops is not None
+    elif ops:
+        readback.appops = sections["appops"]
+    for user in dict.fromkeys(enabled_users):
+        disabled_name, enabled_name = (name for name, _, _ in _package_list_sections(user))
+        disabled, enabled = sections[disabled_name], sections[enabled_name]
+        if disabled is not None and enabled is not None:
+            readback.package_enabled.update(dict.fromkeys(disabled, False))
+            readback.package_enabled.update(dict.fromkeys(enabled, True))
+    return readback
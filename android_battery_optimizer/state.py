@@ -4,12 +4,19 @@ import os
 import re
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional, cast
+from typing import Any, Dict, List, Optional, cast
 from .adb import AdbClient, CommandError
 
 SNAPSHOT_FILE = "state.json"
+# Changes saved since the last full write of SNAPSHOT_FILE, one JSON record
+# per line: {"section": ..., "key": ..., "value": ...}; a null value deletes.
+JOURNAL_FILE = "state.journal"
+JOURNAL_SECTIONS = ("settings", "device_config", "packages")
 
 class StateStore:
+    # Journal records kept before the next save rewrites the snapshot file.
+    COMPACT_AFTER = 256
+
     @staticmethod
     def sanitize_serial(serial: str) -> str:
         # Keep only A-Z, a-z, 0-9, dot, underscore, hyphen. Replace others with "_"
@@ -19,6 +26,8 @@ class StateStore:
         self.base_state_dir = base_state_dir
         self.client = client
         self.path: Optional[Path] = None
+        self.journal_path: Optional[Path] = None
+        self._journal_records = 0
         self.data: Dict[str, object] = self._empty_state()
         self._in_transaction = False
         self._pending_save = False
@@ -38,20 +47,23 @@ class StateStore:
         safe_serial = self.sanitize_serial(serial)
         device_dir = self.base_state_dir / "devices" / safe_serial
         self.path = device_dir / SNAPSHOT_FILE
+        self.journal_path = device_dir / JOURNAL_FILE
         self.data = self._load()
 
     def _quarantine_state_file(self) -> None:
-        if not self.path or not self.path.exists():
-            return
+        # The journal only makes sense on top of its snapshot file.
+        for path in (self.path, self.journal_path):
+            if not path or not path.exists():
+                continue
 
-        import time
+            import time
 
-        timestamp = int(time.time())
-        corrupt_path = self.path.with_name(f"{SNAPSHOT_FILE}.corrupt.{timestamp}")
-        try:
-            os.replace(self.path, corrupt_path)
-        except OSError:
-            pass
+            timestamp = int(time.time())
+            corrupt_path = path.with_name(f"{path.name}.corrupt.{timestamp}")
+            try:
+                os.replace(path, corrupt_path)
+            except OSError:
+                pass
 
     def _require_dict_section(self, state: dict[str, object], key: str) -> dict[str, object]:
         value = state.get(key)
@@ -143,30 +155,95 @@ class StateStore:
         self._validate_scalar_kv_section("device_config", device_config)
         self._validate_packages_section(packages)
 
-        return {
+        state: Dict[str, object] = {
             "version": version,
             "device": dict(device),
             "settings": dict(settings),
             "device_config": dict(device_config),
             "packages": dict(packages),
         }
+        if "checkpoint" in raw:
+            checkpoint = self._require_dict_section(raw, "checkpoint")
+            for change, value in checkpoint.items():
+                if value is not None and not isinstance(value, (str, bool)):
+                    raise ValueError(f"State checkpoint entry '{change}' has an invalid value.")
+            state["checkpoint"] = dict(checkpoint)
+        return state
 
     def _load(self) -> Dict[str, object]:
+        self._journal_records = 0
         if not self.path or not self.path.exists():
+            # Journals are only written on top of a snapshot file; one left
+            # alone is from a clear() cut short and holds cleared changes.
+            if self.journal_path and self.journal_path.exists() and not self.client.dry_run:
+                self._remove_journal()
             return self._empty_state()
-
         try:
             with self.path.open("r", encoding="utf-8") as handle:
-                raw = json.load(handle)
+                raw: object = json.load(handle)
         except (json.JSONDecodeError, ValueError):
             self._quarantine_state_file()
             return self._empty_state()
 
         try:
-            return self._normalize_state(raw)
+            records = self._read_journal()
+            if records and isinstance(raw, dict):
+                self._replay_journal(cast(Dict[str, object], raw), records)
+            state = self._normalize_state(raw)
         except ValueError:
             self._quarantine_state_file()
             return self._empty_state()
+        self._journal_records = len(records)
+        return state
+
+    def _read_journal(self) -> List[Dict[str, object]]:
+        if not self.journal_path or not self.journal_path.exists():
+            return []
+        with self.journal_path.open("r", encoding="utf-8") as handle:
+            lines = handle.read().split("\n")
+        records = []
+        for index, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash mid-append leaves a torn last line; drop it, also
+                # from the file, so the next append starts on a fresh line.
+                if index == len(lines) - 1:
+                    self._truncate_journal_tail()
+                    break
+                raise ValueError(f"Corrupt state journal record on line {index + 1}.") from None
+            if (
+                not isinstance(record, dict)
+                or record.get("section") not in JOURNAL_SECTIONS
+                or not isinstance(record.get("key"), str)
+            ):
+                raise ValueError(f"Invalid state journal record on line {index + 1}.")
+            records.append(record)
+        return records
+
+    def _truncate_journal_tail(self) -> None:
+        assert self.journal_path is not None
+        if self.client.dry_run:
+            return
+        with self.journal_path.open("rb+") as handle:
+            data = handle.read()
+            handle.truncate(data.rfind(b"\n") + 1)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    @staticmethod
+    def _replay_journal(raw: Dict[str, object], records: List[Dict[str, object]]) -> None:
+        for record in records:
+            section = raw.setdefault(str(record["section"]), {})
+            if not isinstance(section, dict):
+                raise ValueError(f"State field '{record['section']}' must be an object.")
+            key = str(record["key"])
+            if record.get("value") is None:
+                section.pop(key, None)
+            else:
+                section[key] = record["value"]
 
     @contextmanager
     def transaction(self):
@@ -174,7 +251,7 @@ class StateStore:
             yield
             return
 
-        backup = copy.deepcopy(self.data)
+        self._backup = copy.deepcopy(self.data)
         self._in_transaction = True
         self._pending_save = False
         success = False
@@ -187,9 +264,29 @@ class StateStore:
                 if self._pending_save:
                     self.save_or_clear()
             else:
-                self.data = backup
+                self.data = self._backup
                 self._pending_save = False
 
+    def commit(self) -> None:
+        """Write the state now, even inside a transaction.
+
+        A transaction that fails later rolls back to the last commit
+        instead of to its start.
+        """
+        if self.client.dry_run:
+            return
+        if self.client.serial is None:
+            raise CommandError("Refusing to mutate device state without a selected ADB serial.")
+        if getattr(self, "_in_transaction", False):
+            self._backup = copy.deepcopy(self.data)
+            self._pending_save = False
+        self._write()
+
+    def rollback(self) -> None:
+        """Drop in-memory changes made since the transaction start or the last commit."""
+        if getattr(self, "_in_transaction", False):
+            self.data = copy.deepcopy(self._backup)
+
     def save(self) -> None:
         if self.client.dry_run:
             return
@@ -198,7 +295,45 @@ class StateStore:
         if getattr(self, "_in_transaction", False):
             self._pending_save = True
             return
-
+        self._write()
+
+    def save_change(self, section: str, key: str) -> None:
+        """Persist a change to one `section` entry.
+
+        Outside a transaction the entry is appended to the journal instead
+        of rewriting the whole snapshot file, until COMPACT_AFTER records
+        have built up.
+        """
+        if (
+            self.client.dry_run
+            or getattr(self, "_in_transaction", False)
+            or not self.path
+            or not self.path.exists()
+            or self._journal_records >= self.COMPACT_AFTER
+        ):
+            self.save()
+            return
+        if self.client.serial is None:
+            raise CommandError("Refusing to mutate device state without a selected ADB serial.")
+        self._append_journal(section, key)
+
+    def _append_journal(self, section: str, key: str) -> None:
+        assert self.journal_path is not None
+        value = cast(Dict[str, object], self.data[section]).get(key)
+        record = json.dumps({"section": section, "key": key, "value": value}, sort_keys=True)
+        with self.journal_path.open("a+b") as handle:
+            # Never continue a line an interrupted append left unterminated.
+            handle.seek(0, os.SEEK_END)
+            if handle.tell():
+                handle.seek(-1, os.SEEK_END)
+                if handle.read(1) != b"\n":
+                    record = "\n" + record
+            handle.write((record + "\n").encode("utf-8"))
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._journal_records += 1
+
+    def _write(self) -> None:
         if not self.path:
             return
 
@@ -216,6 +351,13 @@ class StateStore:
             if tmp_path.exists():
                 tmp_path.unlink()
             raise
+        # The snapshot now holds every journaled change.
+        self._remove_journal()
+
+    def _remove_journal(self) -> None:
+        if self.journal_path and self.journal_path.exists():
+            self.journal_path.unlink()
+        self._journal_records = 0
 
     def _ensure_device_metadata(self) -> None:
         if self.data.get("device"):
@@ -225,6 +367,8 @@ class StateStore:
 
     def clear(self) -> None:
         self.data = self._empty_state()
+        # Journal first: without its snapshot file it is never replayed.
+        self._remove_journal()
         if self.path and self.path.exists():
             self.path.unlink()
 
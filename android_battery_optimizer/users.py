@@ -0,0 +1,57 @@
+import re
+from typing import List, Optional, Tuple
+
+from .adb import AdbClient
+
+# The device owner. Its packages keep their bare names in state and caches,
+# so state files written before multi-user support stay valid.
+DEFAULT_USER = 0
+
+# `pm list users`: `UserInfo{10:Work profile:1030} running`.
+USER_INFO_RE = re.compile(r"UserInfo\{(\d+):")
+
+def parse_user_list(output: str) -> List[int]:
+    return [int(match.group(1)) for match in USER_INFO_RE.finditer(output)]
+
+def list_users(client: AdbClient) -> List[int]:
+    return parse_user_list(client.shell_text(["pm", "list", "users"]))
+
+def parse_users_option(value: str) -> Optional[List[int]]:
+    """`all` -> None, `0,10` -> [0, 10]."""
+    value = value.strip()
+    if value == "all":
+        return None
+    try:
+        users = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid --users value: {value!r}. Use `all` or comma-separated user ids.") from None
+    if not users or any(user < 0 for user in users):
+        raise ValueError(f"Invalid --users value: {value!r}. Use `all` or comma-separated user ids.")
+    return list(dict.fromkeys(users))
+
+def resolve_users(client: AdbClient, value: str) -> List[int]:
+    """Users named by a `--users` value that exist on the device."""
+    requested = parse_users_option(value)
+    existing = list_users(client)
+    if not existing:
+        raise ValueError("Could not list users with `pm list users`.")
+    if requested is None:
+        return existing
+    missing = [user for user in requested if user not in existing]
+    if missing:
+        raise ValueError(f"Users not present on the device: {', '.join(map(str, missing))}")
+    return requested
+
+def package_key(package: str, user: int = DEFAULT_USER) -> str:
+    """State and cache key of a package: `pkg` for the owner, `<user>/pkg` otherwise."""
+    return package if user == DEFAULT_USER else f"{user}/{package}"
+
+def split_package_key(key: str) -> Tuple[int, str]:
+    user, sep, package = key.partition("/")
+    if sep and user.isdigit():
+        return int(user), package
+    return DEFAULT_USER, key
+
+def user_args(user: int) -> List[str]:
+    # `cmd appops` and `am` act on the calling user when --user is omitted.
+    return [] if user == DEFAULT_USER else ["--user", str(user)]
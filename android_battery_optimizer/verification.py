@@ -2,8 +2,7 @@ import re
 from typing import Optional
 from .adb import AdbClient
 from .operations import STANDBY_BUCKET_MAP
-
-PACKAGE_USER_ID = "0"
+from .users import DEFAULT_USER, package_key, user_args
 
 class VerificationError(RuntimeError):
     pass
@@ -75,13 +74,16 @@ def verify_device_config(client: AdbClient, namespace: str, key: str, expected_v
             f"expected {expected}, got {actual}"
         )
 
-def verify_appop(client: AdbClient, package: str, op: str, expected_value: str) -> None:
+def verify_appop(
+    client: AdbClient, package: str, op: str, expected_value: str, user: int = DEFAULT_USER
+) -> None:
     if client.dry_run:
         return
-    result = client.shell(["cmd", "appops", "get", package, op], check=False)
+    result = client.shell(["cmd", "appops", "get", *user_args(user), package, op], check=False)
+    label = package_key(package, user)
     if result.returncode != 0:
         raise VerificationError(
-            f"Verification failed for appop {op} for package {package}: "
+            f"Verification failed for appop {op} for package {label}: "
             f"read command failed with exit code {result.returncode}"
         )
     output = result.stdout.strip()
@@ -93,35 +95,40 @@ def verify_appop(client: AdbClient, package: str, op: str, expected_value: str)
     if expected == "default":
         if actual not in {"default", "no operations.", "no overrides."}:
             raise VerificationError(
-                f"Verification failed for appop {op} for package {package}: "
+                f"Verification failed for appop {op} for package {label}: "
                 f"expected default, got {actual}"
             )
         return
 
     if actual != expected:
         raise VerificationError(
-            f"Verification failed for appop {op} for package {package}: "
+            f"Verification failed for appop {op} for package {label}: "
             f"expected {expected_value}, got {actual}"
         )
 
-def verify_standby_bucket(client: AdbClient, package: str, expected_bucket: str) -> None:
+def verify_standby_bucket(
+    client: AdbClient, package: str, expected_bucket: str, user: int = DEFAULT_USER
+) -> None:
     if client.dry_run:
         return
-    result = client.shell(["am", "get-standby-bucket", package], check=False)
+    result = client.shell(["am", "get-standby-bucket", *user_args(user), package], check=False)
+    label = package_key(package, user)
     if result.returncode != 0:
         raise VerificationError(
-            f"Verification failed for standby bucket for package {package}: "
+            f"Verification failed for standby bucket for package {label}: "
             f"read command failed with exit code {result.returncode}"
         )
     actual = result.stdout.strip()
     expected_code = STANDBY_BUCKET_MAP.get(expected_bucket.lower(), expected_bucket)
     if actual != expected_code:
         raise VerificationError(
-            f"Verification failed for standby bucket for package {package}: "
+            f"Verification failed for standby bucket for package {label}: "
             f"expected {expected_bucket} ({expected_code}), got {actual}"
         )
 
-def verify_package_enabled(client: AdbClient, package: str, expected_enabled: bool) -> None:
+def verify_package_enabled(
+    client: AdbClient, package: str, expected_enabled: bool, user: int = DEFAULT_USER
+) -> None:
     if client.dry_run:
         return
     result = client.shell(
@@ -130,15 +137,16 @@ def verify_package_enabled(client: AdbClient, package: str, expected_enabled: bo
             "list",
             "packages",
             "--user",
-            PACKAGE_USER_ID,
+            str(user),
             "-e" if expected_enabled else "-d",
             package,
         ],
         check=False,
     )
+    label = package_key(package, user)
     if result.returncode != 0:
         raise VerificationError(
-            f"Verification failed for package {package} enabled state: "
+            f"Verification failed for package {label} enabled state: "
             f"package-enabled verification readback failed with exit code {result.returncode}"
         )
 
@@ -151,6 +159,6 @@ def verify_package_enabled(client: AdbClient, package: str, expected_enabled: bo
     if not found:
         actual = "enabled" if not expected_enabled else "disabled/missing"
         raise VerificationError(
-            f"Verification failed for package {package} enabled state: "
+            f"Verification failed for package {label} enabled state: "
             f"expected {expected_enabled}, but package is {actual}"
         )
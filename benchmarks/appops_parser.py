@@ -0,0 +1,84 @@
+"""Compare the appops state-machine parser with the regex loop it replaced.
+
+    python benchmarks/appops_parser.py --packages 1000
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from android_battery_optimizer.appops import parse_appops  # noqa: E402
+
+OPS = (
+    "COARSE_LOCATION", "WAKE_LOCK", "RUN_IN_BACKGROUND", "RUN_ANY_IN_BACKGROUND",
+    "READ_CLIPBOARD", "TOAST_WINDOW", "START_FOREGROUND", "READ_EXTERNAL_STORAGE",
+)
+
+def generate_dump(package_count: int, access_lines: int = 3) -> List[str]:
+    """An Android 12-style dump: uid blocks, uid-level modes and timestamps."""
+    lines = ["Current AppOps Service state:", "  Settings:", "    top_state_settle_time=+5s0ms"]
+    for index in range(package_count):
+        lines.append(f"  Uid u0a{index}:")
+        lines.append("    state=cch")
+        lines.append("    capability=LCMN")
+        lines.append("    RUN_ANY_IN_BACKGROUND: mode=ignore")
+        lines.append(f"    Package com.example.app{index:04d}:")
+        for op in OPS:
+            lines.append(f"      {op} (allow / switch {op}=allow):")
+            lines.append("        null=[")
+            for _ in range(access_lines):
+                lines.append("          Access: [fg-s] 2024-01-01 12:00:00.000 (-1d2h3m4s5ms) duration=+12ms")
+            lines.append("          Reject: [bg-s] 2024-01-01 11:00:00.000 (-1d3h)")
+            lines.append("        ]")
+    return lines
+
+def legacy_parse(lines: List[str]) -> Dict[str, Dict[str, str]]:
+    # The loop prefetch_package_states used before the appops module.
+    appops_cache: Dict[str, Dict[str, str]] = {}
+    current_pkg: Optional[str] = None
+    for line in lines:
+        pkg_match = re.search(r"Package\s+([a-zA-Z0-9_\.]+):", line)
+        if pkg_match:
+            current_pkg = pkg_match.group(1)
+            appops_cache.setdefault(current_pkg, {})
+            continue
+        if current_pkg:
+            op_match = re.search(r"\s+([A-Z_a-z0-9]+):\s*([a-zA-Z0-9_]+)", line)
+            if op_match:
+                appops_cache.setdefault(current_pkg, {})[op_match.group(1)] = op_match.group(2)
+    return appops_cache
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    lines = generate_dump(args.packages)
+    size = sum(len(line) + 1 for line in lines)
+    legacy = best_of(lambda: legacy_parse(lines), args.repeat)
+    current = best_of(lambda: parse_appops(lines), args.repeat)
+
+    modes = parse_appops(lines).for_user(0)
+    sample = modes[f"com.example.app{args.packages - 1:04d}"]
+    assert sample["WAKE_LOCK"] == "allow", sample
+
+    print(f"dump: {args.packages} packages, {len(lines)} lines, {size / 1024 / 1024:.1f} MiB")
+    print(f"legacy regex loop: {legacy * 1000:8.1f} ms")
+    print(f"state machine:     {current * 1000:8.1f} ms  ({legacy / current:.1f}x faster)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Compare ledger entries with the dict entries and if/elif dispatch they replaced.
+
+    python benchmarks/ledger.py --entries 10000
+
+The baseline side is the dict layout and the `perform_rollback` /
+`_verify_entry` chains as they were before the ledger rewrite; both sides
+dispatch into the same no-op client and verifiers, so only the ledger's own
+cost is timed.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from android_battery_optimizer.ledger import (  # noqa: E402
+    LedgerEntry,
+    appop_entry,
+    entry_as_dict,
+    standby_bucket_entry,
+)
+from android_battery_optimizer.recorder import StateRecorder  # noqa: E402
+from android_battery_optimizer.rollback import perform_rollback  # noqa: E402
+
+OP = "RUN_ANY_IN_BACKGROUND"
+
+class NullClient:
+    def shell(self, args: List[object], mutate: bool = False) -> None:
+        pass
+
+class NullVerifier:
+    def verify_setting(self, *args: object) -> None:
+        pass
+
+    verify_device_config = verify_appop = verify_standby_bucket = verify_package_enabled = verify_setting
+
+class NullRecorder(StateRecorder):
+    # Skips __init__; only the verifier dispatch is used.
+    verify_setting = verify_device_config = verify_appop = NullVerifier.verify_setting
+    verify_standby_bucket = verify_package_enabled = NullVerifier.verify_setting
+
+# -- baseline -------------------------------------------------------------
+
+def baseline_build(count: int) -> List[Dict[str, object]]:
+    # One appop and one standby bucket entry per package, as restrict-apps records.
+    entries: List[Dict[str, object]] = []
+    for index in range(count // 2):
+        package = f"com.example.app{index:05d}"
+        entries.append(cast(Any, {
+            "type": "appop", "package": package, "op": OP, "prior_value": "allow", "new_value": "ignore",
+        }))
+        entries.append(cast(Any, {
+            "type": "standby_bucket", "package": package, "prior_value": "10", "new_value": "rare",
+        }))
+    return entries
+
+def baseline_restore_appop_value(client: Any, package: str, op: str, prior_value: Optional[str]) -> None:
+    value = "default" if prior_value is None else str(prior_value)
+    client.shell(["cmd", "appops", "set", package, op, value], mutate=True)
+
+def baseline_perform_rollback(client: Any, entry: Dict[str, Any]) -> None:
+    type_ = entry["type"]
+    if type_ == "setting":
+        namespace = str(entry["namespace"])
+        key = str(entry["key"])
+        prior_value = entry.get("prior_value")
+        if prior_value is None:
+            client.shell(["settings", "delete", namespace, key], mutate=True)
+        else:
+            client.shell(["settings", "put", namespace, key, prior_value], mutate=True)
+    elif type_ == "device_config":
+        namespace = str(entry["namespace"])
+        key = str(entry["key"])
+        prior_value = entry.get("prior_value")
+        if prior_value is None:
+            client.shell(["device_config", "delete", namespace, key], mutate=True)
+        else:
+            client.shell(["device_config", "put", namespace, key, prior_value], mutate=True)
+    elif type_ == "appop":
+        package = str(entry["package"])
+        op = str(entry["op"])
+        prior_value = entry.get("prior_value")
+        baseline_restore_appop_value(client, package, op, cast(Optional[str], prior_value))
+    elif type_ == "standby_bucket":
+        package = str(entry["package"])
+        prior_value = entry.get("prior_value")
+        if prior_value:
+            client.shell(["am", "set-standby-bucket", package, str(prior_value)], mutate=True)
+    elif type_ == "package_enabled":
+        package = str(entry["package"])
+        prior_value = bool(entry.get("prior_value"))
+        command = ["pm", "enable", "--user", "0", package]
+        if not prior_value:
+            command = ["pm", "disable-user", "--user", "0", package]
+        client.shell(command, mutate=True)
+
+def baseline_verify_entry(self: Any, entry: Dict[str, Any]) -> None:
+    type_ = entry["type"]
+    new_value = entry.get("new_value")
+    if type_ == "setting":
+        self.verify_setting(
+            str(entry["namespace"]),
+            str(entry["key"]),
+            str(new_value) if new_value is not None else None,
+        )
+    elif type_ == "device_config":
+        self.verify_device_config(
+            str(entry["namespace"]),
+            str(entry["key"]),
+            str(new_value) if new_value is not None else None,
+        )
+    elif type_ == "appop":
+        self.verify_appop(str(entry["package"]), str(entry["op"]), str(new_value))
+    elif type_ == "standby_bucket":
+        self.verify_standby_bucket(str(entry["package"]), str(new_value))
+    elif type_ == "package_enabled":
+        self.verify_package_enabled(str(entry["package"]), bool(new_value))
+
+NullVerifier._verify_entry = baseline_verify_entry  # type: ignore[attr-defined]
+
+# -- current --------------------------------------------------------------
+
+def current_build(count: int) -> List[LedgerEntry]:
+    entries: List[LedgerEntry] = []
+    for index in range(count // 2):
+        package = f"com.example.app{index:05d}"
+        entries.append(appop_entry(package, OP, 0, "allow", "ignore"))
+        entries.append(standby_bucket_entry(package, 0, "10", "rare"))
+    return entries
+
+Side = Tuple[Callable[[], List[Any]], Callable[[Any], object], Callable[[Any], object]]
+
+def time_side(side: Side) -> Tuple[float, float, float]:
+    build, rollback, verify = side
+    started = time.perf_counter()
+    entries = build()
+    built = time.perf_counter()
+    for entry in entries:
+        rollback(entry)
+    rolled_back = time.perf_counter()
+    for entry in entries:
+        verify(entry)
+    return built - started, rolled_back - built, time.perf_counter() - rolled_back
+
+def memory(side: Side) -> int:
+    tracemalloc.start()
+    entries = side[0]()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    return size
+
+def measure(sides: List[Side], repeat: int) -> List[Tuple[float, float, float, int]]:
+    """Best build, rollback and verify time of each side, and the memory its ledger holds.
+
+    The sides take turns within each repeat so load changes on the machine
+    hit them alike.
+    """
+    times: List[List[Tuple[float, float, float]]] = [[] for _ in sides]
+    for _ in range(repeat):
+        for side, side_times in zip(sides, times):
+            side_times.append(time_side(side))
+    return [
+        (
+            min(t[0] for t in side_times),
+            min(t[1] for t in side_times),
+            min(t[2] for t in side_times),
+            memory(side),
+        )
+        for side, side_times in zip(sides, times)
+    ]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    client = NullClient()
+    verifier = NullVerifier()
+    recorder = NullRecorder.__new__(NullRecorder)
+    assert entry_as_dict(current_build(2)[0]) == baseline_build(2)[0]
+
+    names = ["dict (baseline)", "tuple"]
+    rows = list(zip(names, measure(
+        [
+            (
+                lambda: baseline_build(args.entries),
+                lambda entry: baseline_perform_rollback(client, entry),
+                verifier._verify_entry,
+            ),
+            (
+                lambda: current_build(args.entries),
+                lambda entry: perform_rollback(client, entry),
+                recorder._verify_entry,
+            ),
+        ],
+        args.repeat,
+    )))
+
+    print(f"ledger: {args.entries} entries")
+    baseline_total = sum(rows[0][1][:3])
+    baseline_size = rows[0][1][3]
+    for name, (build, rollback, verify, size) in rows:
+        total = build + rollback + verify
+        print(
+            f"{name:16} build {build * 1000:6.1f} ms  rollback {rollback * 1000:6.1f} ms  "
+            f"verify {verify * 1000:6.1f} ms  total {total * 1000:6.1f} ms ({baseline_total / total:.2f}x)  "
+            f"memory {size / 1024:6.0f} KiB ({baseline_size / size:.1f}x smaller)"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
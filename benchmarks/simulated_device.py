@@ -0,0 +1,148 @@
+"""End-to-end benchmarks against an in-memory simulated Android device.
+
+Every scenario runs on a freshly generated device. It reports wall time,
+the number of adb invocations, the bytes moved over adb (stdin + stdout +
+stderr) and the peak Python heap (tracemalloc).
+
+    python benchmarks/simulated_device.py --packages 50,500,2000 --latency-ms 5
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from android_battery_optimizer.adb import AdbClient  # noqa: E402
+from android_battery_optimizer.app import BatteryOptimizerApp  # noqa: E402
+from android_battery_optimizer.instrument import InstrumentedRunner  # noqa: E402
+from android_battery_optimizer.simulator import SimulatedDevice, SimulatedDeviceRunner  # noqa: E402
+
+Setup = Callable[[BatteryOptimizerApp], None]
+Action = Callable[[BatteryOptimizerApp], object]
+
+def _restrict(app: BatteryOptimizerApp) -> None:
+    app.restrict_background_apps(level="ignore")
+
+SCENARIOS: Dict[str, tuple] = {
+    "apply-experimental": (None, lambda app: app.apply_experimental_optimizations()),
+    "restrict-apps": (None, _restrict),
+    "smart-restrict": (None, lambda app: app.smart_restrict()),
+    "diagnose": (None, lambda app: app.diagnose(third_party_only=True)),
+    "revert": (_restrict, lambda app: app.revert_saved_state()),
+}
+
+def run_scenario(
+    name: str,
+    package_count: int,
+    latency: float,
+    measure_memory: bool = True,
+    padding_lines: int = 0,
+) -> Dict[str, object]:
+    setup, action = SCENARIOS[name]
+    device = SimulatedDevice.generate(package_count, dumpsys_padding_lines=padding_lines)
+    runner = InstrumentedRunner(SimulatedDeviceRunner([device], latency=latency))
+    with tempfile.TemporaryDirectory() as state_dir:
+        client = AdbClient(runner, serial=device.serial, output=lambda _: None)
+        app = BatteryOptimizerApp(client, Path(state_dir))
+        if setup is not None:
+            setup(app)
+        runner.stats.reset()
+
+        if measure_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        action(app)
+        wall = time.perf_counter() - started
+        peak = 0
+        if measure_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "packages": package_count,
+        "latency_ms": latency * 1000,
+        "wall_seconds": wall,
+        "adb_calls": runner.stats.total_round_trips(),
+        "adb_bytes": runner.stats.total_bytes(),
+        "peak_memory_bytes": peak,
+    }
+
+def run_benchmarks(
+    scenarios: List[str],
+    package_counts: List[int],
+    latency: float,
+    repeat: int,
+    measure_memory: bool,
+    padding_lines: int,
+) -> List[Dict[str, object]]:
+    results = []
+    for package_count in package_counts:
+        for name in scenarios:
+            runs = [
+                run_scenario(name, package_count, latency, measure_memory=False, padding_lines=padding_lines)
+                for _ in range(repeat)
+            ]
+            result = dict(runs[0])
+            result["wall_seconds"] = statistics.median(run["wall_seconds"] for run in runs)
+            if measure_memory:
+                # tracemalloc slows Python down, so memory gets its own run.
+                traced = run_scenario(name, package_count, latency, measure_memory=True, padding_lines=padding_lines)
+                result["peak_memory_bytes"] = traced["peak_memory_bytes"]
+            results.append(result)
+    return results
+
+def format_results(results: List[Dict[str, object]]) -> List[str]:
+    lines = [f"{'SCENARIO':<20} {'PKGS':>5} {'WALL ms':>10} {'CALLS':>7} {'ADB KiB':>10} {'PEAK KiB':>10}"]
+    for item in results:
+        lines.append(
+            f"{item['scenario']:<20} {item['packages']:>5} {item['wall_seconds'] * 1000:>10.1f} "
+            f"{item['adb_calls']:>7} {item['adb_bytes'] / 1024:>10.1f} "
+            f"{item['peak_memory_bytes'] / 1024:>10.1f}"
+        )
+    return lines
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", default="50,500,2000", help="Comma-separated package counts")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per adb call")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median wall time is reported")
+    parser.add_argument("--padding-lines", type=int, default=0, help="Filler lines per dumpsys service")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory run")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    package_counts = [int(value) for value in args.packages.split(",") if value.strip()]
+
+    results = run_benchmarks(
+        scenarios,
+        package_counts,
+        latency=args.latency_ms / 1000,
+        repeat=max(1, args.repeat),
+        measure_memory=not args.no_memory,
+        padding_lines=args.padding_lines,
+    )
+    for line in format_results(results):
+        print(line)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
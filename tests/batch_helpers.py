@@ -0,0 +1,49 @@
+"""Shared fixtures for the tests that apply batches to a simulated device."""
+import tempfile
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient
+from android_battery_optimizer.app import BatteryOptimizerApp
+from android_battery_optimizer.simulator import SimulatedDeviceRunner
+
+
+def device_state(device):
+    return {name: (pkg.bucket, dict(pkg.appops)) for name, pkg in device.packages.items()}
+
+
+def fail_standby_bucket(script, package=""):
+    """Make `package`'s standby bucket command in a batch script fail; every package's if empty."""
+    prefix = f"am set-standby-bucket {package} " if package else "am set-standby-bucket "
+    return "\n".join(
+        line.replace(line.split(" && ")[0], "false")
+        if line.startswith(prefix)
+        else line
+        for line in script.splitlines()
+    )
+
+
+def make_app(test, runner, serial, output=None, state_dir=None):
+    """An app on `runner`, with a temporary state dir unless `state_dir` is given."""
+    if state_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        test.addCleanup(tmp.cleanup)
+        state_dir = tmp.name
+    client = AdbClient(runner, serial=serial, output=output or (lambda _: None))
+    return BatteryOptimizerApp(client, Path(state_dir))
+
+
+class BatchRecordingRunner(SimulatedDeviceRunner):
+    """Records each forward batch script in `scripts` and runs it via `run_batch`."""
+
+    def __init__(self, devices):
+        super().__init__(devices)
+        self.scripts = []
+
+    def run(self, args, input_data=None, timeout=None):
+        if input_data and "SUCCESS_" in input_data:
+            self.scripts.append(input_data)
+            return self.run_batch(args, input_data, timeout)
+        return super().run(args, input_data=input_data, timeout=timeout)
+
+    def run_batch(self, args, script, timeout):
+        return super().run(args, input_data=script, timeout=timeout)
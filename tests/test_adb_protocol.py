@@ -0,0 +1,253 @@
+import socket
+import struct
+import subprocess
+import threading
+import time
+import unittest
+
+from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, CommandRunner
+from android_battery_optimizer.adb_protocol import (
+    SHELL_ID_CLOSE_STDIN,
+    SHELL_ID_EXIT,
+    SHELL_ID_STDERR,
+    SHELL_ID_STDIN,
+    SHELL_ID_STDOUT,
+    AdbServerRunner,
+    encode_request,
+)
+
+
+class FakeAdbServer:
+    # Local stand-in for the adb server: same smart-socket and shell v2 framing,
+    # with shell commands executed by the host's /bin/sh.
+    def __init__(self, serials=("serial-1",), hang=False, shell_v2=True, drop_after_transport=False):
+        self.serials = list(serials)
+        self.hang = hang
+        self.shell_v2 = shell_v2
+        self.drop_after_transport = drop_after_transport
+        self.requests = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        # shutdown() wakes the blocked accept(); close() alone leaves the port listening.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._thread.join(timeout=2)
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _read_exact(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _read_request(self, conn):
+        length = int(self._read_exact(conn, 4), 16)
+        request = self._read_exact(conn, length).decode()
+        self.requests.append(request)
+        return request
+
+    @staticmethod
+    def _fail(conn, message):
+        data = message.encode()
+        conn.sendall(b"FAIL" + f"{len(data):04x}".encode() + data)
+
+    def _handle(self, conn):
+        try:
+            request = self._read_request(conn)
+            if request == "host:devices":
+                payload = "".join(f"{serial}\tdevice\n" for serial in self.serials).encode()
+                conn.sendall(b"OKAY" + f"{len(payload):04x}".encode() + payload)
+                return
+            serial = request.split(":", 2)[2] if request.startswith("host:transport:") else None
+            if serial is not None and serial not in self.serials:
+                self._fail(conn, f"device '{serial}' not found")
+                return
+            conn.sendall(b"OKAY")
+            service = self._read_request(conn)
+            if self.drop_after_transport:
+                return
+            if not self.shell_v2 and service.startswith("shell,v2"):
+                self._fail(conn, "closed")
+                return
+            conn.sendall(b"OKAY")
+            command = service.split(":", 1)[1]
+
+            stdin = b""
+            while True:
+                packet_id, length = struct.unpack("<BI", self._read_exact(conn, 5))
+                payload = self._read_exact(conn, length) if length else b""
+                if packet_id == SHELL_ID_STDIN:
+                    stdin += payload
+                elif packet_id == SHELL_ID_CLOSE_STDIN:
+                    break
+            if self.hang:
+                threading.Event().wait(5)
+            process = subprocess.Popen(
+                ["sh", "-c", command] if command else ["sh"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            process.stdin.write(stdin)
+            process.stdin.close()
+            # Stdout is sent line by line as the command prints it.
+            for line in iter(process.stdout.readline, b""):
+                conn.sendall(struct.pack("<BI", SHELL_ID_STDOUT, len(line)) + line)
+            err = process.stderr.read()
+            if err:
+                conn.sendall(struct.pack("<BI", SHELL_ID_STDERR, len(err)) + err)
+            conn.sendall(struct.pack("<BI", SHELL_ID_EXIT, 1) + bytes([process.wait() & 0xFF]))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+class RecordingDelegate(CommandRunner):
+    def __init__(self):
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        self.calls.append(list(args))
+        return CommandResult(0, "delegated\n", "")
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestAdbServerRunner(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAdbServer()
+        self.delegate = RecordingDelegate()
+        self.runner = AdbServerRunner(self.delegate, port=self.server.port)
+        self.client = AdbClient(self.runner, serial="serial-1", output=lambda _: None)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_encode_request_uses_hex_length_prefix(self):
+        self.assertEqual(encode_request("host:transport:abc"), b"0012host:transport:abc")
+
+    def test_shell_uses_transport_then_shell_v2(self):
+        self.assertEqual(self.client.shell_text(["echo", "low_power=1"]), "low_power=1")
+        self.assertEqual(
+            self.server.requests,
+            ["host:transport:serial-1", "shell,v2:echo low_power=1"],
+        )
+        self.assertEqual(self.delegate.calls, [])
+
+    def test_stdout_stderr_and_exit_code_are_separate(self):
+        result = self.client.shell(["echo", "out;", "echo", "err", ">&2;", "exit", "7"], check=False)
+        self.assertEqual(result, CommandResult(returncode=7, stdout="out\n", stderr="err\n"))
+
+    def test_check_raises_on_nonzero_exit(self):
+        with self.assertRaises(CommandError) as cm:
+            self.client.shell(["sh", "-c", "'echo denied >&2; exit 1'"])
+        self.assertIn("denied", str(cm.exception))
+
+    def test_input_data_streams_as_stdin_packets_on_raw_shell(self):
+        script = 'echo a && echo "SUCCESS_0" || exit $?\nfalse && echo "SUCCESS_1" || exit $?'
+        result = self.client.shell([], check=False, input_data=script)
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stdout, "a\nSUCCESS_0\n")
+        self.assertEqual(self.server.requests[-1], "shell,v2,raw:")
+
+    def test_unknown_serial_reports_adb_style_failure(self):
+        client = AdbClient(self.runner, serial="missing", output=lambda _: None)
+        result = client.shell(["true"], check=False)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("device 'missing' not found", result.stderr)
+
+    def test_devices_maps_to_host_devices(self):
+        output = self.client.local_text(["adb", "devices"])
+        self.assertEqual(output, "List of devices attached\nserial-1\tdevice")
+
+    def test_timeout_raises_command_error(self):
+        server = FakeAdbServer(hang=True)
+        try:
+            client = AdbClient(AdbServerRunner(self.delegate, port=server.port), serial="serial-1")
+            with self.assertRaises(CommandError) as cm:
+                client.shell(["true"], timeout=0.3)
+            self.assertIn("timed out after 0.3s", str(cm.exception))
+            self.assertEqual(cm.exception.result.returncode, -1)
+        finally:
+            server.close()
+
+    def test_unreachable_server_falls_back_to_delegate(self):
+        port = self.server.port
+        self.server.close()
+        runner = AdbServerRunner(self.delegate, port=port)
+        result = runner.run(["adb", "-s", "serial-1", "shell", "true"])
+        self.assertEqual(result.stdout, "delegated\n")
+
+    def test_device_without_shell_v2_falls_back_to_delegate(self):
+        server = FakeAdbServer(shell_v2=False)
+        try:
+            client = AdbClient(AdbServerRunner(self.delegate, port=server.port), serial="serial-1")
+            self.assertEqual(client.shell_text(["echo", "hi"]), "delegated")
+            self.assertEqual(server.requests, ["host:transport:serial-1", "shell,v2:echo hi"])
+            self.assertEqual(self.delegate.calls, [["adb", "-s", "serial-1", "shell", "echo", "hi"]])
+        finally:
+            server.close()
+
+    def test_dropped_connection_raises_command_error(self):
+        server = FakeAdbServer(drop_after_transport=True)
+        try:
+            runner = AdbServerRunner(self.delegate, port=server.port)
+            with self.assertRaises(CommandError) as cm:
+                runner.run(["adb", "-s", "serial-1", "shell", "true"])
+            self.assertEqual(cm.exception.result.returncode, 255)
+            self.assertIn("closed the connection", cm.exception.result.stderr)
+            self.assertEqual(self.delegate.calls, [])
+        finally:
+            server.close()
+
+    def test_stream_lines_yields_stdout_as_it_arrives(self):
+        started = time.monotonic()
+        stream = self.client.stream_lines(["echo", "first;", "sleep", "1;", "echo", "err", ">&2;", "echo", "last"])
+        self.assertEqual(next(stream), "first")
+        self.assertLess(time.monotonic() - started, 0.8)
+        lines = []
+        with self.assertRaises(StopIteration) as stop:
+            while True:
+                lines.append(next(stream))
+        self.assertEqual(lines, ["last"])
+        self.assertEqual(stop.exception.value, CommandResult(returncode=0, stdout="", stderr="err\n"))
+        self.assertEqual(self.delegate.calls, [])
+
+    def test_stream_lines_falls_back_to_delegate_without_shell_v2(self):
+        server = FakeAdbServer(shell_v2=False)
+        try:
+            client = AdbClient(AdbServerRunner(self.delegate, port=server.port), serial="serial-1")
+            self.assertEqual(list(client.stream_lines(["echo", "hi"])), ["delegated"])
+            self.assertEqual(self.delegate.calls, [["adb", "-s", "serial-1", "shell", "echo", "hi"]])
+        finally:
+            server.close()
+
+    def test_other_adb_commands_go_to_delegate(self):
+        self.runner.run(["adb", "-s", "serial-1", "push", "a", "b"])
+        self.assertEqual(self.delegate.calls, [["adb", "-s", "serial-1", "push", "a", "b"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from android_battery_optimizer.appops import parse_appops, parse_op_line, user_of_uid
+
+DUMP = """Current AppOps Service state:
+  Settings:
+    top_state_settle_time=+5s0ms
+  Uid 1000:
+    state=pers
+    Package android:
+      WAKE_LOCK (allow):
+  Uid u0a12:
+    state=cch
+    RUN_ANY_IN_BACKGROUND: mode=ignore
+    Package com.example.app:
+      WAKE_LOCK (allow / switch WAKE_LOCK=allow):
+        null=[
+          Access: [top-s] 2024-01-01 12:00:00.000 (-1d) duration=+12ms
+          Reject: [bg-s] 2024-01-01 11:00:00.000 (-1d3h)
+        ]
+      RUN_IN_BACKGROUND (ignore):
+  Uid u10a12:
+    Package com.example.app:
+      WAKE_LOCK (deny):
+  Historical ops from -1d to now:
+    Uid u0a12:
+      Package com.example.app:
+        WAKE_LOCK (foreground):
+"""
+
+LEGACY_DUMP = """  Uid u0a3:
+    Package com.old.app:
+      COARSE_LOCATION: mode=ignore; time=+1h2m ago; duration=+5ms
+        Access: top = 2024-01-01 (-1d) duration=+5ms
+      WAKE_LOCK: allow; time=+3m ago
+"""
+
+
+class TestAppOpsParser(unittest.TestCase):
+    def test_keeps_uid_and_user_boundaries(self):
+        dump = parse_appops(DUMP.splitlines())
+
+        self.assertEqual(
+            dump.for_user(0)["com.example.app"],
+            {"WAKE_LOCK": "allow", "RUN_IN_BACKGROUND": "ignore"},
+        )
+        self.assertEqual(dump.for_user(10), {"com.example.app": {"WAKE_LOCK": "deny"}})
+        self.assertEqual(dump.for_user(0)["android"], {"WAKE_LOCK": "allow"})
+        self.assertEqual(dump.package_uids[(0, "com.example.app")], "u0a12")
+        # Uid-level modes stay on the uid instead of leaking into the package.
+        self.assertEqual(dump.uid_modes["u0a12"], {"RUN_ANY_IN_BACKGROUND": "ignore"})
+
+    def test_older_format_ignores_timestamp_lines(self):
+        modes = parse_appops(LEGACY_DUMP.splitlines()).for_user(0)
+        self.assertEqual(modes, {"com.old.app": {"COARSE_LOCATION": "ignore", "WAKE_LOCK": "allow"}})
+
+    def test_dump_without_uid_blocks(self):
+        lines = ["  Package com.example.app:", "    RUN_ANY_IN_BACKGROUND: allow", "  Package com.empty:"]
+        modes = parse_appops(lines).for_user(0)
+        self.assertEqual(modes, {"com.example.app": {"RUN_ANY_IN_BACKGROUND": "allow"}, "com.empty": {}})
+
+    def test_op_lines_and_uids(self):
+        self.assertEqual(parse_op_line("CAMERA (foreground / switch CAMERA=allow):"), ("CAMERA", "foreground"))
+        self.assertEqual(parse_op_line("CAMERA: mode=errored"), ("CAMERA", "errored"))
+        self.assertIsNone(parse_op_line("state=cch"))
+        self.assertIsNone(parse_op_line("Access: [fg-s] 2024-01-01"))
+        self.assertEqual([user_of_uid(uid) for uid in ("u10a5", "u0i3", "1010005", "1000")], [10, 0, 10, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import asyncio
+import sys
+import threading
+import time
+import unittest
+
+from android_battery_optimizer.adb import (
+    AdbClient,
+    CommandError,
+    CommandResult,
+    CommandRunner,
+    SubprocessRunner,
+)
+from android_battery_optimizer.async_adb import (
+    AsyncAdbClient,
+    AsyncSubprocessRunner,
+    SyncRunnerAdapter,
+    call_concurrently,
+    run_sync,
+)
+from android_battery_optimizer.diagnose import Diagnoser
+from android_battery_optimizer.snapshot import prefetch_package_states
+
+
+class SlowFakeRunner(CommandRunner):
+    def __init__(self, responses=None, delay=0.05):
+        self.responses = responses or {}
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def run(self, args, input_data=None, timeout=None):
+        with self._lock:
+            self.calls.append(" ".join(args))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            return self.responses.get(" ".join(args), CommandResult(0, "", ""))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestAsyncAdbClient(unittest.TestCase):
+    def test_shell_text_mirrors_sync_client(self):
+        runner = SlowFakeRunner({"adb -s S shell echo hi": CommandResult(0, "hi\n", "")}, delay=0)
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        self.assertEqual(run_sync(client.aio.shell_text(["echo", "hi"])), "hi")
+
+    def test_check_raises_command_error(self):
+        runner = SlowFakeRunner({"adb -s S shell false": CommandResult(1, "", "boom")}, delay=0)
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        with self.assertRaises(CommandError):
+            run_sync(client.aio.shell(["false"]))
+        result = run_sync(client.aio.shell(["false"], check=False))
+        self.assertEqual(result.returncode, 1)
+
+    def test_dry_run_mutation_is_not_executed(self):
+        runner = SlowFakeRunner(delay=0)
+        client = AdbClient(runner, serial="S", dry_run=True, output=lambda _: None)
+        result = run_sync(client.aio.shell(["settings", "put", "global", "a", "1"], mutate=True))
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(runner.calls, [])
+
+    def test_shell_text_many_runs_concurrently_and_keeps_order(self):
+        runner = SlowFakeRunner(
+            {
+                "adb -s S shell echo 1": CommandResult(0, "1\n", ""),
+                "adb -s S shell echo 2": CommandResult(1, "", "bad"),
+                "adb -s S shell echo 3": CommandResult(0, "3\n", ""),
+            }
+        )
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        results = client.shell_text_many([["echo", "1"], ["echo", "2"], ["echo", "3"]])
+
+        self.assertEqual(results[0], "1")
+        self.assertIsInstance(results[1], CommandError)
+        self.assertEqual(results[2], "3")
+        self.assertGreater(runner.max_active, 1)
+
+    def test_subprocess_runner_timeout(self):
+        runner = AsyncSubprocessRunner()
+        with self.assertRaises(CommandError) as cm:
+            run_sync(runner.run([sys.executable, "-c", "import time; time.sleep(5)"], timeout=0.2))
+        self.assertIn("timed out", str(cm.exception))
+
+        result = run_sync(runner.run([sys.executable, "-c", "import sys; print(sys.stdin.read())"], input_data="abc"))
+        self.assertEqual(result, CommandResult(0, "abc\n", ""))
+
+    def test_subprocess_runner_newlines_match_sync_runner(self):
+        args = [sys.executable, "-c", "import sys; sys.stdout.buffer.write(b'a\\r\\nb\\rc\\n')"]
+        result = run_sync(AsyncSubprocessRunner().run(args))
+        self.assertEqual(result, CommandResult(0, "a\nb\nc\n", ""))
+        self.assertEqual(result, SubprocessRunner().run(args))
+
+    def test_plain_subprocess_runner_uses_asyncio_subprocesses(self):
+        client = AdbClient(SubprocessRunner(), serial="S", output=lambda _: None)
+        self.assertIsInstance(client.aio.runner, AsyncSubprocessRunner)
+
+        client = AdbClient(SlowFakeRunner(delay=0), serial="S", output=lambda _: None)
+        self.assertIsInstance(client.aio.runner, SyncRunnerAdapter)
+
+    def test_run_sync_works_inside_running_loop(self):
+        runner = SlowFakeRunner({"adb -s S shell echo x": CommandResult(0, "x\n", "")}, delay=0)
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+
+        async def main():
+            return client.shell_text_many([["echo", "x"]])
+
+        self.assertEqual(asyncio.run(main()), ["x"])
+
+    def test_call_concurrently_returns_exceptions_in_place(self):
+        def fail():
+            raise ValueError("nope")
+
+        results = call_concurrently([lambda: 1, fail, lambda: 3])
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 3)
+
+    def test_explicit_async_runner_is_used(self):
+        class FakeAsyncRunner(AsyncSubprocessRunner):
+            async def run(self, args, input_data=None, timeout=None):
+                return CommandResult(0, "async\n", "")
+
+        client = AdbClient(SlowFakeRunner(delay=0), serial="S", output=lambda _: None, async_runner=FakeAsyncRunner())
+        self.assertIsInstance(client.aio, AsyncAdbClient)
+        self.assertEqual(client.shell_text_many([["anything"]]), ["async"])
+
+
+class TestConcurrentHotPaths(unittest.TestCase):
+    def test_diagnoser_dumpsys_reads_overlap(self):
+        runner = SlowFakeRunner()
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        Diagnoser(client).run()
+        self.assertGreater(runner.max_active, 1)
+
+    def test_prefetch_reads_overlap(self):
+        runner = SlowFakeRunner(
+            {
+                "adb -s S shell pm list packages --user 0 -e": CommandResult(0, "package:a\n", ""),
+                "adb -s S shell pm list packages --user 0 -d": CommandResult(0, "package:b\n", ""),
+            }
+        )
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        enabled_ok, enabled, appops_ok, _, bucket_ok, _ = prefetch_package_states(client)
+        self.assertGreater(runner.max_active, 1)
+        self.assertTrue(enabled_ok and appops_ok and bucket_ok)
+        self.assertEqual(enabled, {"a": True, "b": False})
+
+
+if __name__ == "__main__":
+    unittest.main()
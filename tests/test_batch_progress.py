@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+
+from android_battery_optimizer.adb import CommandError
+from android_battery_optimizer.cli import progress_printer
+from android_battery_optimizer.recorder import BatchProgress, VerificationError
+from android_battery_optimizer.simulator import SimulatedDevice
+from batch_helpers import BatchRecordingRunner, device_state, fail_standby_bucket, make_app
+
+
+class StreamingRunner(BatchRecordingRunner):
+    """Streams batch script output line by line, with an optional fault.
+
+    `fail_package` makes that package's standby bucket command fail;
+    `revert_package` undoes that package's appop right after the script ran.
+    """
+
+    def __init__(self, devices, line_delay=0.0, fail_package=None, revert_package=None):
+        super().__init__(devices)
+        self.line_delay = line_delay
+        self.fail_package = fail_package
+        self.revert_package = revert_package
+        self.streaming = threading.Event()
+        self.reads_during_stream = 0
+
+    def run(self, args, input_data=None, timeout=None):
+        if self.streaming.is_set():
+            self.reads_during_stream += 1
+        return super().run(args, input_data=input_data, timeout=timeout)
+
+    def run_batch(self, args, script, timeout):
+        if self.fail_package:
+            script = fail_standby_bucket(script, self.fail_package)
+        result = super().run_batch(args, script, timeout)
+        if self.revert_package:
+            device = next(iter(self.devices.values()))
+            device.packages[self.revert_package].appops["RUN_ANY_IN_BACKGROUND"] = "allow"
+        return result
+
+    def stream_lines(self, args, timeout=None, input_data=None):
+        result = self.run(args, input_data=input_data, timeout=timeout)
+        self.streaming.set()
+        try:
+            for line in result.stdout.splitlines():
+                time.sleep(self.line_delay)
+                yield line
+        finally:
+            self.streaming.clear()
+        return result
+
+
+class TestBatchProgress(unittest.TestCase):
+    def make_app(self, packages=20, **runner_kwargs):
+        self.device = SimulatedDevice.generate(packages, sdk=34)
+        self.before = device_state(self.device)
+        self.runner = StreamingRunner([self.device], **runner_kwargs)
+        app = make_app(self, self.runner, self.device.serial)
+        self.events = []
+        app.recorder.on_progress = self.events.append
+        return app
+
+    def test_progress_is_reported_per_command(self):
+        app = self.make_app()
+        app.restrict_background_apps(level="ignore")
+
+        total = self.events[-1].total
+        self.assertGreater(total, 1)
+        self.assertEqual([event.done for event in self.events], list(range(1, total + 1)))
+        self.assertEqual(self.events[-1].eta, 0.0)
+        self.assertTrue(app.store.has_entries())
+
+        app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_finished_commands_are_verified_while_the_script_runs(self):
+        app = self.make_app(line_delay=0.005)
+        app.recorder.verify_interval = 0.05
+        app.restrict_background_apps(level="ignore")
+
+        self.assertGreater(self.runner.reads_during_stream, 0)
+
+    def test_readbacks_during_the_stream_are_limited_per_interval(self):
+        app = self.make_app(packages=150, line_delay=0.002)
+        app.recorder.verify_interval = 0.1
+        app.restrict_background_apps(level="ignore")
+
+        streamed = self.events[-1].elapsed
+        self.assertGreater(self.runner.reads_during_stream, 0)
+        self.assertLessEqual(self.runner.reads_during_stream, streamed / 0.1 + 1)
+
+    def test_verification_failure_rolls_back_the_batch(self):
+        app = self.make_app(revert_package="com.example.app0002")
+
+        with self.assertRaises(VerificationError):
+            app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(device_state(self.device), self.before)
+        self.assertFalse(app.store.has_entries())
+
+    def test_failed_command_rolls_back_what_the_stream_reported(self):
+        app = self.make_app(fail_package="com.example.app0003")
+
+        with self.assertRaises(CommandError):
+            app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(device_state(self.device), self.before)
+        self.assertFalse(app.store.has_entries())
+
+
+class TestProgressPrinter(unittest.TestCase):
+    def test_prints_at_most_once_per_interval_and_the_last_event(self):
+        lines = []
+        render = progress_printer(lines.append, interval=60)
+        for done in range(1, 11):
+            render(BatchProgress(done=done, total=10, failed=0, elapsed=done / 5))
+
+        self.assertEqual(lines, ["Applied 1/10 commands (5/s, ~2s left)", "Applied 10/10 commands (5/s)"])
+
+
+if __name__ == "__main__":
+    unittest.main()
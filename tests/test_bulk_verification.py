@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient
+from android_battery_optimizer.app import BatteryOptimizerApp
+from android_battery_optimizer.recorder import VerificationError
+from android_battery_optimizer.simulator import SimulatedDevice, SimulatedDeviceRunner
+from android_battery_optimizer.snapshot import parse_standby_bucket_listing
+
+
+class RecordingRunner(SimulatedDeviceRunner):
+    """Records commands and optionally undoes one appop right after the batch."""
+
+    def __init__(self, devices, revert_package=None):
+        super().__init__(devices)
+        self.commands = []
+        self.revert_package = revert_package
+
+    def run(self, args, input_data=None, timeout=None):
+        self.commands.append(" ".join(args))
+        result = super().run(args, input_data=input_data, timeout=timeout)
+        if self.revert_package and input_data and args[-1] == "shell":
+            device = next(iter(self.devices.values()))
+            device.packages[self.revert_package].appops["RUN_ANY_IN_BACKGROUND"] = "allow"
+        return result
+
+
+class TestStandbyBucketListing(unittest.TestCase):
+    def test_parses_listing_per_user(self):
+        lines = ["com.a: 10", "com.b: 45", "garbage"]
+        self.assertEqual(parse_standby_bucket_listing(lines), {"com.a": "10", "com.b": "45"})
+        self.assertEqual(parse_standby_bucket_listing(lines[:1], user=10), {"10/com.a": "10"})
+
+
+class TestBulkVerification(unittest.TestCase):
+    def make_app(self, revert_package=None):
+        self.device = SimulatedDevice.generate(30, sdk=34)
+        self.runner = RecordingRunner([self.device], revert_package=revert_package)
+        self.client = AdbClient(self.runner, serial=self.device.serial, output=lambda _: None)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return BatteryOptimizerApp(self.client, Path(tmp.name))
+
+    def per_package_reads(self):
+        return [
+            cmd for cmd in self.runner.commands
+            if " shell cmd appops get com.example" in cmd or " shell am get-standby-bucket com.example" in cmd
+        ]
+
+    def test_matching_batch_is_verified_in_one_read(self):
+        app = self.make_app()
+        app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(self.per_package_reads(), [])
+        batch = self.runner.commands.index(f"adb -s {self.device.serial} shell")
+        readbacks = [cmd for cmd in self.runner.commands[batch + 1:] if "__ABO_PREFETCH__" in cmd]
+        self.assertEqual(len(readbacks), 1)
+        self.assertTrue(app.store.has_entries())
+
+    def test_reset_to_default_is_verified_without_per_entry_reads(self):
+        app = self.make_app()
+        packages = ["com.example.app0001", "com.example.app0002"]
+        for package in packages:
+            self.device.packages[package].appops["RUN_ANY_IN_BACKGROUND"] = "ignore"
+
+        with app.recorder.transaction():
+            app.recorder.prefetch_package_states(appops_ops=["RUN_ANY_IN_BACKGROUND"])
+            for package in packages:
+                app.recorder.set_appop(package, "RUN_ANY_IN_BACKGROUND", "default")
+
+        self.assertEqual(self.per_package_reads(), [])
+        for package in packages:
+            self.assertNotIn("RUN_ANY_IN_BACKGROUND", self.device.packages[package].appops)
+
+    def test_mismatch_is_confirmed_per_entry_and_rolled_back(self):
+        app = self.make_app(revert_package="com.example.app0001")
+        before = {name: (pkg.bucket, dict(pkg.appops)) for name, pkg in self.device.packages.items()}
+
+        with self.assertRaisesRegex(
+            VerificationError,
+            "Verification failed for appop RUN_ANY_IN_BACKGROUND for package com.example.app0001: expected ignore, got allow",
+        ):
+            app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(
+            self.per_package_reads(),
+            [f"adb -s {self.device.serial} shell cmd appops get com.example.app0001 RUN_ANY_IN_BACKGROUND"],
+        )
+        # The forward batch and the whole rollback, one script each.
+        scripts = [cmd for cmd in self.runner.commands if cmd == f"adb -s {self.device.serial} shell"]
+        self.assertEqual(len(scripts), 2)
+        after = {name: (pkg.bucket, dict(pkg.appops)) for name, pkg in self.device.packages.items()}
+        self.assertEqual(after, before)
+        self.assertFalse(app.store.has_entries())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import BOOT_ID_PATH, AdbClient, CommandResult, CommandRunner
+from android_battery_optimizer.capabilities import CapabilityCache
+from android_battery_optimizer.cli import parse_args
+
+DUMP_COMMAND = f"adb -s S shell getprop ; echo __ABO_BOOT_ID__ ; cat {BOOT_ID_PATH}"
+
+
+def make_dump(fingerprint):
+    return CommandResult(
+        0,
+        "[ro.product.brand]: [google]\n"
+        "[ro.product.model]: [Pixel 6]\n"
+        "[ro.build.version.release]: [13]\n"
+        "[ro.build.version.sdk]: [33]\n"
+        f"[ro.build.fingerprint]: [{fingerprint}]\n"
+        "__ABO_BOOT_ID__\nboot-1\n",
+        "",
+    )
+
+
+class FakeRunner(CommandRunner):
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        cmd = " ".join(args)
+        self.calls.append(cmd)
+        return self.responses.get(cmd, CommandResult(0, "", ""))
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestCapabilityCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "capabilities.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_client(self, fingerprint="fp-1", refresh=False, dry_run=False):
+        runner = FakeRunner()
+        runner.responses[DUMP_COMMAND] = make_dump(fingerprint)
+        runner.responses["adb -s S shell am get-standby-bucket android"] = CommandResult(0, "10\n", "")
+        client = AdbClient(runner, serial="S", dry_run=dry_run, output=lambda _: None)
+        client.capabilities = CapabilityCache(self.path, refresh=refresh)
+        return client, runner
+
+    def probe_calls(self, runner):
+        return [call for call in runner.calls if call != DUMP_COMMAND]
+
+    def test_positive_answers_are_reused_across_clients(self):
+        client, runner = self.make_client()
+        self.assertTrue(client.supports_device_config())
+        self.assertTrue(client.supports_standby_bucket())
+        self.assertTrue(client.supports_settings_namespace("global"))
+        self.assertEqual(len(self.probe_calls(runner)), 3)
+
+        client, runner = self.make_client()
+        self.assertTrue(client.supports_device_config())
+        self.assertTrue(client.supports_standby_bucket())
+        self.assertTrue(client.supports_settings_namespace("global"))
+        self.assertEqual(self.probe_calls(runner), [])
+        self.assertEqual(runner.calls, [DUMP_COMMAND])
+
+    def test_new_fingerprint_probes_again(self):
+        client, _ = self.make_client("fp-1")
+        client.supports_device_config()
+        client, runner = self.make_client("fp-2")
+        client.supports_device_config()
+        self.assertEqual(self.probe_calls(runner), ["adb -s S shell device_config list"])
+
+    def test_negative_answers_are_not_cached(self):
+        client, runner = self.make_client()
+        runner.responses["adb -s S shell device_config list"] = CommandResult(1, "", "unknown command")
+        self.assertFalse(client.supports_device_config())
+
+        client, runner = self.make_client()
+        self.assertTrue(client.supports_device_config())
+        self.assertEqual(self.probe_calls(runner), ["adb -s S shell device_config list"])
+
+    def test_refresh_reprobes_and_drops_stale_answer(self):
+        client, _ = self.make_client()
+        client.supports_device_config()
+
+        client, runner = self.make_client(refresh=True)
+        runner.responses["adb -s S shell device_config list"] = CommandResult(1, "", "unknown command")
+        self.assertFalse(client.supports_device_config())
+
+        with self.path.open() as handle:
+            self.assertEqual(json.load(handle)["fingerprints"], {})
+
+    def test_refresh_serves_answers_probed_in_the_same_run(self):
+        client, _ = self.make_client()
+        client.supports_device_config()
+
+        client, runner = self.make_client(refresh=True)
+        self.assertTrue(client.supports_device_config())
+        self.assertTrue(client.supports_device_config())
+        self.assertEqual(self.probe_calls(runner), ["adb -s S shell device_config list"])
+
+    def test_unusable_fingerprint_skips_cache(self):
+        runner = FakeRunner()
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        client.capabilities = CapabilityCache(self.path)
+        self.assertTrue(client.supports_device_config())
+        self.assertFalse(self.path.exists())
+
+    def test_dry_run_does_not_write_cache(self):
+        client, _ = self.make_client(dry_run=True)
+        self.assertTrue(client.supports_device_config())
+        self.assertFalse(self.path.exists())
+
+    def test_corrupt_cache_file_is_ignored(self):
+        self.path.write_text("{not json")
+        client, runner = self.make_client()
+        self.assertTrue(client.supports_device_config())
+        self.assertIn("adb -s S shell device_config list", runner.calls)
+
+    def test_refresh_flag_is_parsed(self):
+        self.assertTrue(parse_args(["status", "--refresh-capabilities"]).refresh_capabilities)
+        self.assertFalse(parse_args(["status"]).refresh_capabilities)
+
+
+if __name__ == "__main__":
+    unittest.main()
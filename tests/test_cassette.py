@@ -0,0 +1,183 @@
+import io
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, CommandRunner
+from android_battery_optimizer.app import BatteryOptimizerApp
+from android_battery_optimizer.cassette import CassetteError, RecordingRunner, ReplayRunner
+from android_battery_optimizer.cli import BatteryOptimizerCLI, main, parse_args
+from android_battery_optimizer.simulator import SimulatedDevice, SimulatedDeviceRunner
+
+
+class FakeRunner(CommandRunner):
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        cmd = " ".join(args)
+        self.calls.append(cmd)
+        response = self.responses.get(cmd, CommandResult(0, "", ""))
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, list):
+            return response.pop(0)
+        return response
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class StreamingFakeRunner(FakeRunner):
+    def __init__(self, lines):
+        super().__init__()
+        self.lines = lines
+        self.yielded = 0
+
+    def stream_lines(self, args, timeout=None, input_data=None):
+        self.calls.append(" ".join(args))
+        for line in self.lines:
+            self.yielded += 1
+            yield line
+        return CommandResult(0, "", "warning\n")
+
+
+class TestCassette(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def record(self, path, responses, calls):
+        recorder = RecordingRunner(FakeRunner(responses), path)
+        results = []
+        for args, input_data in calls:
+            try:
+                results.append(recorder.run(args, input_data=input_data))
+            except CommandError as exc:
+                results.append(exc)
+        recorder.which("adb")
+        recorder.close()
+        return results
+
+    def test_round_trip_preserves_results_in_order(self):
+        for name in ("session.jsonl", "session.jsonl.gz"):
+            with self.subTest(name=name):
+                path = self.dir / name
+                responses = {
+                    "adb shell dumpsys battery": [CommandResult(0, "level: 50\n", ""), CommandResult(0, "level: 49\n", "")],
+                    "adb shell": CommandResult(1, "SUCCESS_0\n", "boom\n"),
+                }
+                calls = [
+                    (["adb", "shell", "dumpsys", "battery"], None),
+                    (["adb", "shell"], "echo x\n"),
+                    (["adb", "shell", "dumpsys", "battery"], None),
+                ]
+                recorded = self.record(path, responses, calls)
+
+                replay = ReplayRunner(path)
+                replayed = [replay.run(args, input_data=data) for args, data in calls]
+                self.assertEqual(replayed, recorded)
+                self.assertEqual(replay.which("adb"), "/usr/bin/adb")
+                self.assertEqual(replay.remaining(), 0)
+                # Exhausted calls repeat their last recording.
+                self.assertEqual(replay.run(["adb", "shell", "dumpsys", "battery"]).stdout, "level: 49\n")
+
+    def test_streams_are_passed_through_and_replayed(self):
+        path = self.dir / "stream.jsonl"
+        delegate = StreamingFakeRunner(["SUCCESS_0", "SUCCESS_1"])
+        recorder = RecordingRunner(delegate, path)
+        stream = recorder.stream_lines(["adb", "shell"], input_data="script")
+        self.assertEqual(next(stream), "SUCCESS_0")
+        # Lines reach the caller as the delegate yields them.
+        self.assertEqual(delegate.yielded, 1)
+        self.assertEqual(list(stream), ["SUCCESS_1"])
+        recorder.close()
+
+        replay = ReplayRunner(path)
+        stream = replay.stream_lines(["adb", "shell"], input_data="script")
+        self.assertEqual(list(stream), ["SUCCESS_0", "SUCCESS_1"])
+        self.assertEqual(replay.run(["adb", "shell"], input_data="script").stderr, "warning\n")
+
+    def test_errors_are_replayed(self):
+        path = self.dir / "timeout.jsonl"
+        error = CommandError("Command timed out after 30s: adb shell x", result=CommandResult(-1, "part", ""))
+        self.record(path, {"adb shell x": error}, [(["adb", "shell", "x"], None)])
+
+        with self.assertRaises(CommandError) as cm:
+            ReplayRunner(path).run(["adb", "shell", "x"])
+        self.assertIn("timed out", str(cm.exception))
+        self.assertEqual(cm.exception.result.stdout, "part")
+
+    def test_unknown_call_and_strict_mode(self):
+        path = self.dir / "one.jsonl"
+        self.record(path, {}, [(["adb", "shell", "true"], None)])
+
+        replay = ReplayRunner(path, strict=True)
+        replay.run(["adb", "shell", "true"])
+        with self.assertRaises(CassetteError):
+            replay.run(["adb", "shell", "true"])
+        with self.assertRaises(CassetteError):
+            replay.run(["adb", "shell", "false"])
+        self.assertEqual(replay.misses, [["adb", "shell", "true"], ["adb", "shell", "false"]])
+
+    def test_replay_latency(self):
+        path = self.dir / "slow.jsonl"
+        path.write_text(
+            '{"cassette":1}\n'
+            '{"args":["adb","shell","x"],"input":null,"returncode":0,"stdout":"","stderr":"","seconds":0.05}\n'
+        )
+        started = time.perf_counter()
+        ReplayRunner(path, replay_latency=True).run(["adb", "shell", "x"])
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+    def test_cli_replays_recorded_status(self):
+        path = self.dir / "status.jsonl"
+        responses = {
+            "adb devices": CommandResult(0, "List of devices attached\nS\tdevice\n", ""),
+            "adb -s S shell getprop ro.product.brand": CommandResult(0, "Google\n", ""),
+            "adb -s S shell getprop ro.product.model": CommandResult(0, "Pixel\n", ""),
+        }
+        recorder = RecordingRunner(FakeRunner(responses), path)
+        client = AdbClient(recorder, serial="S", output=lambda _: None)
+        app = BatteryOptimizerApp(client, self.dir / "state")
+        outputs = []
+        BatteryOptimizerCLI(app, output=outputs.append).run_command(parse_args(["status"]))
+        recorder.close()
+
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            code = main(["status", "--serial", "S", "--replay", str(path), "--state-dir", str(self.dir / "state")])
+        self.assertEqual(code, 0)
+        self.assertIn("Device info: Google Pixel", buffer.getvalue())
+        self.assertIn("Device info: Google Pixel", "\n".join(outputs))
+
+    def test_replay_does_not_write_the_state_dir(self):
+        path = self.dir / "apply.jsonl"
+        device = SimulatedDevice.generate(10, sdk=34)
+        recorder = RecordingRunner(SimulatedDeviceRunner([device]), path)
+        client = AdbClient(recorder, serial=device.serial, output=lambda _: None)
+        app = BatteryOptimizerApp(client, self.dir / "recorded")
+        BatteryOptimizerCLI(app, output=lambda _: None).run_command(parse_args(["apply-safe"]))
+        recorder.close()
+        self.assertTrue(app.store.has_entries())
+
+        state_dir = self.dir / "state"
+        state_dir.mkdir()
+        (state_dir / "keep.txt").write_text("untouched")
+        with redirect_stdout(io.StringIO()):
+            code = main([
+                "apply-safe", "--serial", device.serial,
+                "--replay", str(path), "--state-dir", str(state_dir),
+            ])
+        self.assertEqual(code, 0)
+        self.assertEqual([item.name for item in state_dir.iterdir()], ["keep.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import CommandError, CommandResult
+from android_battery_optimizer.simulator import SimulatedDevice
+from batch_helpers import BatchRecordingRunner, device_state, make_app
+
+
+class ChunkRunner(BatchRecordingRunner):
+    """Breaks the forward batch script numbered `fail_at`."""
+
+    def __init__(self, devices, fail_at=None, crash=False):
+        super().__init__(devices)
+        self.fail_at = fail_at
+        self.crash = crash
+
+    def run_batch(self, args, script, timeout):
+        if len(self.scripts) == self.fail_at:
+            if self.crash:
+                raise KeyboardInterrupt
+            return CommandResult(returncode=1, stdout="", stderr="error: device offline")
+        return super().run_batch(args, script, timeout)
+
+
+class TestChunkedBatches(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedDevice.generate(30, sdk=34)
+        self.before = device_state(self.device)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.output = []
+
+    def make_app(self, **runner_kwargs):
+        self.runner = ChunkRunner([self.device], **runner_kwargs)
+        app = make_app(self, self.runner, self.device.serial, output=self.output.append, state_dir=self.tmp.name)
+        app.recorder.chunk_size = 20
+        return app
+
+    def restricted(self):
+        return {
+            name for name, pkg in self.device.packages.items()
+            if pkg.appops.get("RUN_ANY_IN_BACKGROUND") == "ignore"
+        }
+
+    def state_file(self):
+        return json.loads((Path(self.tmp.name) / "devices" / self.device.serial / "state.json").read_text())
+
+    def test_large_batch_is_sent_in_chunks(self):
+        app = self.make_app()
+        app.restrict_background_apps(level="ignore")
+
+        commands = sum(len(script.splitlines()) for script in self.runner.scripts)
+        self.assertGreater(commands, 20)
+        self.assertTrue(all(len(script.splitlines()) <= 20 for script in self.runner.scripts))
+        self.assertEqual(len(self.runner.scripts), -(-commands // 20))
+        self.assertNotIn("checkpoint", self.state_file())
+
+        app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_failed_chunk_keeps_committed_chunks_and_resumes(self):
+        app = self.make_app(fail_at=2)
+        with self.assertRaises(CommandError):
+            app.restrict_background_apps(level="ignore")
+
+        first_chunk = self.restricted()
+        self.assertTrue(first_chunk)
+        self.assertEqual(len(self.state_file()["checkpoint"]), 20)
+        self.assertTrue(any("remain applied" in line for line in self.output))
+
+        app = self.make_app()
+        app.restrict_background_apps(level="ignore")
+        self.assertTrue(any("Resuming: 20 changes" in line for line in self.output))
+        self.assertNotIn("checkpoint", self.state_file())
+        self.assertGreater(self.restricted(), first_chunk)
+
+        app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_interrupted_run_leaves_snapshots_on_disk_and_resumes(self):
+        app = self.make_app(fail_at=2, crash=True)
+        with self.assertRaises(KeyboardInterrupt):
+            app.restrict_background_apps(level="ignore")
+
+        # Written before the second chunk was dispatched.
+        state = self.state_file()
+        self.assertEqual(len(state["checkpoint"]), 20)
+        self.assertGreater(len(state["packages"]), 10)
+
+        app = self.make_app()
+        app.restrict_background_apps(level="ignore")
+        self.assertTrue(any("Resuming: 20 changes" in line for line in self.output))
+
+        app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from android_battery_optimizer.adb import CommandError
+from android_battery_optimizer.ledger import KIND, EntryKind
+from android_battery_optimizer.recorder import PartialBatchError
+from android_battery_optimizer.simulator import SimulatedDevice
+from batch_helpers import BatchRecordingRunner, device_state, fail_standby_bucket, make_app
+
+
+class BucketFailingRunner(BatchRecordingRunner):
+    """Makes `am set-standby-bucket` fail in batch scripts for `package`; for every package if empty."""
+
+    def __init__(self, devices, package=None):
+        super().__init__(devices)
+        self.package = package
+
+    def run_batch(self, args, script, timeout):
+        if self.package is not None:
+            script = fail_standby_bucket(script, self.package)
+        return super().run_batch(args, script, timeout)
+
+
+class TestContinueOnError(unittest.TestCase):
+    def make_app(self, package=None, continue_on_error=True):
+        self.device = SimulatedDevice.generate(20, sdk=34)
+        self.before = device_state(self.device)
+        self.runner = BucketFailingRunner([self.device], package=package)
+        app = make_app(self, self.runner, self.device.serial)
+        app.recorder.continue_on_error = continue_on_error
+        return app
+
+    def test_failed_command_is_dropped_and_the_rest_applied(self):
+        app = self.make_app(package="com.example.app0003")
+
+        with self.assertRaises(PartialBatchError) as ctx:
+            app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(ctx.exception.failed_packages, {"com.example.app0003"})
+        [(entry, status)] = ctx.exception.failures
+        self.assertEqual((entry[KIND], status), (EntryKind.STANDBY_BUCKET, 1))
+        self.assertEqual(len(self.runner.scripts), 1)
+        self.assertIn('|| echo "FAIL_', self.runner.scripts[0])
+
+        failed = self.device.packages["com.example.app0003"]
+        self.assertEqual(failed.appops["RUN_ANY_IN_BACKGROUND"], "ignore")
+        self.assertEqual(self.device.packages["com.example.app0004"].bucket, 40)
+        saved = app.store.data["packages"]["com.example.app0003"]
+        self.assertIn("RUN_ANY_IN_BACKGROUND", saved["appops"])
+        self.assertIsNone(saved["standby_bucket"])
+
+        app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_failed_command_keeps_a_snapshot_from_an_earlier_run(self):
+        package = "com.example.app0003"
+        app = self.make_app()
+        self.device.packages[package].bucket = 20
+        with app.recorder.transaction():
+            app.recorder.prefetch_package_states(appops_ops=[])
+            app.recorder.set_standby_bucket(package, "rare")
+        self.assertEqual(self.device.packages[package].bucket, 40)
+
+        self.runner.package = package
+        with self.assertRaises(PartialBatchError):
+            with app.recorder.transaction():
+                app.recorder.prefetch_package_states(appops_ops=[])
+                app.recorder.set_standby_bucket(package, "restricted")
+
+        self.assertEqual(app.store.data["packages"][package]["standby_bucket"], "20")
+        app.revert_saved_state()
+        self.assertEqual(self.device.packages[package].bucket, 20)
+
+    def test_without_the_option_a_failure_reverts_the_batch(self):
+        app = self.make_app(package="com.example.app0003", continue_on_error=False)
+
+        with self.assertRaises(CommandError):
+            app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(device_state(self.device), self.before)
+        self.assertFalse(app.store.has_entries())
+
+    def test_smart_restrict_reports_uncontrollable_buckets_as_skipped(self):
+        app = self.make_app(package="")
+
+        result = app.smart_restrict()
+
+        # Only packages already in the target bucket need no bucket command.
+        for item in result["applied"]:
+            self.assertEqual(self.before[item["package"]][0], 40)
+        reasons = {item["reason"] for item in result["skipped"]}
+        self.assertIn("standby_bucket_not_controllable", reasons)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+from android_battery_optimizer.adb import BOOT_ID_PATH, AdbClient, CommandError, CommandResult, CommandRunner
+from android_battery_optimizer.android import parse_getprop_output
+
+DUMP_COMMAND = f"adb -s S shell getprop ; echo __ABO_BOOT_ID__ ; cat {BOOT_ID_PATH}"
+DUMP = (
+    "[ro.build.fingerprint]: [google/oriole/oriole:13/TP1A/1:user/release-keys]\n"
+    "[ro.build.version.release]: [13]\n"
+    "[ro.build.version.sdk]: [33]\n"
+    "[ro.product.brand]: [google]\n"
+    "[ro.product.model]: [Pixel 6]\n"
+    "[persist.sys.motd]: [line one\n"
+    "line two]\n"
+    "__ABO_BOOT_ID__\n"
+    "boot-1\n"
+)
+
+
+class FakeRunner(CommandRunner):
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        cmd = " ".join(args)
+        self.calls.append(cmd)
+        response = self.responses.get(cmd, CommandResult(0, "", ""))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestDeviceProperties(unittest.TestCase):
+    def setUp(self):
+        self.runner = FakeRunner()
+        self.client = AdbClient(self.runner, serial="S", output=lambda _: None)
+
+    def test_parse_getprop_output_handles_multiline_values(self):
+        properties = parse_getprop_output(DUMP.split("__ABO_BOOT_ID__")[0])
+        self.assertEqual(properties["ro.product.model"], "Pixel 6")
+        self.assertEqual(properties["persist.sys.motd"], "line one\nline two")
+
+    def test_single_dump_is_memoized(self):
+        self.runner.responses[DUMP_COMMAND] = CommandResult(0, DUMP, "")
+
+        info = self.client.get_device_info_struct()
+        metadata = self.client.get_device_metadata()
+        self.client.get_device_info_struct()
+
+        self.assertEqual(self.runner.calls, [DUMP_COMMAND])
+        self.assertEqual(info.sdk_int, 33)
+        self.assertEqual(info.brand, "google")
+        self.assertEqual(metadata["fingerprint"], "google/oriole/oriole:13/TP1A/1:user/release-keys")
+        self.assertEqual(metadata["sdk"], "33")
+
+    def test_cache_is_per_serial(self):
+        self.runner.responses[DUMP_COMMAND] = CommandResult(0, DUMP, "")
+        self.client.get_device_info_struct()
+        self.client.serial = "T"
+        info = self.client.get_device_info_struct()
+
+        self.assertEqual(info.serial, "T")
+        self.assertIn("adb -s T shell getprop ro.product.brand", self.runner.calls)
+
+    def test_unusable_dump_falls_back_to_per_key_reads_and_is_not_cached(self):
+        self.runner.responses["adb -s S shell getprop ro.build.version.sdk"] = CommandResult(0, "30\n", "")
+
+        self.assertEqual(self.client.get_device_info_struct().sdk_int, 30)
+        self.client.get_device_info_struct()
+
+        self.assertEqual(self.runner.calls.count(DUMP_COMMAND), 2)
+        self.assertEqual(self.runner.calls.count("adb -s S shell getprop ro.build.version.sdk"), 2)
+
+    def test_per_key_fallback_keeps_check_semantics(self):
+        self.runner.responses["adb -s S shell getprop ro.product.brand"] = CommandResult(1, "", "boom")
+        with self.assertRaises(CommandError):
+            self.client.get_device_metadata()
+        self.assertEqual(self.client.get_device_metadata_with_fallback()["brand"], "")
+
+    def test_revalidate_drops_cache_after_reboot(self):
+        self.runner.responses[DUMP_COMMAND] = CommandResult(0, DUMP, "")
+        self.client.get_device_info_struct()
+
+        self.runner.responses[f"adb -s S shell cat {BOOT_ID_PATH}"] = CommandResult(0, "boot-1\n", "")
+        self.client.revalidate_device_properties()
+        self.client.get_device_info_struct()
+        self.assertEqual(self.runner.calls.count(DUMP_COMMAND), 1)
+
+        self.runner.responses[f"adb -s S shell cat {BOOT_ID_PATH}"] = CommandResult(0, "boot-2\n", "")
+        self.client.revalidate_device_properties()
+        self.client.get_device_info_struct()
+        self.assertEqual(self.runner.calls.count(DUMP_COMMAND), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import CommandResult, CommandRunner
+from android_battery_optimizer.cli import main, parse_args
+from android_battery_optimizer.fleet import (
+    DeviceRunResult,
+    FleetRunner,
+    fleet_exit_code,
+    parse_serials,
+    run_fleet,
+)
+
+
+class FleetFakeRunner(CommandRunner):
+    def __init__(self, devices):
+        self.devices = devices
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def run(self, args, input_data=None, timeout=None):
+        with self._lock:
+            self.calls.append(list(args))
+        if list(args) == ["adb", "devices"]:
+            lines = [f"{serial}\t{status}" for serial, status in self.devices.items()]
+            return CommandResult(0, "List of devices attached\n" + "\n".join(lines) + "\n", "")
+        if len(args) > 4 and args[4] == "getprop":
+            return CommandResult(0, f"{args[-1]}-{args[2]}\n", "")
+        return CommandResult(0, "", "")
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_serials(self):
+        self.assertEqual(parse_serials(" a, b,,a ,c"), ["a", "b", "c"])
+        self.assertEqual(parse_serials(None), [])
+
+    def test_exit_code_reflects_partial_failure(self):
+        ok = DeviceRunResult("a", 0, 0.1)
+        bad = DeviceRunResult("b", 1, 0.1)
+        self.assertEqual(fleet_exit_code([ok, ok]), 0)
+        self.assertEqual(fleet_exit_code([bad, bad]), 1)
+        self.assertEqual(fleet_exit_code([ok, bad]), 2)
+
+    def test_all_devices_runs_each_ready_device_with_own_state(self):
+        runner = FleetFakeRunner({"A1": "device", "B2": "device", "C3": "unauthorized"})
+        outputs = []
+        args = parse_args(["--all-devices", "status"])
+        code = run_fleet(args, runner, self.state_dir, output=outputs.append)
+
+        self.assertEqual(code, 0)
+        text = "\n".join(outputs)
+        self.assertIn("Skipping device C3 because it is unauthorized.", text)
+        self.assertIn("[A1] Selected device: A1", text)
+        self.assertIn("[B2] Selected device: B2", text)
+        self.assertIn("2/2 devices succeeded.", text)
+        shell_serials = {call[2] for call in runner.calls if len(call) > 3 and call[3] == "shell"}
+        self.assertEqual(shell_serials, {"A1", "B2"})
+
+    def test_serials_partial_failure_returns_two(self):
+        runner = FleetFakeRunner({"A1": "device", "C3": "unauthorized"})
+        outputs = []
+        args = parse_args(["status", "--serials", "A1,C3"])
+        code = run_fleet(args, runner, self.state_dir, output=outputs.append)
+
+        self.assertEqual(code, 2)
+        table = [line for line in outputs if line.startswith("C3")]
+        self.assertEqual(len(table), 1)
+        self.assertIn("FAILED", table[0])
+        self.assertIn("unauthorized", table[0])
+
+    def test_worker_exception_is_reported_per_device(self):
+        class ExplodingFleet(FleetRunner):
+            def run_device(self, serial, args):
+                if serial == "bad":
+                    return super().run_device(serial, None)
+                return super().run_device(serial, args)
+
+        runner = FleetFakeRunner({"good": "device", "bad": "device"})
+        outputs = []
+        fleet = ExplodingFleet(runner, self.state_dir, jobs=2, output=outputs.append)
+        results = fleet.run(["good", "bad"], parse_args(["status"]))
+
+        self.assertEqual([result.exit_code for result in results], [0, 1])
+        self.assertTrue(results[1].error.startswith("Error:"))
+
+    def test_fleet_requires_subcommand_and_rejects_serial(self):
+        outputs = []
+        self.assertEqual(run_fleet(parse_args(["--all-devices"]), FleetFakeRunner({}), self.state_dir, outputs.append), 1)
+        self.assertEqual(
+            run_fleet(parse_args(["status", "--serial", "A", "--serials", "B"]), FleetFakeRunner({}), self.state_dir, outputs.append),
+            1,
+        )
+        self.assertIn("Error: --serial cannot be combined with --all-devices/--serials.", outputs)
+
+    def test_plan_path_without_serial_is_rejected_for_several_devices(self):
+        outputs = []
+        runner = FleetFakeRunner({})
+        for argv in (
+            ["--serials", "A,B", "plan", "restrict-apps", "--out", "plan.json"],
+            ["--serials", "A,B", "apply", "--plan", "plan.json", "--yes"],
+        ):
+            self.assertEqual(run_fleet(parse_args(argv), runner, self.state_dir, outputs.append), 1)
+        self.assertEqual(runner.calls, [])
+        self.assertIn("Error: with several devices the plan file path must contain `{serial}`.", outputs)
+
+    def test_main_dispatches_to_fleet(self):
+        from unittest.mock import patch
+
+        with patch("android_battery_optimizer.cli.run_fleet", return_value=2) as mock_fleet:
+            code = main(["status", "--serials", "a,b", "--jobs", "4", "--state-dir", self.tmp.name])
+        self.assertEqual(code, 2)
+        self.assertEqual(mock_fleet.call_args.args[0].jobs, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, CommandRunner
+from android_battery_optimizer.cli import main
+from android_battery_optimizer.diagnose import Diagnoser
+from android_battery_optimizer.instrument import (
+    NO_OPERATION,
+    InstrumentedRunner,
+    classify_command,
+    operation_scope,
+)
+
+
+class FakeRunner(CommandRunner):
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+
+    def run(self, args, input_data=None, timeout=None):
+        response = self.responses.get(" ".join(args), CommandResult(0, "", ""))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestClassifyCommand(unittest.TestCase):
+    def test_command_classes(self):
+        cases = {
+            ("adb", "-s", "S", "shell", "settings", "get", "global", "x"): "settings get",
+            ("adb", "shell", "dumpsys", "usagestats"): "dumpsys usagestats",
+            ("adb", "-s", "S", "shell", "cmd", "appops", "set", "pkg", "OP", "ignore"): "cmd appops set",
+            ("adb", "-s", "S", "shell", "pm", "list", "packages", "-3"): "pm list",
+            ("adb", "-s", "S", "shell", "dumpsys", "batterystats", "--charged"): "dumpsys batterystats",
+            ("adb", "-s", "S", "shell", "getprop", "ro.product.brand"): "getprop",
+            ("adb", "devices"): "adb devices",
+        }
+        for args, expected in cases.items():
+            with self.subTest(args=args):
+                self.assertEqual(classify_command(list(args)), expected)
+        self.assertEqual(classify_command(["adb", "-s", "S", "shell"], input_data="echo hi\n"), "shell script")
+
+
+class TestInstrumentedRunner(unittest.TestCase):
+    def test_records_bytes_exit_codes_and_operations(self):
+        runner = InstrumentedRunner(
+            FakeRunner({"adb -s S shell settings get global a": CommandResult(3, "abc", "e")})
+        )
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+
+        client.shell(["settings", "get", "global", "a"], check=False)
+        with operation_scope("smart_restrict"):
+            client.shell(["settings", "get", "global", "a"], check=False)
+            with operation_scope("diagnose"):
+                client.shell(["dumpsys", "usagestats"], check=False)
+
+        snapshot = runner.stats.snapshot()
+        self.assertEqual(set(snapshot), {NO_OPERATION, "smart_restrict", "smart_restrict/diagnose"})
+        settings = snapshot["smart_restrict"]["commands"]["settings get"]
+        self.assertEqual(settings["count"], 1)
+        self.assertEqual(settings["failures"], 1)
+        self.assertEqual(settings["stdout_bytes"], 3)
+        self.assertEqual(settings["stderr_bytes"], 1)
+        self.assertEqual(sum(settings["histogram_ms"].values()), 1)
+        self.assertEqual(snapshot["smart_restrict/diagnose"]["round_trips"], 1)
+        self.assertEqual(runner.stats.total_round_trips(), 3)
+
+    def test_timeouts_are_recorded_and_reraised(self):
+        error = CommandError("Command timed out", result=CommandResult(-1, "partial", ""))
+        runner = InstrumentedRunner(FakeRunner({"adb -s S shell dumpsys appops": error}))
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+
+        with self.assertRaises(CommandError):
+            client.shell(["dumpsys", "appops"], check=False)
+        stats = runner.stats.snapshot()[NO_OPERATION]["commands"]["dumpsys appops"]
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["stdout_bytes"], len("partial"))
+
+    def test_operation_is_kept_for_concurrent_reads(self):
+        runner = InstrumentedRunner(FakeRunner())
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        Diagnoser(client).run()
+
+        snapshot = runner.stats.snapshot()
+        self.assertIn("dumpsys usagestats", snapshot["diagnose"]["commands"])
+        self.assertNotIn(NO_OPERATION, snapshot)
+
+    def test_stats_flag_prints_table(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            with patch("android_battery_optimizer.cli.BatteryOptimizerCLI.run_command", return_value=0):
+                stdout = io.StringIO()
+                stderr = io.StringIO()
+                with redirect_stdout(stdout), redirect_stderr(stderr):
+                    code = main(["status", "--stats", "--state-dir", state_dir])
+        self.assertEqual(code, 0)
+        self.assertIn("adb command stats", stderr.getvalue())
+        self.assertNotIn("adb command stats", stdout.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
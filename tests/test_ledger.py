@@ -0,0 +1,75 @@
+import unittest
+
+from android_battery_optimizer.ledger import (
+    KIND,
+    EntryKind,
+    appop_entry,
+    change_id,
+    device_config_entry,
+    entry_as_dict,
+    entry_from_mapping,
+    entry_target,
+    ledger_entry,
+    package_enabled_entry,
+    setting_entry,
+    standby_bucket_entry,
+)
+from android_battery_optimizer.recorder import StateRecorder
+from android_battery_optimizer.rollback import ROLLBACK_COMMANDS, rollback_command
+
+
+class TestLedgerEntry(unittest.TestCase):
+    def test_dict_layout_round_trips(self):
+        fields = {
+            "type": "appop", "package": "com.a", "op": "WAKE_LOCK", "user": 10,
+            "prior_value": "allow", "new_value": "ignore",
+        }
+        entry = entry_from_mapping(fields)
+        self.assertIs(entry[KIND], EntryKind.APPOP)
+        self.assertEqual(entry_as_dict(entry), fields)
+        self.assertEqual(ledger_entry(fields), entry)
+        self.assertIs(ledger_entry(entry), entry)
+        self.assertEqual(entry_target(entry), "10/com.a")
+        self.assertEqual(change_id(entry), "appop:10/com.a:WAKE_LOCK")
+
+    def test_owner_user_is_left_out_of_the_dict_layout(self):
+        entry = standby_bucket_entry("com.a", prior_value="10", new_value="rare")
+        self.assertEqual(
+            entry_as_dict(entry),
+            {"type": "standby_bucket", "package": "com.a", "prior_value": "10", "new_value": "rare"},
+        )
+
+    def test_rollback_command_of_a_converted_dict_entry(self):
+        fields = {"type": "setting", "namespace": "global", "key": "k", "prior_value": None}
+        self.assertEqual(rollback_command(ledger_entry(fields)), ["settings", "delete", "global", "k"])
+        fields["prior_value"] = "1"
+        self.assertEqual(rollback_command(ledger_entry(fields)), ["settings", "put", "global", "k", "1"])
+
+    def test_builders_match_the_dict_layout(self):
+        cases = [
+            (setting_entry("global", "k", None, "1"),
+             {"type": "setting", "namespace": "global", "key": "k", "new_value": "1"}),
+            (device_config_entry("ns", "k", "0"),
+             {"type": "device_config", "namespace": "ns", "key": "k", "prior_value": "0"}),
+            (appop_entry("com.a", "WAKE_LOCK", 10, "allow", "ignore"),
+             {"type": "appop", "package": "com.a", "op": "WAKE_LOCK", "user": 10,
+              "prior_value": "allow", "new_value": "ignore"}),
+            (standby_bucket_entry("com.a", prior_value="10"),
+             {"type": "standby_bucket", "package": "com.a", "prior_value": "10"}),
+            (package_enabled_entry("com.a", 10, True, False),
+             {"type": "package_enabled", "package": "com.a", "user": 10, "prior_value": True, "new_value": False}),
+        ]
+        for entry, fields in cases:
+            self.assertIs(type(entry), tuple)
+            self.assertEqual(entry_from_mapping(fields), entry)
+
+    def test_every_kind_has_handlers(self):
+        kinds = set(EntryKind)
+        self.assertEqual(set(ROLLBACK_COMMANDS), kinds)
+        self.assertEqual(set(StateRecorder._VERIFIERS), kinds)
+        self.assertEqual(set(StateRecorder._SNAPSHOT_REMOVERS), kinds)
+        self.assertEqual(set(StateRecorder._SNAPSHOT_WRITERS), kinds)
+
+
+if __name__ == "__main__":
+    unittest.main()
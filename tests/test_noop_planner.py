@@ -0,0 +1,64 @@
+import unittest
+
+from android_battery_optimizer.simulator import SimulatedDevice
+from batch_helpers import BatchRecordingRunner, device_state, make_app
+
+
+class TestNoopPlanner(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedDevice.generate(20, sdk=34)
+        self.before = device_state(self.device)
+        self.runner = BatchRecordingRunner([self.device])
+        self.output = []
+        self.app = make_app(self, self.runner, self.device.serial, output=self.output.append)
+
+    def test_rerun_on_an_optimized_device_sends_no_commands(self):
+        self.app.restrict_background_apps(level="ignore")
+        snapshots = self.app.store.data["packages"]
+        first_run = len(self.runner.scripts)
+        recorded = {key: dict(value, appops=dict(value["appops"])) for key, value in snapshots.items()}
+
+        self.app.restrict_background_apps(level="ignore")
+
+        self.assertEqual(len(self.runner.scripts), first_run)
+        self.assertTrue(self.app.recorder.skipped)
+        self.assertIn(f"Skipped {len(self.app.recorder.skipped)} changes the device already had.", self.output)
+        # The first run's snapshots still hold the original values.
+        self.assertEqual(self.app.store.data["packages"], recorded)
+
+        self.app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_values_already_at_target_are_not_snapshotted(self):
+        package = "com.example.app0001"
+        self.device.packages[package].appops["RUN_ANY_IN_BACKGROUND"] = "ignore"
+        self.before = device_state(self.device)
+
+        self.app.restrict_background_apps(level="ignore")
+
+        self.assertNotIn("RUN_ANY_IN_BACKGROUND", self.app.store.data["packages"].get(package, {}).get("appops", {}))
+        self.app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_change_queued_earlier_in_the_transaction_is_planned_against(self):
+        recorder = self.app.recorder
+        package = "com.example.app0001"
+        original = self.device.packages[package].appops.get("RUN_ANY_IN_BACKGROUND", "allow")
+        other = "ignore" if original != "ignore" else "allow"
+        # Verification checks each entry against its own new value, which the
+        # later entry overwrites.
+        recorder.verify = False
+
+        with recorder.transaction():
+            recorder.prefetch_package_states(["RUN_ANY_IN_BACKGROUND"])
+            recorder.set_appop(package, "RUN_ANY_IN_BACKGROUND", other)
+            recorder.set_appop(package, "RUN_ANY_IN_BACKGROUND", original)
+            recorder.set_appop(package, "RUN_ANY_IN_BACKGROUND", original)
+
+        self.assertEqual(len(recorder.skipped), 1)
+        self.assertEqual(len(self.runner.scripts[-1].splitlines()), 2)
+        self.assertEqual(self.device.packages[package].appops.get("RUN_ANY_IN_BACKGROUND", "allow"), original)
+
+
+if __name__ == "__main__":
+    unittest.main()
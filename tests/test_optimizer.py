@@ -1,9 +1,10 @@
+import io
 import json
 import subprocess
 import tempfile
 import unittest
 from pathlib import Path
-from unittest.mock import ANY, MagicMock, patch
+from unittest.mock import ANY, MagicMock, Mock, patch
 
 from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, SubprocessRunner
 from android_battery_optimizer.app import BatteryOptimizerApp
@@ -13,7 +14,40 @@ from android_battery_optimizer.state import StateStore
 from android_battery_optimizer.android import parse_adb_devices, resolve_package_choice
 
 
+_REAL_POPEN = subprocess.Popen
+
+
+class _PopenFromMockedRun:
+    """Serves SubprocessRunner.stream_lines from the test's mocked subprocess.run."""
+
+    def __init__(self, args, **kwargs):
+        completed = subprocess.run(args, capture_output=True, text=True, input=None, timeout=None)
+        self.returncode = completed.returncode
+        self.stdout = io.StringIO(completed.stdout)
+        self.stderr = io.StringIO(completed.stderr)
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+def _fake_popen(args, **kwargs):
+    if isinstance(subprocess.run, Mock):
+        return _PopenFromMockedRun(args, **kwargs)
+    return _REAL_POPEN(args, **kwargs)
+
+
 class OptimizerTests(unittest.TestCase):
+    def setUp(self):
+        popen = patch("android_battery_optimizer.adb.subprocess.Popen", side_effect=_fake_popen)
+        popen.start()
+        self.addCleanup(popen.stop)
+
     def make_app_and_cli(self, state_dir, user_inputs=None, verify=False, capture_output=False):
         outputs = []
         input_values = list(user_inputs or [])
@@ -0,0 +1,103 @@
+import re
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from android_battery_optimizer.cli import BatteryOptimizerCLI, parse_args
+from android_battery_optimizer.plan import Plan, apply_plan, compile_plan
+from android_battery_optimizer.simulator import SimulatedDevice
+from batch_helpers import BatchRecordingRunner, device_state, make_app
+
+
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedDevice.generate(20, sdk=34)
+        self.before = device_state(self.device)
+        self.runner = BatchRecordingRunner([self.device])
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.state_dir = Path(self.tmp.name)
+        self.app = make_app(self, self.runner, self.device.serial, state_dir=self.state_dir)
+
+    def compile_restrict(self):
+        return compile_plan(self.app, "restrict-apps", lambda: self.app.restrict_background_apps(level="ignore"))
+
+    def test_compiling_reads_the_device_without_changing_it(self):
+        plan = self.compile_restrict()
+
+        self.assertEqual(device_state(self.device), self.before)
+        self.assertEqual(self.runner.scripts, [])
+        self.assertFalse(self.app.store.has_entries())
+        self.assertFalse(self.app.client.dry_run)
+        self.assertTrue(plan.entries)
+        self.assertEqual(len(plan.commands), len(plan.entries))
+        self.assertEqual(plan.device["serial"], self.device.serial)
+        # One package prefetch, the batch and its readback.
+        self.assertEqual(plan.estimate.round_trips, 3)
+        self.assertGreater(plan.estimate.bytes, sum(len(command) for command in plan.commands))
+
+    def test_plan_round_trips_through_a_file(self):
+        plan = self.compile_restrict()
+        path = self.state_dir / "plan.json"
+        plan.save(path)
+
+        self.assertEqual(Plan.load(path), plan)
+
+    def test_applying_a_plan_sends_exactly_its_commands(self):
+        plan = self.compile_restrict()
+        apply_plan(self.app, plan)
+
+        [script] = self.runner.scripts
+        sent = [re.sub(r' && echo "SUCCESS_\d+" \|\| exit \$\?$', "", line) for line in script.splitlines()]
+        self.assertEqual(sent, plan.commands)
+        self.assertTrue(self.app.store.has_entries())
+
+        self.app.revert_saved_state()
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_plan_for_another_device_is_refused(self):
+        plan = self.compile_restrict()
+        plan.device["serial"] = "other-device"
+
+        with self.assertRaisesRegex(ValueError, "Plan device mismatch"):
+            apply_plan(self.app, plan)
+        self.assertEqual(device_state(self.device), self.before)
+
+    def test_plan_with_a_tampered_command_is_refused(self):
+        plan = self.compile_restrict()
+        plan.commands[0] = plan.commands[0].replace("ignore", "allow")
+
+        with self.assertRaisesRegex(ValueError, "Plan step 0 command does not match"):
+            apply_plan(self.app, plan)
+        self.assertEqual(self.runner.scripts, [])
+        self.assertEqual(device_state(self.device), self.before)
+        self.assertFalse(self.app.store.has_entries())
+
+    def test_invalid_plan_file_is_rejected(self):
+        path = self.state_dir / "plan.json"
+        path.write_text('{"version": 1, "operation": "restrict-apps", "device": {}, "steps": [{}]}')
+
+        with self.assertRaisesRegex(ValueError, "Invalid plan step"):
+            Plan.load(path)
+
+    @patch("android_battery_optimizer.cli.BatteryOptimizerCLI.check_environment", return_value=True)
+    def test_cli_plan_then_apply(self, _check_environment):
+        output = []
+        out = str(self.state_dir / "plans" / "{serial}.json")
+        cli = BatteryOptimizerCLI(self.app, output=output.append)
+
+        self.assertEqual(cli.run_command(parse_args(["plan", "restrict-apps", "--out", out])), 0)
+        path = self.state_dir / "plans" / f"{self.device.serial}.json"
+        self.assertTrue(path.exists())
+        self.assertEqual(device_state(self.device), self.before)
+        self.assertTrue(any(line.startswith("Plan for restrict-apps: ") for line in output))
+
+        self.assertEqual(cli.run_command(parse_args(["apply", "--plan", out])), 1)
+        self.assertEqual(cli.run_command(parse_args(["apply", "--plan", out, "--yes"])), 0)
+        self.assertNotEqual(device_state(self.device), self.before)
+        self.assertIn("Plan applied.", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
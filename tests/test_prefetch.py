@@ -0,0 +1,298 @@
+import tempfile
+import unittest
+import unittest.mock
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, CommandRunner
+from android_battery_optimizer.recorder import StateRecorder
+from android_battery_optimizer.simulator import SimulatedDevice, SimulatedDeviceRunner
+from android_battery_optimizer.snapshot import (
+    PrefetchCostModel,
+    SnapshotError,
+    parse_namespace_listing,
+    prefetch_package_states,
+    prefetch_packages,
+    prefetch_script,
+    prefetch_sections,
+    read_namespaces,
+    read_package_states,
+)
+from android_battery_optimizer.state import StateStore
+
+COMPOUND = " ".join(["adb", "-s", "S", "shell"] + prefetch_script())
+
+
+class FakeRunner(CommandRunner):
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        cmd = " ".join(args)
+        self.calls.append(cmd)
+        response = self.responses.get(cmd, CommandResult(0, "", ""))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class TestCompoundPrefetch(unittest.TestCase):
+    def prefetch(self, responses):
+        runner = FakeRunner(responses)
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        return runner, prefetch_package_states(client)
+
+    def test_single_round_trip_with_per_section_status(self):
+        stdout = (
+            "package:com.off\n"
+            "__ABO_PREFETCH__ disabled 0\n"
+            "package:com.on\n"
+            "__ABO_PREFETCH__ enabled 0\n"
+            "Can't find service: appops\n"
+            "__ABO_PREFETCH__ appops 255\n"
+            "  package=com.on u=0 bucket=10 reason=u-ua\n"
+            "  package=com.off u=0 bucket=40 reason=u-ua"
+            "__ABO_PREFETCH__ usagestats 0\n"
+        )
+        runner, result = self.prefetch({COMPOUND: CommandResult(0, stdout, "")})
+        enabled_ok, enabled, appops_ok, appops, bucket_ok, buckets = result
+
+        self.assertEqual(runner.calls, [COMPOUND])
+        self.assertTrue(enabled_ok)
+        self.assertEqual(enabled, {"com.off": False, "com.on": True})
+        self.assertFalse(appops_ok)
+        self.assertEqual(appops, {})
+        self.assertTrue(bucket_ok)
+        self.assertEqual(buckets, {"com.on": "10", "com.off": "40"})
+
+    def test_missing_markers_fall_back_to_separate_reads(self):
+        runner, result = self.prefetch({
+            COMPOUND: CommandResult(0, "/system/bin/sh: syntax error\n", ""),
+            "adb -s S shell pm list packages --user 0 -e": CommandResult(0, "package:a\n", ""),
+        })
+        enabled_ok, enabled, appops_ok, _, bucket_ok, _ = result
+        self.assertEqual(len(runner.calls), 5)
+        self.assertTrue(enabled_ok and appops_ok and bucket_ok)
+        self.assertEqual(enabled, {"a": True})
+
+    def test_timeout_keeps_completed_sections(self):
+        error = CommandError("Command timed out after 300s", CommandResult(-1, "", ""))
+
+        class TimeoutRunner(FakeRunner):
+            def stream_lines(self, args, timeout=None):
+                yield "package:x"
+                yield "__ABO_PREFETCH__ disabled 0"
+                yield "package:y"
+                yield "__ABO_PREFETCH__ enabled 0"
+                yield "Package com.y:"
+                raise error
+
+        client = AdbClient(TimeoutRunner(), serial="S", output=lambda _: None)
+        enabled_ok, enabled, appops_ok, _, bucket_ok, _ = prefetch_package_states(client)
+        self.assertTrue(enabled_ok)
+        self.assertEqual(enabled, {"x": False, "y": True})
+        self.assertFalse(appops_ok)
+        self.assertFalse(bucket_ok)
+
+
+class CallLog(SimulatedDeviceRunner):
+    def __init__(self, devices):
+        super().__init__(devices)
+        self.commands = []
+
+    def run(self, args, input_data=None, timeout=None):
+        self.commands.append(" ".join(args))
+        return super().run(args, input_data=input_data, timeout=timeout)
+
+
+class TestOpFilteredPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedDevice.generate(30, sdk=34)
+        # Give one package a recorded mode; the others have no entry for the op.
+        self.device.packages["com.example.app0001"].appops["RUN_ANY_IN_BACKGROUND"] = "ignore"
+        self.runner = CallLog([self.device])
+        self.client = AdbClient(self.runner, serial=self.device.serial, output=lambda _: None)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def recorder(self):
+        store = StateStore(Path(self.tmp.name), self.client)
+        return StateRecorder(self.client, store)
+
+    def test_only_declared_ops_are_read(self):
+        recorder = self.recorder()
+        with recorder.transaction():
+            recorder.prefetch_package_states(appops_ops=["RUN_ANY_IN_BACKGROUND"])
+            self.assertEqual(recorder._get_appop("com.example.app0001", "RUN_ANY_IN_BACKGROUND"), "ignore")
+            self.assertEqual(recorder._get_appop("com.example.app0002", "RUN_ANY_IN_BACKGROUND"), "default")
+
+        dumps = [cmd for cmd in self.runner.commands if "dumpsys appops" in cmd]
+        self.assertEqual(len(dumps), 1)
+        self.assertIn("dumpsys appops --op RUN_ANY_IN_BACKGROUND ;", dumps[0])
+        self.assertNotIn("dumpsys appops ;", dumps[0])
+
+    def test_undeclared_op_is_fetched_on_first_use(self):
+        recorder = self.recorder()
+        with recorder.transaction():
+            recorder.prefetch_package_states(appops_ops=())
+            self.assertEqual(recorder._get_appop("com.example.app0000", "WAKE_LOCK"), "allow")
+            recorder._get_appop("com.example.app0003", "WAKE_LOCK")
+        self.assertEqual(
+            [cmd for cmd in self.runner.commands if "dumpsys appops" in cmd],
+            [f"adb -s {self.device.serial} shell dumpsys appops --op WAKE_LOCK"],
+        )
+
+    def test_old_builds_read_the_full_dump(self):
+        sections = [name for name, _, _ in prefetch_sections(["RUN_ANY_IN_BACKGROUND"])]
+        self.assertEqual(sections, ["disabled", "enabled", "appops-RUN_ANY_IN_BACKGROUND", "usagestats"])
+
+        runner = FakeRunner()
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        prefetch_package_states(client, appops_ops=["RUN_ANY_IN_BACKGROUND"])
+        self.assertIn("adb -s S shell dumpsys appops", runner.calls)
+        self.assertFalse(any("--op" in cmd for cmd in runner.calls))
+
+    def test_missing_header_falls_back_to_full_dump(self):
+        spec = prefetch_sections(["RUN_ANY_IN_BACKGROUND"])
+        stdout = (
+            "__ABO_PREFETCH__ disabled 0\n"
+            "package:com.on\n__ABO_PREFETCH__ enabled 0\n"
+            "Unknown option: --op\n__ABO_PREFETCH__ appops-RUN_ANY_IN_BACKGROUND 0\n"
+            "__ABO_PREFETCH__ usagestats 0\n"
+        )
+        runner = FakeRunner({
+            " ".join(["adb", "-s", "S", "shell"] + prefetch_script(spec)): CommandResult(0, stdout, ""),
+            "adb -s S shell dumpsys appops": CommandResult(0, "  Uid u0a1:\n    Package com.on:\n      WAKE_LOCK (deny):\n", ""),
+        })
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        with unittest.mock.patch("android_battery_optimizer.snapshot.supports_appops_op_filter", return_value=True):
+            _, _, appops_ok, appops, _, _ = prefetch_package_states(client, appops_ops=["RUN_ANY_IN_BACKGROUND"])
+        self.assertTrue(appops_ok)
+        self.assertEqual(appops, {"com.on": {"WAKE_LOCK": "deny"}})
+
+
+class TestNamespaceSnapshot(unittest.TestCase):
+    def test_listing_keeps_equals_signs_and_multiline_values(self):
+        lines = [
+            "battery_saver_constants=vibration_disabled=true,gps_mode=0",
+            "lock_screen_owner_info=first line",
+            "second line",
+            "",
+            "low_power=1",
+        ]
+        self.assertEqual(parse_namespace_listing(lines), {
+            "battery_saver_constants": "vibration_disabled=true,gps_mode=0",
+            "lock_screen_owner_info": "first line\nsecond line",
+            "low_power": "1",
+        })
+
+    def test_namespaces_are_read_in_one_call(self):
+        command = (
+            "adb -s S shell settings list global ; echo __ABO_NAMESPACE__ settings:global $? ; "
+            "device_config list device_idle ; echo __ABO_NAMESPACE__ device_config:device_idle $?"
+        )
+        stdout = (
+            "low_power=0\n__ABO_NAMESPACE__ settings:global 0\n"
+            "Failed\n__ABO_NAMESPACE__ device_config:device_idle 1\n"
+        )
+        runner = FakeRunner({command: CommandResult(0, stdout, "")})
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+
+        listings = read_namespaces(client, [("settings", "global"), ("device_config", "device_idle")])
+        self.assertEqual(runner.calls, [command])
+        self.assertEqual(listings[("settings", "global")], {"low_power": "0"})
+        self.assertIsInstance(listings[("device_config", "device_idle")], SnapshotError)
+
+    def test_falls_back_to_one_read_per_namespace(self):
+        runner = FakeRunner({"adb -s S shell settings list system": CommandResult(0, "a=1\n", "")})
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        listings = read_namespaces(client, [("settings", "system"), ("settings", "secure")])
+        self.assertEqual(listings, {("settings", "system"): {"a": "1"}, ("settings", "secure"): {}})
+        self.assertEqual(len(runner.calls), 3)
+
+    def test_apply_experimental_lists_namespaces_once(self):
+        device = SimulatedDevice.generate(10, sdk=34)
+        runner = CallLog([device])
+        client = AdbClient(runner, serial=device.serial, output=lambda _: None)
+        with tempfile.TemporaryDirectory() as state_dir:
+            from android_battery_optimizer.app import BatteryOptimizerApp
+            app = BatteryOptimizerApp(client, Path(state_dir))
+            app.apply_experimental_optimizations()
+            app.apply_experimental_optimizations()
+        listing_calls = [
+            cmd for cmd in runner.commands
+            if "list" in cmd and ("settings" in cmd or "device_config" in cmd) and "__ABO_NAMESPACE__" in cmd
+        ]
+        self.assertEqual(len(listing_calls), 2)
+        self.assertEqual(device.settings["global"]["low_power"], "1")
+
+
+class TestTargetedPrefetch(unittest.TestCase):
+    def test_cost_model_switches_to_bulk_as_targets_grow(self):
+        usb = PrefetchCostModel(call_seconds=0.005)
+        wireless = PrefetchCostModel(call_seconds=0.1)
+        self.assertTrue(usb.prefers_targeted("appops", 2))
+        self.assertTrue(usb.prefers_targeted("appops", 500))
+        self.assertFalse(usb.prefers_targeted("appops", 5000))
+        self.assertTrue(wireless.prefers_targeted("enabled", 2))
+        self.assertFalse(wireless.prefers_targeted("enabled", 100))
+
+    def test_per_package_reads_match_exact_names(self):
+        runner = FakeRunner({
+            "adb -s S shell pm list packages --user 0 -d com.a": CommandResult(0, "package:com.a.extra\n", ""),
+            "adb -s S shell pm list packages --user 0 -e com.a": CommandResult(0, "package:com.a\npackage:com.a.extra\n", ""),
+            "adb -s S shell cmd appops get com.a": CommandResult(0, "WAKE_LOCK: deny; time=+1h ago\nCAMERA: allow\n", ""),
+            "adb -s S shell cmd appops get com.gone": CommandResult(255, "", "Error: Unknown package: com.gone\n"),
+            "adb -s S shell am get-standby-bucket com.a": CommandResult(0, "40\n", ""),
+        })
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        states = read_package_states(client, ["com.a", "com.gone"])
+        self.assertEqual(states["enabled"], {"com.a": True})
+        self.assertEqual(states["appops"], {"com.a": {"WAKE_LOCK": "deny", "CAMERA": "allow"}})
+        self.assertEqual(states["standby_bucket"], {"com.a": "40"})
+
+    def test_large_targets_use_the_bulk_dump(self):
+        runner = FakeRunner()
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        prefetch = prefetch_packages(
+            client, [f"com.app{i}" for i in range(400)], kinds=("enabled",),
+            cost_model=PrefetchCostModel(call_seconds=0.05),
+        )
+        self.assertEqual(prefetch.targeted, set())
+        self.assertIn("pm list packages --user 0 -d ;", runner.calls[0])
+        self.assertFalse(any("dumpsys" in cmd or "com.app" in cmd for cmd in runner.calls))
+
+    def test_samsung_profile_skips_the_package_dumps(self):
+        device = SimulatedDevice.generate(200, brand="samsung", sdk=34)
+        runner = CallLog([device])
+        client = AdbClient(runner, serial=device.serial, output=lambda _: None)
+        with tempfile.TemporaryDirectory() as state_dir:
+            from android_battery_optimizer.app import BatteryOptimizerApp
+            app = BatteryOptimizerApp(client, Path(state_dir))
+            app.apply_samsung_experimental_optimizations()
+        self.assertFalse(any("dumpsys" in cmd for cmd in runner.commands))
+        self.assertFalse(device.packages["com.samsung.android.game.gos"].enabled)
+
+    def test_untargeted_package_is_read_on_first_use(self):
+        device = SimulatedDevice.generate(30, sdk=34)
+        runner = CallLog([device])
+        client = AdbClient(runner, serial=device.serial, output=lambda _: None)
+        with tempfile.TemporaryDirectory() as state_dir:
+            recorder = StateRecorder(client, StateStore(Path(state_dir), client))
+            with recorder.transaction():
+                recorder.prefetch_packages(["com.example.app0001"], kinds=("standby_bucket",))
+                before = len(runner.commands)
+                recorder._get_standby_bucket("com.example.app0001")
+                self.assertEqual(len(runner.commands), before)
+                bucket = recorder._get_standby_bucket("com.example.app0002")
+        self.assertEqual(bucket, str(device.packages["com.example.app0002"].bucket))
+        self.assertIn(
+            f"adb -s {device.serial} shell am get-standby-bucket com.example.app0002", runner.commands
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -66,6 +66,41 @@ class TestRollbackCleanup(unittest.TestCase):
         self.assertIn("global/s1", self.store.data["settings"])
         self.assertIn("global/s2", self.store.data["settings"])
 
+    def test_revert_ledger_runs_one_script_and_persists_failed_steps(self):
+        for key in ("s1", "s2", "s3"):
+            self.store.data["settings"][f"global/{key}"] = {"namespace": "global", "key": key, "value": "0"}
+        self.store.save()
+
+        # Reverse order: s3 is step 0, s2 step 1, s1 step 2. Step 2 never reports.
+        def side_effect(args, **kwargs):
+            if kwargs.get("input_data"):
+                return CommandResult(returncode=0, stdout="ROLLBACK_OK_0\nROLLBACK_FAIL_1:255\n", stderr="")
+            return CommandResult(returncode=0, stdout="", stderr="")
+        self.mock_runner.run.side_effect = side_effect
+
+        self.recorder._ledger = [
+            {"type": "setting", "namespace": "global", "key": key, "prior_value": "0"}
+            for key in ("s1", "s2", "s3")
+        ]
+        self.recorder._revert_ledger()
+
+        scripts = [c for c in self.mock_runner.run.call_args_list if c.kwargs.get("input_data")]
+        self.assertEqual(len(scripts), 1)
+        self.assertEqual(
+            scripts[0].kwargs["input_data"].splitlines(),
+            [
+                "settings put global s3 0 && echo ROLLBACK_OK_0 || echo ROLLBACK_FAIL_0:$?",
+                "settings put global s2 0 && echo ROLLBACK_OK_1 || echo ROLLBACK_FAIL_1:$?",
+                "settings put global s1 0 && echo ROLLBACK_OK_2 || echo ROLLBACK_FAIL_2:$?",
+            ],
+        )
+        single = [
+            tuple(c.args[0]) for c in self.mock_runner.run.call_args_list
+            if not c.kwargs.get("input_data") and "settings" in c.args[0]
+        ]
+        self.assertEqual(single, [("adb", "-s", "test-device", "shell", "settings", "put", "global", "s1", "0")])
+        self.assertEqual(list(self.store.data["settings"]), ["global/s2"])
+
     def test_restore_partial_failure_saves_only_unresolved_entries(self):
         # Setup: state has two entries
         self.store.data["settings"]["global/s1"] = {"namespace": "global", "key": "s1", "value": "1"}
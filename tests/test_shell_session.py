@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+import unittest
+
+from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, CommandRunner
+from android_battery_optimizer.session import ShellSessionRunner, _PipeReader
+
+
+class RecordingDelegate(CommandRunner):
+    def __init__(self):
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        self.calls.append(list(args))
+        return CommandResult(0, "delegated\n", "")
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+class LocalShellSessionRunner(ShellSessionRunner):
+    # Stand in for `adb shell` with a local POSIX shell speaking the same stdin protocol.
+    def __init__(self, delegate=None):
+        super().__init__(delegate or RecordingDelegate())
+        self.spawned = []
+
+    def _spawn_args(self, prefix):
+        self.spawned.append(list(prefix))
+        return ["sh"]
+
+
+class TestShellSessionRunner(unittest.TestCase):
+    def setUp(self):
+        self.runner = LocalShellSessionRunner()
+        self.client = AdbClient(self.runner, serial="serial-1", output=lambda _: None)
+
+    def tearDown(self):
+        self.runner.close()
+
+    def test_commands_reuse_one_session_per_serial(self):
+        self.assertEqual(self.client.shell_text(["echo", "one"]), "one")
+        self.assertEqual(self.client.shell_text(["echo", "two"]), "two")
+        other = AdbClient(self.runner, serial="serial-2", output=lambda _: None)
+        self.assertEqual(other.shell_text(["echo", "three"]), "three")
+
+        self.assertEqual(
+            self.runner.spawned,
+            [["adb", "-s", "serial-1", "shell"], ["adb", "-s", "serial-2", "shell"]],
+        )
+
+    def test_result_matches_subprocess_shape(self):
+        result = self.client.shell(["printf", "'a\\nb'", ";", "echo", "oops", ">&2", ";", "exit", "3"], check=False)
+        self.assertEqual(result, CommandResult(returncode=3, stdout="a\nb", stderr="oops\n"))
+
+        # `exit` ran in a subshell, so the session is still usable.
+        self.assertEqual(self.client.shell_text(["echo", "alive"]), "alive")
+        self.assertEqual(len(self.runner.spawned), 1)
+
+    def test_nonzero_exit_raises_command_error_with_check(self):
+        with self.assertRaises(CommandError) as cm:
+            self.client.shell(["sh", "-c", "'echo denied >&2; exit 1'"])
+        self.assertIn("denied", str(cm.exception))
+        self.assertEqual(cm.exception.result.returncode, 1)
+
+    def test_input_data_is_fed_as_stdin(self):
+        script = 'echo first && echo "SUCCESS_0" || exit $?\nfalse && echo "SUCCESS_1" || exit $?'
+        result = self.client.shell([], check=False, input_data=script)
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stdout, "first\nSUCCESS_0\n")
+
+        result = self.client.shell(["cat"], input_data="line1\nline2")
+        self.assertEqual(result.stdout, "line1\nline2\n")
+
+    def test_commands_do_not_consume_session_stdin(self):
+        self.assertEqual(self.client.shell_text(["cat"]), "")
+        self.assertEqual(self.client.shell_text(["echo", "next"]), "next")
+
+    def test_timeout_kills_session_and_next_call_respawns(self):
+        with self.assertRaises(CommandError) as cm:
+            self.client.shell(["sleep", "5"], timeout=0.3)
+        self.assertIn("timed out after 0.3s", str(cm.exception))
+        self.assertEqual(cm.exception.result.returncode, -1)
+
+        self.assertEqual(self.client.shell_text(["echo", "again"]), "again")
+        self.assertEqual(len(self.runner.spawned), 2)
+
+    def test_non_shell_commands_go_to_delegate(self):
+        output = self.client.local_text(["adb", "devices"])
+        self.assertEqual(output, "delegated")
+        self.assertEqual(self.runner.delegate.calls, [["adb", "devices"]])
+        self.assertEqual(self.runner.which("adb"), "/usr/bin/adb")
+        self.assertEqual(self.runner.spawned, [])
+
+    def test_concurrent_callers_are_serialized_per_session(self):
+        results = []
+
+        def worker(index):
+            results.append(self.client.shell_text(["echo", f"w{index}"]))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), sorted(f"w{i}" for i in range(8)))
+        self.assertEqual(len(self.runner.spawned), 1)
+
+
+
+class ScanCountingBuffer(bytearray):
+    # Counts the bytes `find` has to look at.
+    scanned = 0
+
+    def find(self, sub, start=0, *args):
+        self.scanned += len(self) - start
+        return super().find(sub, start, *args)
+
+
+class TestPipeReader(unittest.TestCase):
+    def read_frame_from_chunks(self, chunks):
+        read_fd, write_fd = os.pipe()
+        stream = os.fdopen(read_fd, "rb")
+        self.addCleanup(stream.close)
+        reader = _PipeReader(stream)
+        reader._buffer = ScanCountingBuffer()
+
+        def write():
+            for chunk in chunks:
+                os.write(write_fd, chunk)
+                time.sleep(0.001)
+            os.close(write_fd)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        frame = reader.read_frame(b"__B", b"__E", time.monotonic() + 10)
+        writer.join()
+        return frame, reader._buffer.scanned
+
+    def test_markers_split_across_chunks(self):
+        chunks = [b"noise", b"__", b"B\nhel", b"lo\n_", b"_E:", b"0", b"\nnext"]
+        (payload, tail, found), _ = self.read_frame_from_chunks(chunks)
+        self.assertEqual((payload, tail, found), (b"hello", b":0", True))
+
+    def test_large_output_is_scanned_once(self):
+        chunks = [b"__B\n"] + [b"x" * 4095 + b"\n"] * 200 + [b"\n__E:0\n"]
+        (payload, _, found), scanned = self.read_frame_from_chunks(chunks)
+        self.assertTrue(found)
+        self.assertEqual(len(payload), 200 * 4096)
+        self.assertLess(scanned, 3 * len(payload))
+
+
+if __name__ == "__main__":
+    unittest.main()
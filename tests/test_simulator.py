@@ -0,0 +1,80 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient
+from android_battery_optimizer.app import BatteryOptimizerApp
+from android_battery_optimizer.instrument import InstrumentedRunner
+from android_battery_optimizer.simulator import SimulatedDevice, SimulatedDeviceRunner
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from benchmarks.simulated_device import SCENARIOS, run_scenario  # noqa: E402
+
+
+class TestSimulatedShell(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedDevice.generate(20)
+        self.runner = SimulatedDeviceRunner([self.device])
+
+    def shell(self, *args, script=None):
+        return self.runner.run(["adb", "-s", self.device.serial, "shell", *args], input_data=script)
+
+    def test_batch_script_semantics(self):
+        result = self.shell(script=(
+            "settings put global low_power 1 && echo \"SUCCESS_0\" || exit $?\n"
+            "cmd appops set com.example.app0000 WAKE_LOCK bogus && echo \"SUCCESS_1\" || exit $?\n"
+            "echo never\n"
+        ))
+        self.assertEqual(result.stdout, "SUCCESS_0\n")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertEqual(self.device.settings["global"]["low_power"], "1")
+
+    def test_settings_and_appops_round_trip(self):
+        self.shell("settings", "put", "secure", "new_key", "'a b'")
+        self.assertEqual(self.shell("settings", "get", "secure", "new_key").stdout, "a b\n")
+        self.assertEqual(self.shell("settings", "get", "secure", "missing").stdout, "null\n")
+
+        self.shell("cmd", "appops", "set", "com.example.app0000", "RUN_IN_BACKGROUND", "ignore")
+        output = self.shell("cmd", "appops", "get", "com.example.app0000").stdout
+        self.assertIn("RUN_IN_BACKGROUND: ignore", output)
+        self.assertIn("com.example.app0000", self.shell("pm", "list", "packages", "-3").stdout)
+
+    def test_unknown_device_and_command(self):
+        self.assertEqual(self.runner.run(["adb", "-s", "nope", "shell", "true"]).returncode, 1)
+        self.assertEqual(self.shell("busybox").returncode, 127)
+
+
+class TestSimulatedEndToEnd(unittest.TestCase):
+    def test_revert_restores_original_state(self):
+        device = SimulatedDevice.generate(50)
+        before_packages = device.package_state()
+        before_settings = {ns: dict(values) for ns, values in device.settings.items()}
+        with tempfile.TemporaryDirectory() as state_dir:
+            client = AdbClient(SimulatedDeviceRunner([device]), serial=device.serial, output=lambda _: None)
+            app = BatteryOptimizerApp(client, Path(state_dir))
+            app.restrict_background_apps(level="ignore")
+            app.apply_experimental_optimizations()
+            self.assertNotEqual(device.package_state(), before_packages)
+
+            app.revert_saved_state()
+        self.assertEqual(device.package_state(), before_packages)
+        self.assertEqual(device.settings, before_settings)
+
+    def test_benchmark_scenarios_report_metrics(self):
+        for name in SCENARIOS:
+            with self.subTest(scenario=name):
+                result = run_scenario(name, 30, latency=0.0, measure_memory=False)
+                self.assertGreater(result["adb_calls"], 0)
+                self.assertGreater(result["adb_bytes"], 0)
+                self.assertGreaterEqual(result["wall_seconds"], 0)
+
+    def test_instrumented_runner_counts_stdin_bytes(self):
+        device = SimulatedDevice.generate(10)
+        runner = InstrumentedRunner(SimulatedDeviceRunner([device]))
+        runner.run(["adb", "-s", device.serial, "shell"], input_data="echo hi\n")
+        self.assertEqual(runner.stats.total_bytes(), len("echo hi\n") + len("hi\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
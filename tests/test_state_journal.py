@@ -0,0 +1,110 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from android_battery_optimizer.adb import AdbClient
+from android_battery_optimizer.state import StateStore
+
+
+class StateJournalTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.state_dir = Path(self.tmp_dir.name)
+        self.device_dir = self.state_dir / "devices" / "serial-1"
+
+    def _make_store(self) -> StateStore:
+        client = AdbClient(runner=MagicMock(), output=lambda _: None)
+        client.serial = "serial-1"
+        store = StateStore(self.state_dir, client)
+        store.data["device"] = {"serial": "serial-1"}
+        return store
+
+    def _put(self, store: StateStore, key: str, value: str) -> None:
+        store.data["settings"][f"global/{key}"] = {"namespace": "global", "key": key, "value": value}
+        store.save_change("settings", f"global/{key}")
+
+    def test_changes_are_appended_and_replayed_on_load(self):
+        store = self._make_store()
+        self._put(store, "s0", "0")
+        snapshot = (self.device_dir / "state.json").read_text()
+
+        for index in range(1, 4):
+            self._put(store, f"s{index}", str(index))
+        store.data["settings"].pop("global/s1")
+        store.save_change("settings", "global/s1")
+
+        self.assertEqual((self.device_dir / "state.json").read_text(), snapshot)
+        self.assertEqual(len((self.device_dir / "state.journal").read_text().splitlines()), 4)
+        self.assertEqual(self._make_store().data["settings"], store.data["settings"])
+
+    def test_journal_is_compacted_into_the_snapshot(self):
+        store = self._make_store()
+        store.COMPACT_AFTER = 2
+        for index in range(4):
+            self._put(store, f"s{index}", str(index))
+
+        # s0 writes the snapshot, s1-s2 are journaled, s3 compacts.
+        self.assertFalse((self.device_dir / "state.journal").exists())
+        saved = json.loads((self.device_dir / "state.json").read_text())
+        self.assertEqual(len(saved["settings"]), 4)
+
+    def test_torn_last_record_is_ignored(self):
+        store = self._make_store()
+        self._put(store, "s0", "0")
+        self._put(store, "s1", "1")
+        with (self.device_dir / "state.journal").open("a", encoding="utf-8") as handle:
+            handle.write('{"section": "settings", "key": "global/s2", "val')
+
+        loaded = self._make_store()
+        self.assertEqual(sorted(loaded.data["settings"]), ["global/s0", "global/s1"])
+
+    def test_append_after_a_torn_record_keeps_the_journal_readable(self):
+        store = self._make_store()
+        self._put(store, "s0", "0")
+        self._put(store, "s1", "1")
+        with (self.device_dir / "state.journal").open("a", encoding="utf-8") as handle:
+            handle.write('{"section": "settings", "key": "global/s2", "val')
+
+        loaded = self._make_store()
+        self._put(loaded, "s3", "3")
+
+        reloaded = self._make_store()
+        self.assertEqual(sorted(reloaded.data["settings"]), ["global/s0", "global/s1", "global/s3"])
+        self.assertEqual(list(self.device_dir.glob("*.corrupt.*")), [])
+
+    def test_corrupt_journal_is_quarantined_with_the_snapshot(self):
+        store = self._make_store()
+        self._put(store, "s0", "0")
+        self._put(store, "s1", "1")
+        journal = self.device_dir / "state.journal"
+        journal.write_text("not json\n" + journal.read_text())
+
+        loaded = self._make_store()
+        self.assertFalse(loaded.has_entries())
+        self.assertEqual(len(list(self.device_dir.glob("state.json.corrupt.*"))), 1)
+        self.assertEqual(len(list(self.device_dir.glob("state.journal.corrupt.*"))), 1)
+
+    def test_clear_removes_the_journal(self):
+        store = self._make_store()
+        self._put(store, "s0", "0")
+        self._put(store, "s1", "1")
+        store.clear()
+        self.assertEqual(list(self.device_dir.iterdir()), [])
+
+    def test_journal_without_a_snapshot_file_is_not_replayed(self):
+        store = self._make_store()
+        self._put(store, "s0", "0")
+        self._put(store, "s1", "1")
+        # What a clear() interrupted after removing state.json would leave.
+        (self.device_dir / "state.json").unlink()
+
+        loaded = self._make_store()
+        self.assertFalse(loaded.has_entries())
+        self.assertFalse((self.device_dir / "state.journal").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
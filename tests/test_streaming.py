@@ -0,0 +1,123 @@
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient, CommandError, CommandResult, CommandRunner, SubprocessRunner
+from android_battery_optimizer.app import BatteryOptimizerApp
+from android_battery_optimizer.cli import BatteryOptimizerCLI
+from android_battery_optimizer.diagnose import Diagnoser
+from android_battery_optimizer.instrument import NO_OPERATION, InstrumentedRunner
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+class FakeRunner(CommandRunner):
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.calls = []
+
+    def run(self, args, input_data=None, timeout=None):
+        cmd = " ".join(args)
+        self.calls.append(cmd)
+        response = self.responses.get(cmd, CommandResult(0, "", ""))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+
+def drain(stream):
+    lines = []
+    while True:
+        try:
+            lines.append(next(stream))
+        except StopIteration as stop:
+            return lines, stop.value
+
+
+class TestSubprocessStreaming(unittest.TestCase):
+    def test_yields_lines_and_returns_result(self):
+        code = "import sys; print('a'); print('b\\r'); sys.stderr.write('warn'); sys.exit(3)"
+        lines, result = drain(SubprocessRunner().stream_lines(python_command(code), timeout=10))
+        self.assertEqual(lines, ["a", "b"])
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stderr, "warn")
+        self.assertEqual(result.stdout, "")
+
+    def test_lines_arrive_before_the_command_exits(self):
+        code = "import sys, time; print('first', flush=True); time.sleep(5); print('late')"
+        stream = SubprocessRunner().stream_lines(python_command(code), timeout=10)
+        started = time.perf_counter()
+        self.assertEqual(next(stream), "first")
+        # Closing cancels the command instead of waiting for it.
+        stream.close()
+        self.assertLess(time.perf_counter() - started, 3)
+
+    def test_timeout_kills_the_command(self):
+        code = "import time; print('x', flush=True); time.sleep(5)"
+        stream = SubprocessRunner().stream_lines(python_command(code), timeout=0.3)
+        with self.assertRaises(CommandError) as cm:
+            drain(stream)
+        self.assertIn("timed out", str(cm.exception))
+        self.assertEqual(cm.exception.result.returncode, -1)
+
+
+class TestClientStreaming(unittest.TestCase):
+    def test_check_raises_after_the_last_line(self):
+        runner = FakeRunner({"adb -s S shell dumpsys alarm": CommandResult(1, "one\ntwo\n", "boom")})
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+
+        stream = client.stream_lines(["dumpsys", "alarm"])
+        self.assertEqual([next(stream), next(stream)], ["one", "two"])
+        with self.assertRaises(CommandError):
+            next(stream)
+        self.assertEqual(list(client.stream_lines(["dumpsys", "alarm"], check=False)), ["one", "two"])
+
+    def test_instrumented_stream_is_recorded(self):
+        runner = InstrumentedRunner(FakeRunner({"adb -s S shell dumpsys usagestats": CommandResult(0, "ab\ncd\n", "")}))
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        self.assertEqual(list(client.stream_lines(["dumpsys", "usagestats"])), ["ab", "cd"])
+        stats = runner.stats.snapshot()[NO_OPERATION]["commands"]["dumpsys usagestats"]
+        self.assertEqual(stats["count"], 1)
+        self.assertEqual(stats["stdout_bytes"], 6)
+
+
+class TestStreamingConsumers(unittest.TestCase):
+    def test_diagnoser_scans_match_package_boundaries(self):
+        runner = FakeRunner({
+            "adb -s S shell pm list packages -3": CommandResult(0, "package:com.foo\npackage:com.bar\n", ""),
+            "adb -s S shell dumpsys alarm": CommandResult(0, "com.foobar\nuid:com.bar,\n", ""),
+            "adb -s S shell dumpsys usagestats": CommandResult(
+                0, 'package=com.foo.x lastTimeUsed="1"\npackage=com.foo lastTimeUsed="42"\n', ""
+            ),
+        })
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        report = Diagnoser(client).run()
+        signals = {item["package"]: item["signals"] for item in report["packages"]}
+
+        self.assertFalse(signals["com.foo"]["alarms_seen"])
+        self.assertTrue(signals["com.bar"]["alarms_seen"])
+        self.assertIsNone(signals["com.foo"]["jobs_seen"])
+        self.assertEqual(signals["com.foo"]["last_used"]["epoch_ms"], 42)
+        self.assertFalse(signals["com.bar"]["last_used"]["parsed"])
+
+    def test_check_battery_prints_summary_section(self):
+        dump = "Header:\n  Estimated power use (mAh):\n    Capacity: 4000\n    Screen: 12 mAh\nOther section\n  x: 1\n"
+        runner = FakeRunner({"adb -s S shell dumpsys batterystats --charged": CommandResult(0, dump, "")})
+        client = AdbClient(runner, serial="S", output=lambda _: None)
+        outputs = []
+        with tempfile.TemporaryDirectory() as state_dir:
+            cli = BatteryOptimizerCLI(BatteryOptimizerApp(client, Path(state_dir)), output=outputs.append)
+            cli.check_battery()
+        self.assertIn("Screen: 12 mAh", outputs)
+        self.assertNotIn("x: 1", outputs)
+
+
+if __name__ == "__main__":
+    unittest.main()
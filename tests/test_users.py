@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from android_battery_optimizer.adb import AdbClient
+from android_battery_optimizer.app import BatteryOptimizerApp
+from android_battery_optimizer.simulator import SimulatedDevice, SimulatedDeviceRunner
+from android_battery_optimizer.snapshot import parse_usagestats_buckets
+from android_battery_optimizer.users import (
+    package_key,
+    parse_user_list,
+    parse_users_option,
+    resolve_users,
+    split_package_key,
+)
+
+
+class RecordingRunner(SimulatedDeviceRunner):
+    def __init__(self, devices):
+        super().__init__(devices)
+        self.commands = []
+
+    def run(self, args, input_data=None, timeout=None):
+        self.commands.append(" ".join(args))
+        return super().run(args, input_data=input_data, timeout=timeout)
+
+
+class TestUserParsing(unittest.TestCase):
+    def test_pm_list_users(self):
+        output = "Users:\n\tUserInfo{0:Owner:c13} running\n\tUserInfo{10:Work profile:1030} running\n"
+        self.assertEqual(parse_user_list(output), [0, 10])
+
+    def test_users_option(self):
+        self.assertIsNone(parse_users_option("all"))
+        self.assertEqual(parse_users_option("0,10,10"), [0, 10])
+        for value in ("", "work", "-1"):
+            with self.assertRaises(ValueError):
+                parse_users_option(value)
+
+    def test_package_keys(self):
+        self.assertEqual(package_key("com.a"), "com.a")
+        self.assertEqual(package_key("com.a", 10), "10/com.a")
+        self.assertEqual(split_package_key("10/com.a"), (10, "com.a"))
+        self.assertEqual(split_package_key("com.a"), (0, "com.a"))
+
+    def test_usagestats_buckets_are_kept_per_user(self):
+        lines = [
+            "    package=com.a u=0 bucket=10 reason=d-u",
+            "    package=com.a u=10 bucket=40 reason=d-u",
+        ]
+        self.assertEqual(parse_usagestats_buckets(lines), {"com.a": "10", "10/com.a": "40"})
+
+
+class TestMultiUserRestrict(unittest.TestCase):
+    def setUp(self):
+        self.device = SimulatedDevice.generate(20, sdk=34)
+        self.profile = self.device.add_profile(10)
+        self.runner = RecordingRunner([self.device])
+        self.client = AdbClient(self.runner, serial=self.device.serial, output=lambda _: None)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.app = BatteryOptimizerApp(self.client, Path(self.tmp.name))
+
+    def test_unknown_user_is_rejected(self):
+        self.assertEqual(resolve_users(self.client, "all"), [0, 10])
+        with self.assertRaises(ValueError):
+            resolve_users(self.client, "0,11")
+
+    def test_restricts_every_user_and_restores_exactly(self):
+        before = {user: self.device.packages_of(user) for user in (0, 10)}
+        before_state = {
+            user: {name: (pkg.bucket, dict(pkg.appops)) for name, pkg in packages.items()}
+            for user, packages in before.items()
+        }
+        self.app.save_whitelist(["com.example.app0002"])
+
+        skipped = self.app.restrict_background_apps(level="ignore", users=[0, 10])
+
+        self.assertEqual(skipped, ["com.example.app0002", "10/com.example.app0002"])
+        for packages in (self.device.packages, self.profile):
+            self.assertEqual(packages["com.example.app0001"].appops["RUN_ANY_IN_BACKGROUND"], "ignore")
+            self.assertEqual(packages["com.example.app0001"].bucket, 40)
+            self.assertNotIn("RUN_ANY_IN_BACKGROUND", packages["com.example.app0002"].appops)
+        self.assertIn("10/com.example.app0001", self.app.store.data["packages"])
+        self.assertIn("com.example.app0001", self.app.store.data["packages"])
+
+        prefetches = [cmd for cmd in self.runner.commands if "dumpsys usagestats" in cmd]
+        self.assertEqual(len(prefetches), 1)
+        self.assertIn("pm list packages --user 10 -d", prefetches[0])
+        mutations = [cmd for cmd in self.runner.commands if cmd.endswith(" shell")]
+        self.assertEqual(len(mutations), 1)
+
+        self.app.revert_saved_state()
+        after_state = {
+            user: {name: (pkg.bucket, dict(pkg.appops)) for name, pkg in packages.items()}
+            for user, packages in ((0, self.device.packages), (10, self.profile))
+        }
+        self.assertEqual(after_state, before_state)
+        self.assertFalse(self.app.store.has_entries())
+
+
+if __name__ == "__main__":
+    unittest.main()